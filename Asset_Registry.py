@@ -0,0 +1,128 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import threading
+from typing import Awaitable, Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+
+def file_sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class AssetRegistry:
+    """
+    本地图片 -> KOOK 资源链接 的持久化登记表
+
+    每个文件按内容 SHA-256 只上传一次，链接写入 JSON 表，重启后直接复用；
+    文件的 mtime/大小未变化时连哈希也不重新计算，文件内容变化后才会再次上传
+    """
+
+    VERSION = 1
+
+    def __init__(self, upload: Callable[[str], Awaitable[str]], table_path: str):
+        """
+        参数:
+            upload: 上传本地文件并返回资源链接（bot.client.create_asset）
+            table_path (str): 登记表 JSON 文件路径
+        """
+        self._upload = upload
+        self.table_path = table_path
+        self._files = {}  # type: Dict[str, dict]  # 文件路径 -> {mtime, size, sha256}
+        self._urls = {}  # type: Dict[str, str]  # sha256 -> 资源链接
+        self._inflight = {}  # type: Dict[str, asyncio.Future]  # 正在上传的 sha256，避免并发重复上传
+        self._lock = threading.Lock()
+        self._save_lock = threading.Lock()  # 多个上传同时完成时串行写盘
+        self.uploads = 0
+        self.hits = 0
+        self._load()
+
+    def _load(self):
+        if not os.path.exists(self.table_path):
+            return
+        try:
+            with open(self.table_path, 'r', encoding='utf-8') as f:
+                table = json.load(f)
+            if table.get('version') == self.VERSION:
+                self._files = table.get('files', {})
+                self._urls = table.get('urls', {})
+            logger.info(f"[资源登记] 已加载 {len(self._urls)} 条资源链接")
+        except (OSError, ValueError) as e:
+            logger.error(f"[资源登记] 登记表读取失败，将重新建立: {e}")
+
+    def _save(self):
+        """先写临时文件再替换，避免写入中途退出导致表损坏"""
+        with self._lock:
+            table = {'version': self.VERSION, 'files': dict(self._files), 'urls': dict(self._urls)}
+        tmp_path = self.table_path + '.tmp'
+        with self._save_lock:
+            try:
+                os.makedirs(os.path.dirname(self.table_path) or '.', exist_ok=True)
+                with open(tmp_path, 'w', encoding='utf-8') as f:
+                    json.dump(table, f, ensure_ascii=False)
+                os.replace(tmp_path, self.table_path)
+            except OSError as e:
+                logger.error(f"[资源登记] 登记表保存失败: {e}")
+
+    def _digest(self, path: str) -> str:
+        """按 mtime/大小 复用已计算的哈希，文件变化时重新计算"""
+        stat = os.stat(path)
+        known = self._files.get(path)
+        if known and known['mtime'] == stat.st_mtime and known['size'] == stat.st_size:
+            return known['sha256']
+        digest = file_sha256(path)
+        with self._lock:
+            self._files[path] = {'mtime': stat.st_mtime, 'size': stat.st_size, 'sha256': digest}
+        return digest
+
+    def cached_url(self, path: str) -> Optional[str]:
+        """仅查表不上传；文件未登记或内容已变化时返回 None"""
+        try:
+            return self._urls.get(self._digest(path))
+        except OSError:
+            return None
+
+    async def get_url(self, path: str) -> str:
+        """返回文件对应的资源链接，未上传过的内容先上传"""
+        loop = asyncio.get_running_loop()
+        digest = await loop.run_in_executor(None, self._digest, path)
+        url = self._urls.get(digest)
+        if url:
+            self.hits += 1
+            return url
+
+        pending = self._inflight.get(digest)
+        if pending is not None:
+            return await asyncio.shield(pending)
+        pending = loop.create_future()
+        self._inflight[digest] = pending
+        try:
+            url = await self._upload(path)
+            if not url:
+                raise ValueError(f"上传未返回链接: {path}")
+            with self._lock:
+                self._urls[digest] = url
+            self.uploads += 1
+            logger.info(f"[资源登记] 已上传 {os.path.basename(path)}")
+            pending.set_result(url)
+        except asyncio.CancelledError:
+            pending.cancel()
+            raise
+        except Exception as e:
+            pending.set_exception(e)
+            pending.exception()  # 标记异常已读取，避免无人等待时告警
+            raise
+        finally:
+            self._inflight.pop(digest, None)
+        await loop.run_in_executor(None, self._save)
+        return url
+
+    def stats(self) -> dict:
+        return {'assets': len(self._urls), 'uploads': self.uploads, 'hits': self.hits}
@@ -0,0 +1,195 @@
+import asyncio
+import itertools
+import logging
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+from Log_Setup import command_var
+from Music_Cache import LRUCache
+
+logger = logging.getLogger(__name__)
+
+ReplyFunc = Callable[[Any, str], Awaitable[Any]]
+
+
+class Param(NamedTuple):
+    """
+    指令参数
+
+    参数按空格依次切分，最后一个参数取剩余的全部文本（可包含空格）
+    """
+    name: str
+    type: Callable[[str], Any] = str
+    required: bool = True
+    error: Optional[str] = None  # 类型转换失败时的提示，None 时回复用法
+
+
+class Command:
+    """一条指令的声明与运行状态"""
+
+    def __init__(self, name: str, handler: Callable[..., Awaitable[Any]], aliases: Iterable[str] = (),
+                 params: Tuple[Param, ...] = (), usage: Optional[str] = None,
+                 max_concurrency: Optional[int] = None, cooldown: float = 0.0,
+                 timeout: Optional[float] = 60.0, history: int = 200):
+        """
+        参数:
+            handler: 处理函数，调用方式为 handler(msg, *参数)
+            aliases: 指令别名
+            params: 参数定义
+            usage (str): 参数缺失或格式错误时回复的用法说明
+            max_concurrency (int): 同时处理的最大数量，None 表示不限制
+            cooldown (float): 同一用户两次调用的最小间隔（秒）
+            timeout (float): 单次处理的超时时间（秒），None 表示不限制（如持续播放的指令）
+        """
+        self.name = name
+        self.handler = handler
+        self.aliases = tuple(aliases)
+        self.params = params
+        self.usage = usage
+        self.max_concurrency = max_concurrency
+        self.cooldown = cooldown
+        self.timeout = timeout
+        self.running = 0
+        # 冷却中的用户；有界并按 cooldown 过期，内存不随用户数增长
+        self.cooling = LRUCache(max_size=1024, ttl=cooldown, name=f"cooldown:{name}") if cooldown > 0 else None
+        self.latencies = deque(maxlen=history)  # type: Deque[float]  # 最近调用耗时（秒）
+        self.calls = 0
+        self.busy = 0
+        self.throttled = 0
+        self.timeouts = 0
+        self.errors = 0
+
+    def parse(self, args: str) -> List[Any]:
+        """按参数定义切分并转换参数，缺少必填参数或转换失败时抛出 ValueError"""
+        if not self.params:
+            return []
+        args = args.strip()
+        parts = args.split(' ', len(self.params) - 1) if args else []
+        values = []
+        for index, param in enumerate(self.params):
+            if index >= len(parts) or not parts[index]:
+                if param.required:
+                    raise ValueError(self.usage or f"缺少参数 {param.name}")
+                values.append('')
+                continue
+            try:
+                values.append(param.type(parts[index]))
+            except ValueError:
+                raise ValueError(param.error or self.usage or f"参数 {param.name} 格式错误")
+        return values
+
+    def stats(self) -> dict:
+        latencies = sorted(self.latencies)
+        return {
+            'calls': self.calls,
+            'running': self.running,
+            'busy': self.busy,
+            'throttled': self.throttled,
+            'timeouts': self.timeouts,
+            'errors': self.errors,
+            'p50_ms': round(latencies[len(latencies) // 2] * 1000, 1) if latencies else 0.0,
+            'p95_ms': round(latencies[int(len(latencies) * 0.95)] * 1000, 1) if latencies else 0.0,
+            'max_ms': round(latencies[-1] * 1000, 1) if latencies else 0.0,
+        }
+
+
+class CommandRouter:
+    """
+    声明式指令表
+
+    指令名与别名统一登记在一个字典中，分发只需一次查找；
+    超出并发上限或处于冷却中的调用在解析参数前即被拒绝并回复提示，不会排队堆积
+    """
+
+    def __init__(self, reply: ReplyFunc, prefix: str = '/'):
+        """
+        参数:
+            reply: 回复消息 reply(msg, text)
+            prefix (str): 指令前缀
+        """
+        self._reply = reply
+        self.prefix = prefix
+        self.commands = {}  # type: Dict[str, Command]  # 指令名/别名 -> 指令
+        self.in_flight = {}  # type: Dict[int, Tuple[str, float]]  # 调用序号 -> (指令名, 开始时刻)
+        # 每次调用完成时回调 observer(指令名, 耗时秒数, 结果 ok/timeout/error)，用于导出指标
+        self.observer = None  # type: Optional[Callable[[str, float, str], None]]
+        self._call_ids = itertools.count()
+
+    def add(self, name: str, handler: Callable[..., Awaitable[Any]], **options) -> Command:
+        command = Command(name, handler, **options)
+        for key in (name,) + command.aliases:
+            key = key.lower()
+            if key in self.commands:
+                raise ValueError(f"指令 {key} 重复登记")
+            self.commands[key] = command
+        return command
+
+    def parse(self, content: str) -> Tuple[Optional[Command], str]:
+        """拆出指令名与参数文本，返回 (指令, 参数文本)；未登记的指令返回 None"""
+        parts = content[len(self.prefix):].split(' ', 1)
+        return self.commands.get(parts[0].lower()), parts[1] if len(parts) > 1 else ''
+
+    async def dispatch(self, msg, content: str) -> bool:
+        """处理一条指令消息，返回是否为已登记的指令"""
+        command, args = self.parse(content)
+        if command is None:
+            return False
+
+        if command.cooling is not None and msg.author.id in command.cooling:
+            command.throttled += 1
+            await self._reply(msg, f"⏳ /{command.name} 使用过于频繁，请稍后再试")
+            return True
+        if command.max_concurrency is not None and command.running >= command.max_concurrency:
+            command.busy += 1
+            await self._reply(msg, f"⏳ /{command.name} 当前请求较多，请稍后再试")
+            return True
+        try:
+            values = command.parse(args)
+        except ValueError as e:
+            await self._reply(msg, str(e))
+            return True
+        if command.cooling is not None:
+            command.cooling.set(msg.author.id, True)
+
+        command.running += 1
+        command.calls += 1
+        started = time.monotonic()
+        call_id = next(self._call_ids)
+        self.in_flight[call_id] = (command.name, started)
+        context_token = command_var.set(command.name)  # 处理期间的日志带上指令名
+        outcome = 'ok'
+        try:
+            if command.timeout is None:
+                await command.handler(msg, *values)
+            else:
+                await asyncio.wait_for(command.handler(msg, *values), timeout=command.timeout)
+        except asyncio.TimeoutError:
+            outcome = 'timeout'
+            command.timeouts += 1
+            logger.warning(f"[指令] /{command.name} 处理超时（{command.timeout}s）")
+            await self._reply(msg, f"❌ /{command.name} 处理超时，请稍后再试")
+        except Exception as e:
+            outcome = 'error'
+            command.errors += 1
+            logger.exception(f"[指令] /{command.name} 处理异常: {e}")
+        finally:
+            command_var.reset(context_token)
+            del self.in_flight[call_id]
+            command.running -= 1
+            elapsed = time.monotonic() - started
+            command.latencies.append(elapsed)
+            if self.observer is not None:
+                self.observer(command.name, elapsed, outcome)
+        return True
+
+    def describe_running(self) -> str:
+        """进行中的指令及已运行时间，供循环监测线程在卡顿时读取"""
+        now = time.monotonic()
+        return ', '.join(f"/{name}({now - started:.1f}s)" for name, started in list(self.in_flight.values()))
+
+    def stats(self) -> Dict[str, dict]:
+        """按指令名汇总调用统计（只统计被调用过的指令）"""
+        unique = {command.name: command for command in self.commands.values()}
+        return {name: command.stats() for name, command in unique.items() if command.calls or command.busy
+                or command.throttled}
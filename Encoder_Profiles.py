@@ -0,0 +1,164 @@
+import json
+import logging
+import math
+import os
+import re
+import subprocess
+from typing import Dict, List, NamedTuple, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class EncoderProfile(NamedTuple):
+    """libopus 编码档位"""
+    name: str
+    label: str
+    bitrate: str
+    compression_level: int  # 0(最快) ~ 10(最慢、音质最好)
+    frame_duration: int  # 帧长(ms)，帧越长每秒编码/发包次数越少
+    vbr: str = 'on'
+
+    def ffmpeg_args(self) -> List[str]:
+        return [
+            '-acodec', 'libopus',
+            '-vbr', self.vbr,
+            '-b:a', self.bitrate,
+            '-compression_level', str(self.compression_level),
+            '-frame_duration', str(self.frame_duration),
+            '-application', 'audio',
+            '-threads', '1',  # 单路音频编码无需多线程，避免线程调度开销
+            '-ac', '2',
+            '-ar', '48000',
+        ]
+
+
+PROFILES = {
+    'low_cpu': EncoderProfile('low_cpu', '低CPU', '40k', 0, 40),
+    'balanced': EncoderProfile('balanced', '均衡', '50k', 5, 20),
+    'quality': EncoderProfile('quality', '高音质', '64k', 10, 20),
+}
+
+
+def prime_host_load():
+    """
+    psutil.cpu_percent(interval=None) 返回的是距上次调用以来的占用率，首次调用恒为 0.0；
+    启动时先调用一次建立基准，之后档位选择读到的才是真实负载
+    """
+    try:
+        import psutil
+        psutil.cpu_percent(interval=None)
+    except ImportError:
+        pass
+
+
+def get_host_load() -> Optional[float]:
+    """返回主机 CPU 负载（0~1），无法获取时返回 None"""
+    try:
+        import psutil  # 可选依赖，Windows 下获取负载需要
+        return psutil.cpu_percent(interval=None) / 100
+    except ImportError:
+        pass
+    if hasattr(os, 'getloadavg'):
+        return os.getloadavg()[0] / (os.cpu_count() or 1)
+    return None
+
+
+class EncoderProfileManager:
+    """
+    编码档位选择
+
+    服务器可通过 /profile 固定档位；未设置的服务器使用默认档位，
+    主机负载超过阈值时自动降为 low_cpu，以便同一台机器承载更多并发推流
+    """
+
+    def __init__(self, config_path: str, default: str = 'balanced', high_load: float = 0.85):
+        self.config_path = config_path
+        self.default = default
+        self.high_load = high_load
+        self.guild_profiles = {}  # type: Dict[str, str]
+        if os.path.exists(config_path):
+            try:
+                with open(config_path, 'r', encoding='utf-8') as f:
+                    self.guild_profiles = {
+                        guild_id: name for guild_id, name in json.load(f).items() if name in PROFILES
+                    }
+            except (OSError, ValueError) as e:
+                logger.error(f"[编码档位] 配置读取失败: {e}")
+        prime_host_load()
+
+    def _save(self):
+        """先写临时文件再替换，避免写入中途退出导致配置损坏"""
+        tmp_path = self.config_path + '.tmp'
+        try:
+            os.makedirs(os.path.dirname(self.config_path) or '.', exist_ok=True)
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(self.guild_profiles, f, ensure_ascii=False)
+            os.replace(tmp_path, self.config_path)
+        except OSError as e:
+            logger.error(f"[编码档位] 配置保存失败: {e}")
+
+    def set_guild_profile(self, guild_id: str, name: Optional[str]):
+        """设置服务器档位，name 为 None 时恢复自动选择"""
+        if name is None:
+            self.guild_profiles.pop(guild_id, None)
+        else:
+            self.guild_profiles[guild_id] = name
+        self._save()
+
+    def select(self, guild_id: str) -> EncoderProfile:
+        name = self.guild_profiles.get(guild_id)
+        if name:
+            return PROFILES[name]
+        load = get_host_load()
+        if load is not None and load >= self.high_load:
+            logger.info(f"[编码档位] 主机负载 {load:.0%}，自动使用 low_cpu 档位")
+            return PROFILES['low_cpu']
+        return PROFILES[self.default]
+
+
+# ---------------------- 容量评估 ----------------------
+_BENCH_RE = re.compile(r'bench:\s+utime=([\d.]+)s\s+stime=([\d.]+)s\s+rtime=([\d.]+)s')
+
+
+def measure_encoder_cpu(profile: EncoderProfile, seconds: int = 20, ffmpeg: str = 'ffmpeg') -> float:
+    """
+    以最快速度编码一段合成音频，返回每路实时推流占用的 CPU 核数（CPU 秒 / 音频秒）
+
+    使用 ffmpeg -benchmark 输出的 utime/stime，Windows 与 Linux 均可用
+    """
+    cmd = [
+        ffmpeg, '-hide_banner', '-nostats', '-benchmark',
+        '-f', 'lavfi', '-i', f'anoisesrc=d={seconds}:c=pink:r=44100',
+        '-filter:a', 'volume=0.5',
+        *profile.ffmpeg_args(),
+        '-f', 'null', '-'
+    ]
+    result = subprocess.run(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+                            text=True, errors='replace', timeout=seconds * 10)
+    match = _BENCH_RE.search(result.stderr or '')
+    if result.returncode != 0 or not match:
+        raise RuntimeError(f"编码基准测试失败，返回码: {result.returncode}")
+    utime, stime, _ = (float(v) for v in match.groups())
+    return (utime + stime) / seconds
+
+
+def plan_capacity(seconds: int = 20, target_utilization: float = 0.7, ffmpeg: str = 'ffmpeg') -> Dict[str, dict]:
+    """
+    测量各档位单路编码 CPU 开销，估算本机可持续承载的并发推流数
+
+    参数:
+        seconds (int): 每个档位编码的合成音频时长
+        target_utilization (float): 允许推流占用的 CPU 比例，为解码、网络和机器人自身预留余量
+    """
+    cores = os.cpu_count() or 1
+    report = {}
+    for name, profile in PROFILES.items():
+        cpu_per_stream = measure_encoder_cpu(profile, seconds, ffmpeg)
+        report[name] = {
+            'label': profile.label,
+            'cpu_per_stream': round(cpu_per_stream, 4),
+            'max_streams': math.floor(cores * target_utilization / cpu_per_stream) if cpu_per_stream > 0 else None,
+            'cores': cores,
+        }
+        logger.info(f"[容量评估] {name}: 单路 {cpu_per_stream:.2%} 核，预计最多 {report[name]['max_streams']} 路")
+    return report
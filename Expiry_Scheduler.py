@@ -0,0 +1,105 @@
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+from typing import Awaitable, Callable, Dict, Hashable, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+ExpireCallback = Callable[[Hashable], Awaitable[None]]
+
+
+def _deadline_of(entries: Dict[Hashable, Tuple[float, ExpireCallback]], key: Hashable) -> Optional[float]:
+    entry = entries.get(key)
+    return entry[0] if entry else None
+
+
+class ExpiryScheduler:
+    """
+    共享的到期调度器：所有定时到期的状态（猜人会话、roll 轮次等）共用一个最小堆和一个后台任务
+
+    重新设置到期时间时不删除旧堆项，只更新 key 当前的截止时间；
+    弹出时截止时间对不上的即为失效条目，直接丢弃（惰性删除），失效条目过多时整体重建堆。
+    到期回调各自在独立任务中运行，耗时的回调（如发送公告）不会推迟其他条目到期
+    """
+
+    def __init__(self, name: str = "scheduler"):
+        self.name = name
+        self._heap = []  # (截止时间, 序号, key)
+        self._entries = {}  # type: Dict[Hashable, Tuple[float, ExpireCallback]]  # key -> (截止时间, 回调)
+        self._counter = itertools.count()
+        self._task = None  # type: Optional[asyncio.Task]
+        self._wakeup = None  # type: Optional[asyncio.Event]
+        self._callbacks = set()  # type: Set[asyncio.Task]  # 运行中的回调任务（保留引用防止被回收）
+        self.fired = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def schedule(self, key: Hashable, delay: float, callback: ExpireCallback):
+        """delay 秒后调用 callback(key)；同一 key 重复调度时以最后一次为准"""
+        deadline = time.monotonic() + delay
+        self._entries[key] = (deadline, callback)
+        heapq.heappush(self._heap, (deadline, next(self._counter), key))
+        if len(self._heap) > 2 * len(self._entries) + 64:
+            self._compact()
+        self._ensure_task()
+        if self._heap[0][2] == key:
+            self._wakeup.set()  # 新的最早截止时间，唤醒后台任务重新计算等待时长
+
+    def cancel(self, key: Hashable):
+        self._entries.pop(key, None)
+
+    def _compact(self):
+        self._heap = [item for item in self._heap
+                      if _deadline_of(self._entries, item[2]) == item[0]]
+        heapq.heapify(self._heap)
+
+    def _ensure_task(self):
+        if self._task is None or self._task.done():
+            self._wakeup = asyncio.Event()
+            self._task = asyncio.create_task(self._run())
+
+    def _pop_stale(self):
+        while self._heap and _deadline_of(self._entries, self._heap[0][2]) != self._heap[0][0]:
+            heapq.heappop(self._heap)
+
+    async def _run(self):
+        while True:
+            self._pop_stale()
+            self._wakeup.clear()
+            if not self._heap:
+                await self._wakeup.wait()
+                continue
+            delay = self._heap[0][0] - time.monotonic()
+            if delay > 0:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=delay)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            _, _, key = heapq.heappop(self._heap)
+            _, callback = self._entries.pop(key)
+            self.fired += 1
+            task = asyncio.create_task(self._invoke(callback, key))
+            self._callbacks.add(task)
+            task.add_done_callback(self._callbacks.discard)
+
+    async def _invoke(self, callback: ExpireCallback, key: Hashable):
+        try:
+            await callback(key)
+        except Exception as e:
+            logger.error(f"[{self.name}] 到期回调异常 {key!r}: {e}", exc_info=True)
+
+    def shutdown(self):
+        if self._task:
+            self._task.cancel()
+        for task in list(self._callbacks):
+            task.cancel()
+        self._entries.clear()
+        self._heap.clear()
+
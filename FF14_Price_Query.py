@@ -1,11 +1,16 @@
 import requests
 import json
+import time
+import threading
+from collections import OrderedDict
 from datetime import datetime
-from typing import Optional, List
+from typing import Callable, Optional, List, Tuple
 
 
 class FF14PriceQuery:
     BASE_URL = "https://universalis.app/api/v2"
+    SEARCH_CACHE_SIZE = 256  # 物品搜索结果缓存条数
+    REQUEST_TIMEOUT = (3.05, 8)  # 单次请求的 (连接, 读取) 超时秒数；一次查询最多两次请求，合计低于指令的 30 秒超时
     cities_translate = {
         "Limsa Lominsa": "利姆萨·罗敏萨",
         "Gridania": "格里达尼亚",
@@ -143,6 +148,25 @@ class FF14PriceQuery:
         2080: "펜리르"
     }
 
+    def __init__(self):
+        self._search_cache = OrderedDict()  # 物品名 -> cafemaker 搜索结果
+        self._search_lock = threading.Lock()  # 查询在线程池中并发执行，缓存读写需加锁
+        # 每次 HTTP 请求完成时回调 on_request(url, 耗时秒数, 状态码)，连接失败时状态码为 None
+        self.on_request = None  # type: Optional[Callable[[str, float, Optional[int]], None]]
+
+    def _get(self, url, **kwargs):
+        """requests.get 的计时包装，未指定 timeout 时使用 REQUEST_TIMEOUT"""
+        kwargs.setdefault('timeout', self.REQUEST_TIMEOUT)
+        started = time.monotonic()
+        status = None
+        try:
+            response = requests.get(url, **kwargs)
+            status = response.status_code
+            return response
+        finally:
+            if self.on_request is not None:
+                self.on_request(url, time.monotonic() - started, status)
+
     def get_sale_history(self, dc_name, item_name, entries=100):
         """
         查询指定大区和物品的销售历史记录
@@ -163,7 +187,7 @@ class FF14PriceQuery:
         # 2. 构建API请求
         url = f"{self.BASE_URL}/history/{dc_name}/{item_id}?entriesToReturn={entries}"
         try:
-            response = requests.get(url)
+            response = self._get(url)
             response.raise_for_status()
             sale_data = response.json()
         except requests.exceptions.RequestException as e:
@@ -228,7 +252,7 @@ class FF14PriceQuery:
         """查询指定大区和物品的市场板数据"""
         url = f"{self.BASE_URL}/{dc_name}/{item_id}?listings={listing_count}"
         try:
-            response = requests.get(url)
+            response = self._get(url)
             response.raise_for_status()
             return response.json()
         except requests.exceptions.RequestException as e:
@@ -326,15 +350,31 @@ class FF14PriceQuery:
 
         return f"{title}\n\n{formatted_listings}"
 
+    def _search_items(self, name):
+        """
+        cafemaker 物品搜索，结果按名称缓存在内存中
+
+        物品ID与图标都来自同一次搜索，查询一次物品只请求一次 cafemaker
+        """
+        with self._search_lock:
+            if name in self._search_cache:
+                self._search_cache.move_to_end(name)
+                return self._search_cache[name]
+        base_url = "https://cafemaker.wakingsands.com/Search"
+        params = {"indexes": "item", "string": name}
+        response = self._get(base_url, params=params, proxies={'http': None, 'https': None})
+        response.raise_for_status()
+        results = response.json().get("Results", [])
+        with self._search_lock:
+            self._search_cache[name] = results
+            while len(self._search_cache) > self.SEARCH_CACHE_SIZE:
+                self._search_cache.popitem(last=False)
+        return results
+
     def get_item_match_id(self, target_name):
         """精确匹配物品ID"""
-        base_url = "https://cafemaker.wakingsands.com/Search"
-        params = {"indexes": "item", "string": target_name}
         try:
-            response = requests.get(base_url, params=params, proxies={'http': None, 'https': None})
-            response.raise_for_status()
-            data = response.json()
-            for item in data.get("Results", []):
+            for item in self._search_items(target_name):
                 if item.get("Name") == target_name:
                     return item.get("ID")
             print(f"警告：未找到物品 '{target_name}'")
@@ -352,7 +392,7 @@ class FF14PriceQuery:
 
         try:
             url = f"{self.BASE_URL}/tax-rates?world={server_id}"
-            response = requests.get(url)
+            response = self._get(url)
             response.raise_for_status()
             tax_data = response.json()
             return {self.cities_translate.get(city, city): rate for city, rate in tax_data.items()}
@@ -378,7 +418,7 @@ class FF14PriceQuery:
     def _fetch_price_data(self, server_name, item_id):
         url = f"{self.BASE_URL}/aggregated/{server_name}/{item_id}"
         try:
-            response = requests.get(url)
+            response = self._get(url)
             response.raise_for_status()
             data = response.json()
             # 关键修改：从 worldUploadTimes 中获取最新的毫秒级时间戳
@@ -430,34 +470,26 @@ class FF14PriceQuery:
 
         return "\n\n".join(output) if output else "无有效数据"
 
-    def get_item_image_url(self, item_name: str) -> Optional[str]:
+    def get_item_icon(self, item_name: str) -> Optional[Tuple[int, str]]:
         """
-        通过物品名获取精确匹配的物品图片 URL
-        :param item_name: 物品名称（需精确匹配）
-        :return: 图片 URL 或 None（未找到匹配项）
+        通过物品名获取精确匹配（不区分大小写）的物品ID与 cafemaker 图标 URL
+        :param item_name: 物品名称
+        :return: (物品ID, 图片 URL) 或 None（未找到匹配项）
         """
-        base_api_url = "https://cafemaker.wakingsands.com/Search"
-        params = {
-            "indexes": "item",
-            "string": item_name
-        }
-
         try:
-            response = requests.get(base_api_url, params=params)
-            response.raise_for_status()  # 抛出 HTTP 错误
-            data = response.json()
+            results = self._search_items(item_name)
         except (requests.exceptions.RequestException, ValueError):
-            self.logger.error(f"获取物品图片失败：请求异常，物品名={item_name}")
+            print(f"获取物品图片失败：请求异常，物品名={item_name}")
             return None
 
-        # 第一步：精确匹配物品名（区分大小写，完全匹配）
+        # 第一步：精确匹配物品名（不区分大小写，完全匹配）
         exact_matches: List[dict] = [
-            item for item in data.get("Results", [])
+            item for item in results
             if item.get("Name", "").lower() == item_name.lower()  # 不区分大小写匹配
         ]
 
         if not exact_matches:
-            self.logger.info(f"未找到精确匹配的物品：{item_name}")
+            print(f"未找到精确匹配的物品：{item_name}")
             return None
 
         # 取第一个匹配结果（通常精确匹配只有一个）
@@ -465,11 +497,20 @@ class FF14PriceQuery:
         icon_suffix = first_match.get("Icon")
 
         if not icon_suffix:
-            self.logger.warning(f"匹配到物品但缺少图标后缀：{item_name}")
+            print(f"匹配到物品但缺少图标后缀：{item_name}")
             return None
 
         # 构建完整图片 URL
-        return f"https://cafemaker.wakingsands.com{icon_suffix}"
+        return first_match.get("ID"), f"https://cafemaker.wakingsands.com{icon_suffix}"
+
+    def get_item_image_url(self, item_name: str) -> Optional[str]:
+        """
+        通过物品名获取精确匹配的物品图片 URL
+        :param item_name: 物品名称（需精确匹配）
+        :return: 图片 URL 或 None（未找到匹配项）
+        """
+        icon = self.get_item_icon(item_name)
+        return icon[1] if icon else None
 
     def _build_world_time_map(self, item):
         """构建服务器ID到时间的映射"""
@@ -0,0 +1,117 @@
+from typing import Dict, Iterable, List, Optional, Tuple
+
+# 可作为提示公开的字段：(记录属性, 展示名)
+HINT_FIELDS = (
+    ('region', '所属区域'),
+    ('nation', '国籍'),
+    ('team', '战队'),
+    ('role', '位置'),
+    ('age', '年龄'),
+    ('majors', 'Major 次数'),
+)
+
+NEAR_RANGE = 2  # 与 _format_guess_feedback 一致：差值不超过 2 时给出 🔺/🔻
+
+
+def _popcount(mask: int) -> int:
+    return bin(mask).count('1')
+
+
+class PlayerHintIndex:
+    """
+    猜选手的约束收窄引擎
+
+    名单按列存储，每列的每个取值对应一个整数位图（第 i 位表示第 i 名选手），
+    每次猜测的反馈都换算成位图约束，整局的候选集合就是所有约束按位与的结果。
+    Python 大整数的位运算一次处理整列，名单扩大 100 倍时单次计算仍在毫秒以内，且无需 numpy
+    """
+
+    def __init__(self, players: Iterable):
+        self.records = list(players)
+        self.all_mask = (1 << len(self.records)) - 1
+        self._columns = {}  # type: Dict[str, Dict[object, int]]  # 字段 -> 取值 -> 位图
+        self._name_bits = {}  # type: Dict[str, int]
+        for field, _ in HINT_FIELDS:
+            self._columns[field] = {}
+        for i, record in enumerate(self.records):
+            bit = 1 << i
+            self._name_bits[record.name] = bit
+            for field, _ in HINT_FIELDS:
+                column = self._columns[field]
+                value = getattr(record, field)
+                column[value] = column.get(value, 0) | bit
+
+    def __len__(self):
+        return len(self.records)
+
+    def _equals(self, field: str, value) -> int:
+        return self._columns[field].get(value, 0)
+
+    def _in_range(self, field: str, low: int, high: int) -> int:
+        mask = 0
+        for value, bits in self._columns[field].items():
+            if value is not None and low <= value <= high:
+                mask |= bits
+        return mask
+
+    def _numeric_constraint(self, field: str, guessed: Optional[int], correct: Optional[int]) -> int:
+        if guessed == correct:
+            return self._equals(field, guessed)
+        if guessed is None:
+            return self.all_mask & ~self._equals(field, None)
+        if correct is not None and abs(guessed - correct) <= NEAR_RANGE:
+            if guessed > correct:  # 🔺：猜大了
+                return self._in_range(field, guessed - NEAR_RANGE, guessed - 1)
+            return self._in_range(field, guessed + 1, guessed + NEAR_RANGE)
+        # 无箭头：相差超过 2，或正确选手没有该项数据
+        return self.all_mask & ~self._in_range(field, guessed - NEAR_RANGE, guessed + NEAR_RANGE)
+
+    def constraint(self, guessed, correct) -> int:
+        """把一次猜测的反馈（与玩家看到的提示完全一致）换算成候选位图"""
+        mask = self.all_mask & ~self._name_bits.get(guessed.name, 0)
+        for field in ('team', 'nation', 'role'):
+            value = getattr(guessed, field)
+            if value == getattr(correct, field):
+                mask &= self._equals(field, value)
+            else:
+                mask &= ~self._equals(field, value)
+        if guessed.nation != correct.nation and guessed.region is not None:
+            if correct.region == guessed.region:  # 提示了“同属某区域”
+                mask &= self._equals('region', guessed.region)
+            else:
+                mask &= ~self._equals('region', guessed.region)
+        mask &= self._numeric_constraint('age', guessed.age, correct.age)
+        mask &= self._numeric_constraint('majors', guessed.majors, correct.majors)
+        return mask
+
+    def candidates(self, guesses: Iterable, correct, revealed: Iterable[str] = ()) -> int:
+        """guesses 为已猜过的选手，revealed 为已通过提示公开的字段"""
+        mask = self.all_mask
+        for guessed in guesses:
+            mask &= self.constraint(guessed, correct)
+        for field in revealed:
+            mask &= self._equals(field, getattr(correct, field))
+        # 正确选手始终在候选内（名单热更新后可能已不在新名单中）
+        return mask | self._name_bits.get(correct.name, 0)
+
+    def count(self, guesses: Iterable, correct, revealed: Iterable[str] = ()) -> int:
+        return _popcount(self.candidates(guesses, correct, revealed))
+
+    def smart_hint(self, guesses: List, correct, revealed: Iterable[str] = ()) -> Optional[Tuple[str, str, object, int]]:
+        """
+        选出最能缩小候选范围的一项属性
+
+        返回:
+            (字段, 展示名, 正确选手的该项取值, 公开后剩余的候选数)；已无法进一步缩小时返回 None
+        """
+        mask = self.candidates(guesses, correct, revealed)
+        remaining = _popcount(mask)
+        best = None
+        for field, label in HINT_FIELDS:
+            value = getattr(correct, field)
+            if value is None:
+                continue
+            left = _popcount(mask & self._equals(field, value)) or remaining
+            if left < remaining and (best is None or left < best[3]):
+                best = (field, label, value, left)
+        return best
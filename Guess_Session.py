@@ -0,0 +1,76 @@
+import logging
+import time
+from typing import Dict, List, Optional
+
+from Expiry_Scheduler import ExpiryScheduler
+from HLTV_PLAYER import PlayerRecord
+from Message_Intake import ChannelInterest
+
+logger = logging.getLogger(__name__)
+
+
+class GuessSession:
+    """单个频道的一局猜选手游戏"""
+
+    __slots__ = ('channel_id', 'correct', 'attempts', 'guesses', 'revealed', 'started_at')
+
+    def __init__(self, channel_id: str, correct: PlayerRecord, attempts: int):
+        self.channel_id = channel_id
+        self.correct = correct
+        self.attempts = attempts  # 剩余猜测次数
+        self.guesses = []  # type: List[PlayerRecord]  # 已猜过的选手（按顺序）
+        self.revealed = []  # type: List[str]  # 已通过 /hint 公开的字段
+        self.started_at = time.time()
+
+
+class GuessSessionStore:
+    """
+    按频道保存猜选手游戏
+
+    每条非指令消息只需一次字典查找即可判断所在频道是否有进行中的游戏；
+    会话在最后一次操作后 ttl 秒无人猜测即由共享调度器回收
+    """
+
+    FEATURE = 'guess'
+
+    def __init__(self, scheduler: ExpiryScheduler, ttl: float = 600.0, interest: Optional[ChannelInterest] = None):
+        """
+        参数:
+            scheduler (ExpiryScheduler): 共享的到期调度器
+            ttl (float): 无人猜测多少秒后结束游戏
+            interest (ChannelInterest): 消息入口的频道关注表，有游戏的频道才接收聊天消息
+        """
+        self.scheduler = scheduler
+        self.ttl = ttl
+        self.interest = interest if interest is not None else ChannelInterest()
+        self.sessions = {}  # type: Dict[str, GuessSession]
+        self.expired = 0
+
+    def __len__(self):
+        return len(self.sessions)
+
+    def get(self, channel_id: str) -> Optional[GuessSession]:
+        return self.sessions.get(channel_id)
+
+    def start(self, channel_id: str, correct: PlayerRecord, attempts: int) -> GuessSession:
+        """开始新的一局，同一频道已有的游戏被直接替换"""
+        session = GuessSession(channel_id, correct, attempts)
+        self.sessions[channel_id] = session
+        self.interest.watch(channel_id, self.FEATURE)
+        self.touch(channel_id)
+        return session
+
+    def touch(self, channel_id: str):
+        self.scheduler.schedule(('guess', channel_id), self.ttl, self._expire)
+
+    def end(self, channel_id: str) -> Optional[GuessSession]:
+        self.scheduler.cancel(('guess', channel_id))
+        self.interest.unwatch(channel_id, self.FEATURE)
+        return self.sessions.pop(channel_id, None)
+
+    async def _expire(self, key):
+        session = self.sessions.pop(key[1], None)
+        self.interest.unwatch(key[1], self.FEATURE)
+        if session is not None:
+            self.expired += 1
+            logger.info(f"[猜选手] 频道 {session.channel_id} 的游戏超时结束，答案: {session.correct.name}")
@@ -1,12 +1,179 @@
+import hashlib
+import json
 import os
-import pandas as pd
+import threading
+from typing import Callable, Dict, List, NamedTuple, Optional, Tuple
+
+from Guess_Hints import PlayerHintIndex
+
+PLAYER_FIELDS = ("NAME", "TEAM", "NATION", "AGE", "ROLE", "MAJ_NUM")
+
+
+class PlayerRecord(NamedTuple):
+    """选手记录（年龄、Major 次数为整数，所属区域在加载时预先计算）"""
+    name: str
+    team: str
+    nation: str
+    age: Optional[int]
+    role: str
+    majors: Optional[int]
+    region: Optional[str]
+
+    def display_values(self) -> Tuple[str, ...]:
+        """按 PLAYER_FIELDS 顺序返回用于展示的字符串"""
+        return tuple("N/A" if value is None else str(value)
+                     for value in (self.name, self.team, self.nation, self.age, self.role, self.majors))
+
+
+def _to_int(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+_SEPARATOR_TABLE = str.maketrans('_-.', '   ')
+
+
+def normalize_name(text) -> str:
+    """
+    casefold 后按空格、下划线、连字符、点号切分单词并以单个空格连接，使 'zywoo'、'GeT RiGhT'、'hunter' 等写法都能命中；
+    单词边界保留，'i m' 不会命中 iM。含其他符号（如 'rain!'）时返回空串，视为普通聊天
+    """
+    text = str(text).casefold()
+    if not all(ch.isalnum() or ch.isspace() or ch in '_-.' for ch in text):
+        return ''
+    return ' '.join(text.translate(_SEPARATOR_TABLE).split())
+
+
+_LEET_TABLE = str.maketrans('013457', 'oieast')
+
+
+def _edit_distance(a: str, b: str, limit: int) -> int:
+    """编辑距离（相邻字符互换计 1 次，便于识别手误），超过 limit 时提前返回 limit + 1"""
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    before, previous = None, list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        current = [i]
+        for j, cb in enumerate(b, 1):
+            cost = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (ca != cb))
+            if i > 1 and j > 1 and ca == b[j - 2] and a[i - 2] == cb:
+                cost = min(cost, before[j - 2] + 1)
+            current.append(cost)
+        if min(current) > limit:
+            return limit + 1
+        before, previous = previous, current
+    return previous[-1]
+
+
+class PlayerNameIndex:
+    """
+    选手名检索索引（加载选手表时一次性构建）
+
+    精确键：规范化后的选手名（多个单词的选手名另登记连写形式）、数字替换字母的写法（s1mple -> simple）以及别名表，
+    命中时为一次字典查找；未命中时用三元组倒排表（按数字替换后的写法建立）筛出候选，再按编辑距离给出最接近的选手名。
+    iM、PR 这类短名与日常聊天容易撞车，只登记 casefold 后的精确键，不登记数字替换、连写等派生写法，也不对短输入给出候选
+    """
+
+    MAX_SUGGESTIONS = 3
+    MIN_LOOSE_LENGTH = 5  # 去空格后短于该长度的选手名/输入不做大小写、符号与数字写法的宽松匹配
+
+    def __init__(self, names, aliases=None):
+        self.keys = {}  # type: Dict[str, str]  # 规范化写法 -> 选手名
+        self._grams = {}  # type: Dict[str, set]  # 三元组 -> 检索键集合
+        self._canonical = {}  # type: Dict[str, str]  # 检索键（数字替换后的写法）-> 选手名
+        loose = []  # type: List[Tuple[str, str]]  # 允许宽松匹配的 (检索键, 选手名)
+        for name in names:
+            key = normalize_name(name)
+            if not key:
+                continue
+            folded = key.translate(_LEET_TABLE)
+            self._canonical.setdefault(folded, name)
+            for gram in self._trigrams(folded):
+                self._grams.setdefault(gram, set()).add(folded)
+            self.keys.setdefault(key, name)
+            if not self.is_short(key):
+                loose.append((folded, name))
+        # 派生写法与别名不覆盖已有的精确键，避免一个写法指向两名选手
+        for folded, name in loose:
+            self.keys.setdefault(folded, name)
+            self.keys.setdefault(folded.replace(' ', ''), name)
+        for name, alias_list in (aliases or {}).items():
+            if name not in names:
+                continue
+            for alias in alias_list:
+                alias_key = normalize_name(alias)
+                if alias_key:
+                    self.keys.setdefault(alias_key, name)
+
+    def __len__(self):
+        return len(self._canonical)
+
+    @classmethod
+    def is_short(cls, key: str) -> bool:
+        """key 为 normalize_name 的结果"""
+        return len(key.replace(' ', '')) < cls.MIN_LOOSE_LENGTH
+
+    @staticmethod
+    def _trigrams(key: str):
+        padded = f'^{key}$'
+        return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+    def lookup(self, text) -> Optional[str]:
+        """整条消息的精确/别名匹配，返回选手名"""
+        key = normalize_name(text)
+        if not key:
+            return None
+        name = self.keys.get(key)
+        if name is None and not self.is_short(key):
+            name = self.keys.get(key.translate(_LEET_TABLE))
+        return name
+
+    def suggest(self, text, limit: int = MAX_SUGGESTIONS) -> List[str]:
+        """返回编辑距离足够接近的选手名，按距离、共有三元组数排序"""
+        key = normalize_name(text).translate(_LEET_TABLE)
+        if self.is_short(key):
+            return []
+        shared = {}
+        for gram in self._trigrams(key):
+            for candidate in self._grams.get(gram, ()):
+                shared[candidate] = shared.get(candidate, 0) + 1
+        scored = []
+        for candidate, count in shared.items():
+            max_distance = max(1, min(len(key), len(candidate)) * 2 // 5)
+            distance = _edit_distance(key, candidate, max_distance)
+            if distance <= max_distance:
+                scored.append((distance, -count, self._canonical[candidate]))
+        scored.sort()
+        return [name for _, _, name in scored[:limit]]
+
+    def resolve(self, text) -> Tuple[Optional[str], List[str]]:
+        """返回 (选手名, 候选列表)；精确命中时候选列表为空"""
+        name = self.lookup(text)
+        if name is not None:
+            return name, []
+        return None, self.suggest(text)
+
+
+class PlayerSnapshot(NamedTuple):
+    """一次加载得到的完整选手数据；热更新时整体替换，读取方先取引用再使用，无需加锁"""
+    players: Dict[str, PlayerRecord]  # 选手名 -> 选手记录
+    sorted_names: List[str]
+    name_index: PlayerNameIndex
+    hint_index: PlayerHintIndex
 
 
 class HLTVPlayerManager:
+    CACHE_VERSION = 1  # 缓存格式变更时递增，旧缓存自动重建
+
     def __init__(self, file_path=None):
         self.file_path = file_path
-        self._player_names = None
-        self._df = None
+        self._snapshot = None  # type: Optional[PlayerSnapshot]
+        self._watcher = None  # type: Optional[threading.Thread]
+        self._stop_watching = threading.Event()
+        # 热更新成功后在监视线程中回调 on_reload(新的排序名单)
+        self.on_reload = None  # type: Optional[Callable[[List[str]], None]]
         self.nation_dict = {
             "欧洲": ['德国', '法国', '丹麦', '爱沙尼亚', '北马其顿', '波黑', '波兰', '芬兰', '捷克',
                      '拉脱维亚', '立陶宛', '罗马尼亚', '挪威', '斯洛伐克', '斯洛文尼亚', '土耳其',
@@ -23,52 +190,187 @@ class HLTVPlayerManager:
     # 原有方法保持不变...
     def set_file_path(self, file_path):
         self.file_path = file_path
-        self._player_names = None
-        self._df = None
+        self._snapshot = None
+
+    @staticmethod
+    def get_cache_path(file_path):
+        """编译缓存与 Excel 放在同一目录，如 data/HLTV_Player.cache.json"""
+        return os.path.splitext(file_path)[0] + '.cache.json'
+
+    @staticmethod
+    def get_alias_path(file_path):
+        """别名表与 Excel 放在同一目录：data/HLTV_Alias.json，格式为 {选手名: [别名, ...]}"""
+        return os.path.join(os.path.dirname(file_path), 'HLTV_Alias.json')
+
+    def _load_aliases(self, file_path) -> Dict[str, List[str]]:
+        alias_path = self.get_alias_path(file_path)
+        if not os.path.exists(alias_path):
+            return {}
+        try:
+            with open(alias_path, 'r', encoding='utf-8') as f:
+                return {str(name): [str(a) for a in aliases] for name, aliases in json.load(f).items()}
+        except (OSError, ValueError, AttributeError, TypeError) as e:
+            print(f"警告：别名表读取失败：{e}")
+            return {}
+
+    @staticmethod
+    def _file_sha256(file_path):
+        with open(file_path, 'rb') as f:
+            return hashlib.sha256(f.read()).hexdigest()
+
+    def _compile_workbook(self, file_path):
+        """用 pandas 解析 Excel（仅在缓存失效时调用，pandas 延迟导入）"""
+        import pandas as pd
+
+        df = pd.read_excel(file_path, header=1)
+        if 'Unnamed: 0' in df.columns:
+            df = df.drop(columns=['Unnamed: 0'])
+        df = df.reset_index(drop=True)
+        if 'NAME' in df.columns:
+            df['NAME'] = df['NAME'].astype(str)
+
+        rows = []
+        for row in df.astype(object).where(pd.notna(df), None).values.tolist():
+            # 含空值的整数列会被 pandas 读成浮点数，这里还原为整数
+            rows.append([int(v) if isinstance(v, float) and v.is_integer() else v for v in row])
+        return [str(column) for column in df.columns], rows
+
+    def _load_table(self, file_path):
+        """
+        读取选手表：优先使用编译缓存
+
+        缓存以源文件的 mtime/大小 快速校验，不一致时再比较 SHA-256，
+        内容确实变化时才导入 pandas 重新解析 Excel 并写回缓存
+        """
+        stat = os.stat(file_path)
+        cache_path = self.get_cache_path(file_path)
+        cache = None
+        try:
+            with open(cache_path, 'r', encoding='utf-8') as f:
+                cache = json.load(f)
+            if cache.get('version') != self.CACHE_VERSION:
+                cache = None
+        except (OSError, ValueError):
+            cache = None
+
+        if cache and cache['source']['mtime'] == stat.st_mtime and cache['source']['size'] == stat.st_size:
+            return cache['columns'], cache['rows']
+
+        digest = self._file_sha256(file_path)
+        if cache is None or cache['source']['sha256'] != digest:
+            columns, rows = self._compile_workbook(file_path)
+            cache = {'version': self.CACHE_VERSION, 'columns': columns, 'rows': rows}
+        cache['source'] = {'mtime': stat.st_mtime, 'size': stat.st_size, 'sha256': digest}
+
+        tmp_path = cache_path + '.tmp'
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(cache, f, ensure_ascii=False, separators=(',', ':'))
+            os.replace(tmp_path, cache_path)
+        except OSError as e:
+            print(f"警告：选手缓存写入失败：{e}")
+        return cache['columns'], cache['rows']
+
+    def _build_records(self, columns, rows) -> Dict[str, PlayerRecord]:
+        """将表格行转换为以选手名为键的记录字典"""
+        index = {column: i for i, column in enumerate(columns)}
+
+        def cell(row, column):
+            i = index.get(column)
+            return row[i] if i is not None and i < len(row) else None
+
+        players = {}
+        for row in rows:
+            name = str(cell(row, 'NAME'))
+            nation = str(cell(row, 'NATION') or '')
+            players[name] = PlayerRecord(
+                name=name,
+                team=str(cell(row, 'TEAM') or ''),
+                nation=nation,
+                age=_to_int(cell(row, 'AGE')),
+                role=str(cell(row, 'ROLE') or ''),
+                majors=_to_int(cell(row, 'MAJ_NUM')),
+                region=self.country_to_region.get(nation),
+            )
+        return players
+
+    def _build_snapshot(self, path) -> Optional[PlayerSnapshot]:
+        """读取选手表并构建记录、排序名单与检索索引；文件缺失或读取失败时返回 None"""
+        try:
+            columns, rows = self._load_table(path)
+            if 'NAME' in columns:
+                players = self._build_records(columns, rows)
+            else:
+                print(f"错误：文件中未找到 'NAME' 列。列名：{', '.join(columns)}")
+                players = {}
+        except FileNotFoundError:
+            print(f"错误：未找到文件 '{path}'。请检查文件路径是否正确。")
+            return None
+        except Exception as e:
+            print(f"错误：读取文件时发生未知错误：{e}")
+            return None
+        return PlayerSnapshot(
+            players=players,
+            sorted_names=sorted(players, key=lambda x: x.lower()),
+            name_index=PlayerNameIndex(players, self._load_aliases(path)),
+            hint_index=PlayerHintIndex(players.values()),
+        )
+
+    def _ensure_loaded(self, file_path=None, refresh=False) -> Optional[PlayerSnapshot]:
+        snapshot = self._snapshot
+        if not refresh and snapshot is not None:
+            return snapshot
+        path = file_path or self.file_path
+        if not path:
+            raise ValueError("未指定 Excel 文件路径，请使用 set_file_path 方法设置或在调用时提供")
+        # 读取失败时缓存空名单，之后的调用不再反复读取文件、重复报错，直到 refresh 或热更新
+        self._snapshot = self._build_snapshot(path) or self._empty_snapshot()
+        return self._snapshot
+
+    @staticmethod
+    def _empty_snapshot() -> PlayerSnapshot:
+        return PlayerSnapshot(players={}, sorted_names=[], name_index=PlayerNameIndex({}),
+                              hint_index=PlayerHintIndex(()))
 
     def get_sorted_player_names(self, file_path=None, refresh=False):
-        if refresh or self._player_names is None:
-            path = file_path or self.file_path
-            if not path:
-                raise ValueError("未指定 Excel 文件路径，请使用 set_file_path 方法设置或在调用时提供")
-            try:
-                self._df = pd.read_excel(path, header=1)
-                if 'Unnamed: 0' in self._df.columns:
-                    self._df = self._df.drop(columns=['Unnamed: 0'])
-                self._df = self._df.reset_index(drop=True)
-                if 'NAME' in self._df.columns:
-                    self._df['NAME'] = self._df['NAME'].astype(str)
-                    self._player_names = self._df['NAME'].tolist()
-                else:
-                    print(f"错误：文件中未找到 'NAME' 列。列名：{', '.join(self._df.columns)}")
-                    self._player_names = []
-            except FileNotFoundError:
-                print(f"错误：未找到文件 '{path}'。请检查文件路径是否正确。")
-                self._player_names = []
-            except Exception as e:
-                print(f"错误：读取文件时发生未知错误：{e}")
-                self._player_names = []
+        snapshot = self._ensure_loaded(file_path=file_path, refresh=refresh)
+        sorted_names = snapshot.sorted_names if snapshot else []
+        return sorted_names, len(sorted_names)
 
-        sorted_names = sorted(self._player_names, key=lambda x: x.lower()) if self._player_names else []
-        player_count = len(sorted_names)
-        return sorted_names, player_count
+    def get_player(self, player_name) -> Optional[PlayerRecord]:
+        """按选手名获取记录（O(1) 字典查找），不存在时返回 None"""
+        snapshot = self._ensure_loaded()
+        return snapshot.players.get(player_name) if snapshot else None
+
+    def resolve_player(self, guess) -> Tuple[Optional[PlayerRecord], List[str]]:
+        """
+        按玩家输入查找选手：大小写、空格符号、数字写法与别名均可命中
+
+        返回:
+            (选手记录或 None, 未命中时最接近的选手名列表)
+        """
+        snapshot = self._ensure_loaded()
+        if not snapshot or not snapshot.players:
+            return None, []
+        record = snapshot.players.get(guess)
+        if record is not None:
+            return record, []
+        name, suggestions = snapshot.name_index.resolve(guess)
+        return (snapshot.players[name] if name is not None else None), suggestions
+
+    def get_hint_index(self) -> Optional[PlayerHintIndex]:
+        """当前名单的约束收窄索引（随名单热更新一起替换）"""
+        snapshot = self._ensure_loaded()
+        return snapshot.hint_index if snapshot else None
 
     def get_player_info(self, player_name, file_path=None, refresh=False):
-        if self._df is None or refresh:
-            self.get_sorted_player_names(file_path=file_path, refresh=refresh)
-        if self._df is not None:
-            player_info = self._df[self._df['NAME'] == player_name]
-            if not player_info.empty:
-                fixed_headers = ["NAME", "TEAM", "NATION", "AGE", "ROLE", "MAJ_NUM"]
-                data_values = []
-                for header in fixed_headers:
-                    if header in self._df.columns:
-                        value = player_info[header].iloc[0]
-                        data_values.append(str(value))
-                    else:
-                        data_values.append("N/A")
-                headers_line = "\t".join(fixed_headers)
-                data_line = "\t".join(data_values)
+        """兼容旧接口：返回制表符分隔的表头与数据两行文本"""
+        snapshot = self._ensure_loaded(file_path=file_path, refresh=refresh)
+        if snapshot is not None:
+            record = snapshot.players.get(player_name)
+            if record is not None:
+                headers_line = "\t".join(PLAYER_FIELDS)
+                data_line = "\t".join(record.display_values())
                 return f"{headers_line}\n{data_line}"
             else:
                 return f"未找到选手 '{player_name}' 的信息。"
@@ -79,7 +381,7 @@ class HLTVPlayerManager:
         return self.country_to_region.get(country, None)
 
     # 新增方法：验证选手图片
-    def validate_player_images(self, img_dir='img', suffix='.png', file_path=None):
+    def validate_player_images(self, img_dir='img', suffix='.png', file_path=None, snapshot=None):
         """
         验证选手名单与图片文件是否一一对应
 
@@ -87,20 +389,21 @@ class HLTVPlayerManager:
             img_dir (str): 图片文件夹路径，默认为同级目录下的'img'文件夹
             suffix (str): 图片文件后缀，默认为'.png'
             file_path (str): 可选，指定Excel文件路径，若不指定则使用已设置的路径
+            snapshot (PlayerSnapshot): 可选，验证尚未启用的新名单（热更新时使用）
 
         返回:
             dict: 包含验证结果的字典
         """
-        # 使用指定的文件路径或已设置的路径
-        if file_path:
-            self.set_file_path(file_path)
+        if snapshot is None:
+            # 使用指定的文件路径或已设置的路径
+            if file_path:
+                self.set_file_path(file_path)
 
-        # 确保数据已加载
-        if self._df is None:
-            self.get_sorted_player_names()
+            # 确保数据已加载
+            snapshot = self._ensure_loaded()
 
         # 检查必要条件
-        if 'NAME' not in self._df.columns:
+        if not snapshot or not snapshot.players:
             return {
                 'status': 'error',
                 'message': "数据中未找到'NAME'列",
@@ -108,7 +411,7 @@ class HLTVPlayerManager:
             }
 
         # 获取所有选手名称
-        player_names = set(self._df['NAME'].tolist())
+        player_names = set(snapshot.players)
 
         # 检查图片文件夹
         if not os.path.exists(img_dir):
@@ -138,6 +441,67 @@ class HLTVPlayerManager:
             'valid': len(missing_images) == 0
         }
 
+    # ---------------------- 热更新 ----------------------
+    def _source_signature(self, img_dir):
+        """选手表、别名表与图片文件夹的 (mtime, 大小)；文件夹增删文件时其 mtime 会变化"""
+        signature = []
+        for path in (self.file_path, self.get_alias_path(self.file_path), img_dir):
+            try:
+                stat = os.stat(path)
+                signature.append((stat.st_mtime_ns, stat.st_size))
+            except OSError:
+                signature.append(None)
+        return tuple(signature)
+
+    def reload(self, img_dir='img', suffix='.png') -> bool:
+        """
+        在当前线程重新构建名单，图片校验通过后整体替换快照
+
+        Excel 已保存但新选手图片尚未放入时校验会失败，此时保留旧名单，
+        等图片文件夹变化后由监视线程再次尝试
+        """
+        snapshot = self._build_snapshot(self.file_path)
+        if not snapshot or not snapshot.players:
+            print("警告：新选手表读取失败或为空，继续使用当前名单")
+            return False
+        report = self.validate_player_images(img_dir=img_dir, suffix=suffix, snapshot=snapshot)
+        if report['status'] != 'success':
+            print(f"警告：选手图片校验失败：{report['message']}，继续使用当前名单")
+            return False
+        if not report['valid']:
+            print(f"警告：{len(report['missing_images'])} 名选手缺少图片"
+                  f"（{', '.join(report['missing_images'][:10])}），继续使用当前名单")
+            return False
+        self._snapshot = snapshot  # 单次引用赋值即完成替换，进行中的读取仍使用旧快照
+        print(f"选手名单已更新：共 {len(snapshot.players)} 名选手")
+        if self.on_reload is not None:
+            self.on_reload(snapshot.sorted_names)
+        return True
+
+    def start_watching(self, img_dir='img', interval=10.0, suffix='.png'):
+        """启动后台线程轮询选手表与图片文件夹的修改时间，变化时自动热更新"""
+        if self._watcher is not None and self._watcher.is_alive():
+            return
+        self._stop_watching.clear()
+        self._watcher = threading.Thread(target=self._watch_loop, args=(img_dir, interval, suffix),
+                                         name="hltv-watcher", daemon=True)
+        self._watcher.start()
+
+    def stop_watching(self):
+        self._stop_watching.set()
+
+    def _watch_loop(self, img_dir, interval, suffix):
+        signature = self._source_signature(img_dir)
+        while not self._stop_watching.wait(interval):
+            current = self._source_signature(img_dir)
+            if current == signature:
+                continue
+            signature = current
+            try:
+                self.reload(img_dir=img_dir, suffix=suffix)
+            except Exception as e:
+                print(f"错误：选手名单热更新失败：{e}")
+
 
 # 新增：独立验证函数（不影响类的原有功能）
 def validate_player_images_standalone(excel_path="data/HLTV_Player.xlsx", img_dir="img", suffix=".png"):
@@ -0,0 +1,134 @@
+import asyncio
+import json
+import logging
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, List, Optional
+
+import aiohttp
+
+logger = logging.getLogger(__name__)
+
+
+class ItemIconCache:
+    """
+    FF14 物品图标镜像
+
+    首次查询某物品时下载 cafemaker 图标并通过 create_asset 上传到 KOOK，
+    物品ID -> KOOK 资源链接 按 LRU 保存到 JSON；之后的卡片直接引用 KOOK 链接，
+    客户端渲染时不再访问第三方图床
+    """
+
+    def __init__(self, upload: Callable[[str], Awaitable[str]], table_path: str, max_entries: int = 2000,
+                 trace_configs: Optional[List[aiohttp.TraceConfig]] = None):
+        """
+        参数:
+            upload: 上传本地文件并返回资源链接（bot.client.create_asset）
+            table_path (str): 映射表 JSON 文件路径
+            max_entries (int): 映射表条目上限，超出时淘汰最久未使用的条目
+            trace_configs: 下载会话的 aiohttp 请求钩子（指标统计）
+        """
+        self.trace_configs = trace_configs
+        self._upload = upload
+        self.table_path = table_path
+        self.max_entries = max_entries
+        self._table = OrderedDict()  # type: OrderedDict[str, str]  # 物品ID -> KOOK 资源链接
+        self._inflight = {}  # type: Dict[str, asyncio.Future]
+        self._session = None  # type: Optional[aiohttp.ClientSession]
+        self._save_lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.failures = 0
+        self._load()
+
+    def _load(self):
+        if not os.path.exists(self.table_path):
+            return
+        try:
+            with open(self.table_path, 'r', encoding='utf-8') as f:
+                self._table = OrderedDict(json.load(f))
+            logger.info(f"[物品图标] 已加载 {len(self._table)} 个图标链接")
+        except (OSError, ValueError) as e:
+            logger.error(f"[物品图标] 映射表读取失败，将重新建立: {e}")
+
+    def _save(self, snapshot: dict):
+        tmp_path = self.table_path + '.tmp'
+        with self._save_lock:
+            try:
+                os.makedirs(os.path.dirname(self.table_path) or '.', exist_ok=True)
+                with open(tmp_path, 'w', encoding='utf-8') as f:
+                    json.dump(snapshot, f, ensure_ascii=False)
+                os.replace(tmp_path, self.table_path)
+            except OSError as e:
+                logger.error(f"[物品图标] 映射表保存失败: {e}")
+
+    async def _download(self, source_url: str) -> str:
+        """下载图标到临时文件，返回文件路径"""
+        if self._session is None or self._session.closed:
+            # 独立会话：不携带机器人令牌等请求头访问第三方站点
+            self._session = aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=10),
+                                                  trace_configs=self.trace_configs)
+        async with self._session.get(source_url) as resp:
+            if resp.status != 200:
+                raise ValueError(f"图标下载失败，状态码: {resp.status}")
+            data = await resp.read()
+        suffix = os.path.splitext(source_url)[1] or '.png'
+        fd, path = tempfile.mkstemp(prefix='ff14_icon_', suffix=suffix)
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        return path
+
+    async def _mirror(self, key: str, source_url: str) -> str:
+        path = await self._download(source_url)
+        try:
+            url = await self._upload(path)
+        finally:
+            os.remove(path)
+        if not url:
+            raise ValueError("上传未返回链接")
+        self._table[key] = url
+        while len(self._table) > self.max_entries:
+            self._table.popitem(last=False)
+        await asyncio.get_running_loop().run_in_executor(None, self._save, dict(self._table))
+        return url
+
+    async def get_url(self, item_id, source_url: str) -> str:
+        """
+        返回物品图标的 KOOK 链接；镜像失败时退回 cafemaker 原链接，保证卡片仍能显示图片
+        """
+        key = str(item_id)
+        url = self._table.get(key)
+        if url:
+            self._table.move_to_end(key)
+            self.hits += 1
+            return url
+
+        pending = self._inflight.get(key)
+        if pending is not None:
+            return await asyncio.shield(pending)
+        self.misses += 1
+        pending = asyncio.get_running_loop().create_future()
+        self._inflight[key] = pending
+        try:
+            url = await self._mirror(key, source_url)
+        except asyncio.CancelledError:
+            pending.cancel()
+            raise
+        except Exception as e:
+            self.failures += 1
+            logger.warning(f"[物品图标] 物品 {key} 图标镜像失败，使用原链接: {e}")
+            url = source_url
+        finally:
+            self._inflight.pop(key, None)
+        if not pending.done():
+            pending.set_result(url)
+        return url
+
+    def stats(self) -> dict:
+        return {'icons': len(self._table), 'hits': self.hits, 'misses': self.misses, 'failures': self.failures}
+
+    async def close(self):
+        if self._session and not self._session.closed:
+            await self._session.close()
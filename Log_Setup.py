@@ -0,0 +1,173 @@
+import atexit
+import contextvars
+import datetime
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import threading
+import time
+from typing import Dict, Optional, Tuple
+
+# 当前正在处理的指令与服务器，由消息入口/指令路由设置，写入每条日志
+command_var = contextvars.ContextVar('command', default=None)  # type: contextvars.ContextVar[Optional[str]]
+guild_var = contextvars.ContextVar('guild', default=None)  # type: contextvars.ContextVar[Optional[str]]
+
+CONSOLE_FORMAT = '%(asctime)s.%(msecs)03d [%(levelname)s] %(name)s: %(message)s'
+CONSOLE_DATEFMT = '%Y-%m-%d %H:%M:%S'
+DEFAULT_LEVELS = "aiohttp=WARNING,khl=WARNING"
+
+
+class ContextFilter(logging.Filter):
+    """在产生日志的线程中读取上下文变量，附加到记录上（记录入队后再读就拿不到了）"""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.command = command_var.get()
+        record.guild = guild_var.get()
+        return True
+
+
+class RateLimitFilter(logging.Filter):
+    """
+    按 (logger, 消息模板) 限流：每个窗口内同类消息最多输出 burst 次，其余丢弃并计数，
+    下一次放行时在消息末尾注明期间被抑制的条数。WARNING 以上级别不受限制
+
+    %-格式的日志以格式串为模板；f-string 日志以开头的 [标签] 为模板
+    """
+
+    def __init__(self, burst: int = 20, window: float = 60.0, max_keys: int = 1024):
+        super().__init__()
+        self.burst = burst
+        self.window = window
+        self.max_keys = max_keys
+        self._lock = threading.Lock()
+        self._counters = {}  # type: Dict[Tuple[str, str], list]  # key -> [窗口开始时刻, 已输出数, 已抑制数]
+
+    @staticmethod
+    def _template(record: logging.LogRecord) -> str:
+        msg = str(record.msg)
+        if record.args:
+            return msg
+        if msg.startswith('[') and ']' in msg[:24]:
+            return msg[:msg.index(']') + 1]
+        return msg[:32]
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING:
+            return True
+        key = (record.name, self._template(record))
+        now = time.monotonic()
+        with self._lock:
+            counter = self._counters.get(key)
+            if counter is None or now - counter[0] >= self.window:
+                suppressed = counter[2] if counter else 0
+                if counter is None and len(self._counters) >= self.max_keys:
+                    self._counters.clear()
+                self._counters[key] = [now, 1, 0]
+                if suppressed:
+                    record.msg = f"{record.getMessage()}（上一窗口内 {suppressed} 条同类日志已省略）"
+                    record.args = None
+                return True
+            if counter[1] < self.burst:
+                counter[1] += 1
+                return True
+            counter[2] += 1
+            return False
+
+
+class JsonFormatter(logging.Formatter):
+    """每条日志一行 JSON"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            'ts': datetime.datetime.fromtimestamp(record.created).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'msg': record.getMessage(),
+        }
+        command = getattr(record, 'command', None)
+        guild = getattr(record, 'guild', None)
+        if command:
+            entry['command'] = command
+        if guild:
+            entry['guild'] = guild
+        if record.exc_info:
+            entry['exc'] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry['exc'] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False)
+
+
+class _PreparedQueueHandler(logging.handlers.QueueHandler):
+    """入队前只合并消息参数、预先格式化异常，保留 command/guild 等附加字段供后台线程格式化"""
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+def _level(name: str, default: int = logging.INFO) -> int:
+    level = logging.getLevelName(name.strip().upper())
+    return level if isinstance(level, int) else default
+
+
+def parse_levels(spec: str) -> Dict[str, int]:
+    """解析 "aiohttp=WARNING,Loop_Watchdog=INFO" 形式的按 logger 日志级别配置"""
+    levels = {}
+    for item in spec.split(','):
+        name, _, level = item.strip().partition('=')
+        if name and level:
+            levels[name.strip()] = _level(level)
+    return levels
+
+
+def setup_logging(log_dir: str = 'logs') -> logging.handlers.QueueListener:
+    """
+    配置非阻塞日志：所有 logger 只把记录放入内存队列，由后台线程写控制台与滚动文件
+
+    环境变量:
+        LOG_LEVEL: 根日志级别（默认 INFO）
+        LOG_LEVELS: 按 logger 的级别，如 "aiohttp=WARNING,Voice_Session=DEBUG"
+        LOG_FILE: 日志文件路径（默认 logs/bot.jsonl）
+        LOG_ROTATE: 按时间滚动的周期（如 midnight、H），未设置时按大小滚动
+        LOG_MAX_BYTES / LOG_BACKUPS: 单个文件大小上限与保留份数
+    """
+    log_file = os.getenv('LOG_FILE') or os.path.join(log_dir, 'bot.jsonl')
+    os.makedirs(os.path.dirname(log_file) or '.', exist_ok=True)
+    backups = int(os.getenv('LOG_BACKUPS', '5'))
+    rotate_when = os.getenv('LOG_ROTATE')
+    if rotate_when:
+        file_handler = logging.handlers.TimedRotatingFileHandler(
+            log_file, when=rotate_when, backupCount=backups, encoding='utf-8')
+    else:
+        file_handler = logging.handlers.RotatingFileHandler(
+            log_file, maxBytes=int(os.getenv('LOG_MAX_BYTES', str(10 * 1024 * 1024))),
+            backupCount=backups, encoding='utf-8')
+    file_handler.setFormatter(JsonFormatter())
+    console_handler = logging.StreamHandler()
+    console_handler.setFormatter(logging.Formatter(CONSOLE_FORMAT, datefmt=CONSOLE_DATEFMT))
+
+    log_queue = queue.SimpleQueue()
+    queue_handler = _PreparedQueueHandler(log_queue)
+    queue_handler.addFilter(ContextFilter())
+    queue_handler.addFilter(RateLimitFilter())
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+    root.setLevel(_level(os.getenv('LOG_LEVEL', 'INFO')))
+    levels = parse_levels(DEFAULT_LEVELS)
+    levels.update(parse_levels(os.getenv('LOG_LEVELS', '')))
+    for name, level in levels.items():
+        logging.getLogger(name).setLevel(level)
+
+    listener = logging.handlers.QueueListener(log_queue, console_handler, file_handler, respect_handler_level=True)
+    listener.start()
+    atexit.register(listener.stop)  # 退出前写完队列中剩余的日志
+    return listener
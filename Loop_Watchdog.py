@@ -0,0 +1,99 @@
+import asyncio
+import logging
+import sys
+import threading
+import time
+import traceback
+from typing import Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class LoopWatchdog:
+    """
+    事件循环卡顿监测
+
+    心跳任务每 interval 秒在事件循环中记录一次时间，并以实际间隔减去 interval 作为循环延迟；
+    独立的监测线程发现心跳超过 threshold 未更新时，抓取事件循环所在线程的调用栈并记录日志，
+    连同正在处理的指令一起输出，用于定位阻塞调用。每次卡顿只报告一次
+    """
+
+    def __init__(self, threshold: float = 0.5, interval: float = 0.25,
+                 describe: Optional[Callable[[], str]] = None, stack_limit: int = 20):
+        """
+        参数:
+            threshold (float): 心跳超过多少秒未更新视为卡顿
+            interval (float): 心跳间隔（秒）
+            describe: 返回当前正在处理的工作描述（如进行中的指令），卡顿时写入日志
+            stack_limit (int): 日志中保留的调用栈帧数
+        """
+        self.threshold = threshold
+        self.interval = interval
+        self.describe = describe
+        self.stack_limit = stack_limit
+        self.last_lag = 0.0  # 最近一次心跳的循环延迟（秒）
+        self.max_lag = 0.0
+        self.stalls = 0
+        self._beat = time.monotonic()
+        self._loop_thread = None  # type: Optional[int]
+        self._task = None  # type: Optional[asyncio.Task]
+        self._thread = None  # type: Optional[threading.Thread]
+        self._stop = threading.Event()
+
+    def start(self):
+        """在事件循环中调用：启动心跳任务和监测线程"""
+        if self._task is not None:
+            return
+        self._loop_thread = threading.get_ident()
+        self._beat = time.monotonic()
+        self._stop.clear()
+        self._task = asyncio.create_task(self._heartbeat())
+        self._thread = threading.Thread(target=self._monitor, name="loop-watchdog", daemon=True)
+        self._thread.start()
+
+    async def _heartbeat(self):
+        while True:
+            expected = time.monotonic() + self.interval
+            await asyncio.sleep(self.interval)
+            now = time.monotonic()
+            self.last_lag = max(0.0, now - expected)
+            self.max_lag = max(self.max_lag, self.last_lag)
+            self._beat = now
+
+    def _monitor(self):
+        reported = None  # 已报告过的心跳时刻，同一次卡顿只报告一次
+        while not self._stop.wait(self.interval):
+            beat = self._beat
+            stalled = time.monotonic() - beat
+            if stalled < self.threshold + self.interval or beat == reported:
+                continue
+            reported = beat
+            self.stalls += 1
+            self._report(stalled)
+
+    def _report(self, stalled: float):
+        frame = sys._current_frames().get(self._loop_thread)
+        stack = ''.join(traceback.format_stack(frame, limit=-self.stack_limit)) if frame else '（无法获取调用栈）'
+        activity = ''
+        if self.describe is not None:
+            try:
+                activity = self.describe()
+            except Exception as e:
+                activity = f"（获取失败: {e}）"
+        logger.warning(f"[循环监测] 事件循环已阻塞 {stalled:.2f}s，进行中: {activity or '无'}\n{stack}")
+
+    def stats(self) -> dict:
+        return {
+            'last_lag_ms': round(self.last_lag * 1000, 1),
+            'max_lag_ms': round(self.max_lag * 1000, 1),
+            'stalls': self.stalls,
+        }
+
+    def stop(self):
+        self._stop.set()
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        if self._thread is not None:
+            self._thread.join(timeout=1)
+            self._thread = None
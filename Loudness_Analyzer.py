@@ -0,0 +1,120 @@
+import json
+import logging
+import os
+import re
+import subprocess
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+
+class LoudnessAnalyzer:
+    """
+    后台响度分析与增益表
+
+    每首歌（按歌曲ID）在首次播放或预取时用 FFmpeg ebur128 滤镜在后台线程测量一次综合响度(LUFS)，
+    结果持久化到小型 JSON 表；之后播放时直接换算成固定线性增益，不增加额外编码遍数和启动延迟。
+    """
+
+    TARGET_LUFS = -20.0  # 目标响度，约等于原 volume=0.5 作用于常见 -14 LUFS 母带后的水平
+    MIN_GAIN_DB = -15.0
+    MAX_GAIN_DB = 9.0  # 限制提升幅度，避免安静曲目的底噪被过度放大
+    DEFAULT_FILTER = 'volume=0.5'  # 尚未测量时沿用原有固定音量
+
+    _INTEGRATED_RE = re.compile(r'I:\s+(-?\d+(?:\.\d+)?)\s+LUFS')
+
+    def __init__(self, table_path: str, ffmpeg: str = 'ffmpeg', max_entries: int = 5000, max_workers: int = 1):
+        """
+        参数:
+            table_path (str): 响度表 JSON 文件路径
+            ffmpeg (str): FFmpeg 可执行文件
+            max_entries (int): 响度表条目上限，超出时淘汰最早写入的条目
+            max_workers (int): 后台分析线程数，默认 1 以免与推流编码争抢 CPU
+        """
+        self.table_path = table_path
+        self.ffmpeg = ffmpeg
+        self.max_entries = max_entries
+        self._table = OrderedDict()  # song_id(str) -> integrated LUFS
+        self._pending = set()
+        self._failed = set()  # 本次运行中分析失败的歌曲，不再重复尝试
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="loudness")
+        self._load()
+
+    def _load(self):
+        if not os.path.exists(self.table_path):
+            return
+        try:
+            with open(self.table_path, 'r', encoding='utf-8') as f:
+                self._table = OrderedDict(json.load(f))
+            logger.info(f"[响度分析] 已加载 {len(self._table)} 条响度记录")
+        except (OSError, ValueError) as e:
+            logger.error(f"[响度分析] 响度表读取失败，将重新建立: {e}")
+            self._table = OrderedDict()
+
+    def _save(self):
+        """先写临时文件再替换，避免写入中途退出导致表损坏"""
+        tmp_path = self.table_path + '.tmp'
+        with self._lock:
+            snapshot = dict(self._table)
+        try:
+            os.makedirs(os.path.dirname(self.table_path) or '.', exist_ok=True)
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(snapshot, f, ensure_ascii=False)
+            os.replace(tmp_path, self.table_path)
+        except OSError as e:
+            logger.error(f"[响度分析] 响度表保存失败: {e}")
+
+    def get_lufs(self, song_id) -> Optional[float]:
+        return self._table.get(str(song_id))
+
+    def get_filter(self, song_id) -> str:
+        """返回播放该歌曲时使用的音量滤镜，未测量过的歌曲使用默认音量"""
+        lufs = self.get_lufs(song_id)
+        if lufs is None:
+            return self.DEFAULT_FILTER
+        gain_db = min(self.MAX_GAIN_DB, max(self.MIN_GAIN_DB, self.TARGET_LUFS - lufs))
+        return f'volume={10 ** (gain_db / 20):.4f}'
+
+    def schedule(self, song_id, stream_url: str):
+        """提交后台分析任务；已测量、排队中或已失败的歌曲直接跳过"""
+        key = str(song_id)
+        with self._lock:
+            if key in self._table or key in self._pending or key in self._failed:
+                return
+            self._pending.add(key)
+        self._executor.submit(self._analyze, key, stream_url)
+
+    def _analyze(self, key: str, stream_url: str):
+        cmd = [
+            self.ffmpeg, '-hide_banner', '-nostats', '-threads', '1',
+            '-i', stream_url, '-map', '0:a:0',
+            '-af', 'ebur128=framelog=quiet', '-f', 'null', '-'
+        ]
+        try:
+            result = subprocess.run(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+                                    text=True, errors='replace', timeout=300)
+            matches = self._INTEGRATED_RE.findall(result.stderr or '')
+            if result.returncode != 0 or not matches:
+                raise ValueError(f"返回码 {result.returncode}，未解析到综合响度")
+            lufs = float(matches[-1])  # 最后一次输出为全曲汇总值
+        except (OSError, ValueError, subprocess.SubprocessError) as e:
+            logger.warning(f"[响度分析] 歌曲 {key} 分析失败: {e}")
+            with self._lock:
+                self._pending.discard(key)
+                self._failed.add(key)
+            return
+
+        with self._lock:
+            self._pending.discard(key)
+            self._table[key] = lufs
+            while len(self._table) > self.max_entries:
+                self._table.popitem(last=False)
+        logger.info(f"[响度分析] 歌曲 {key} 综合响度 {lufs:.1f} LUFS，增益滤镜 {self.get_filter(key)}")
+        self._save()
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,109 @@
+import logging
+import time
+from typing import Dict, Optional, Set
+
+from Music_Cache import LRUCache
+
+logger = logging.getLogger(__name__)
+
+COMMAND = 'command'
+CHAT = 'chat'
+
+
+class ChannelInterest:
+    """
+    频道关注表：各功能登记自己需要接收普通聊天的频道
+
+    例如猜选手游戏开局时登记频道、结束时注销；没有任何功能关注的频道，其聊天消息直接丢弃
+    """
+
+    def __init__(self):
+        self._channels = {}  # type: Dict[str, Set[str]]  # 频道ID -> 关注该频道的功能名
+
+    def __contains__(self, channel_id: str) -> bool:
+        return channel_id in self._channels
+
+    def __len__(self):
+        return len(self._channels)
+
+    def watch(self, channel_id: str, feature: str):
+        self._channels.setdefault(channel_id, set()).add(feature)
+
+    def unwatch(self, channel_id: str, feature: str):
+        features = self._channels.get(channel_id)
+        if features is None:
+            return
+        features.discard(feature)
+        if not features:
+            del self._channels[channel_id]
+
+
+class MessageIntake:
+    """
+    消息入口预过滤
+
+    按开销从低到高依次判断：指令前缀 -> 频道是否被关注 -> 机器人/自身消息 -> 消息ID去重；
+    绝大多数无关聊天在第一次字典查找后即被丢弃，只有可能需要处理的消息才交给后续逻辑
+    """
+
+    def __init__(self, prefix: str = '/', dedup_size: int = 4096, dedup_ttl: float = 300.0):
+        """
+        参数:
+            prefix (str): 指令前缀
+            dedup_size (int): 去重表保存的最近消息ID数量
+            dedup_ttl (float): 消息ID在去重表中保留的秒数（覆盖网关重连后的重放窗口）
+        """
+        self.prefix = prefix
+        self.interest = ChannelInterest()
+        self.self_id = None  # type: Optional[str]  # 机器人自身用户ID，启动后填入
+        self._seen = LRUCache(max_size=dedup_size, ttl=dedup_ttl, name="message_ids")
+        self.started_at = time.monotonic()
+        self.filter_seconds = 0.0  # 过滤阶段累计耗时
+        self.received = 0
+        self.commands = 0
+        self.chats = 0
+        self.dropped = {'no_interest': 0, 'bot': 0, 'duplicate': 0}
+
+    def classify(self, msg, content: str) -> Optional[str]:
+        """返回 COMMAND / CHAT，需要丢弃的消息返回 None；content 为去掉首尾空白后的消息文本"""
+        started = time.perf_counter()
+        self.received += 1
+        try:
+            if content.startswith(self.prefix):
+                kind = COMMAND
+            elif msg.ctx.channel.id in self.interest:
+                kind = CHAT
+            else:
+                self.dropped['no_interest'] += 1
+                return None
+
+            author = msg.author
+            if getattr(author, 'bot', False) or author.id == self.self_id:
+                self.dropped['bot'] += 1
+                return None
+
+            if msg.id in self._seen:
+                self.dropped['duplicate'] += 1
+                return None
+            self._seen.set(msg.id, True)
+
+            if kind is COMMAND:
+                self.commands += 1
+            else:
+                self.chats += 1
+            return kind
+        finally:
+            self.filter_seconds += time.perf_counter() - started
+
+    def stats(self) -> dict:
+        elapsed = max(time.monotonic() - self.started_at, 1e-9)
+        return {
+            'received': self.received,
+            'commands': self.commands,
+            'chats': self.chats,
+            'dropped': dict(self.dropped),
+            'interested_channels': len(self.interest),
+            'msgs_per_sec': round(self.received / elapsed, 2),
+            # 过滤阶段单核每秒可处理的消息数
+            'filter_capacity_per_sec': round(self.received / self.filter_seconds) if self.filter_seconds else 0,
+        }
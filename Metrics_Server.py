@@ -0,0 +1,185 @@
+import bisect
+import logging
+import time
+from typing import Callable, Dict, Iterable, Optional, Tuple
+from urllib.parse import urlsplit
+
+import aiohttp
+from aiohttp import web
+
+logger = logging.getLogger(__name__)
+
+PREFIX = "chadbot_"
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+# 主机名后缀 -> 上游名称
+UPSTREAMS = (
+    ("kaiheila.cn", "kook"),
+    ("kookapp.cn", "kook"),
+    ("music.163.com", "netease"),
+    ("universalis.app", "universalis"),
+    ("cafemaker.wakingsands.com", "cafemaker"),
+)
+
+Labels = Tuple[Tuple[str, str], ...]
+# 采集函数：返回 (指标名, 标签, 数值) 序列，在每次抓取时调用
+Collector = Callable[[], Iterable[Tuple[str, dict, float]]]
+
+
+def upstream_name(host: Optional[str]) -> str:
+    host = (host or "").lower()
+    for suffix, name in UPSTREAMS:
+        if host == suffix or host.endswith("." + suffix):
+            return name
+    return "other"
+
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(labels: Labels, extra: str = "") -> str:
+    parts = [f'{key}="{_escape(value)}"' for key, value in labels]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+class Histogram:
+    __slots__ = ('buckets', 'counts', 'sum', 'count')
+
+    def __init__(self, buckets: Tuple[float, ...]):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)  # 每个区间（非累计）的样本数，输出时再累加
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        index = bisect.bisect_left(self.buckets, value)
+        if index < len(self.counts):
+            self.counts[index] += 1
+        self.sum += value
+        self.count += 1
+
+
+class MetricsRegistry:
+    """
+    进程内指标表，按 Prometheus 文本格式输出
+
+    直方图与计数器在事件发生时更新（一次字典查找 + 一次二分查找）；
+    缓存命中率、会话数等状态类指标由采集函数在抓取时现算，不在热路径上维护
+    """
+
+    def __init__(self, buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self._histograms = {}  # type: Dict[str, Dict[Labels, Histogram]]
+        self._counters = {}  # type: Dict[str, Dict[Labels, float]]
+        self._collectors = []  # type: list
+
+    def observe(self, name: str, value: float, **labels):
+        series = self._histograms.setdefault(name, {})
+        key = tuple(sorted(labels.items()))
+        histogram = series.get(key)
+        if histogram is None:
+            histogram = series[key] = Histogram(self.buckets)
+        histogram.observe(value)
+
+    def inc(self, name: str, amount: float = 1, **labels):
+        series = self._counters.setdefault(name, {})
+        key = tuple(sorted(labels.items()))
+        series[key] = series.get(key, 0) + amount
+
+    def add_collector(self, collector: Collector):
+        self._collectors.append(collector)
+
+    def observe_command(self, command: str, seconds: float, outcome: str):
+        """指令路由的完成回调"""
+        self.observe("command_seconds", seconds, command=command)
+        self.inc("commands_total", command=command, outcome=outcome)
+
+    def observe_upstream(self, upstream: str, seconds: float, status: Optional[int]):
+        """上游请求完成回调；status 为 None 表示连接异常等未拿到响应的失败"""
+        self.observe("upstream_request_seconds", seconds, upstream=upstream)
+        result = "error" if status is None or status >= 400 else "ok"
+        self.inc("upstream_requests_total", upstream=upstream, result=result)
+
+    def observe_url(self, url: str, seconds: float, status: Optional[int]):
+        self.observe_upstream(upstream_name(urlsplit(url).hostname), seconds, status)
+
+    def render(self) -> str:
+        lines = []
+        for name, series in self._histograms.items():
+            lines.append(f"# TYPE {PREFIX}{name} histogram")
+            for labels, histogram in series.items():
+                cumulative = 0
+                for bound, count in zip(histogram.buckets, histogram.counts):
+                    cumulative += count
+                    bucket_labels = _format_labels(labels, 'le="%s"' % bound)
+                    lines.append(f"{PREFIX}{name}_bucket{bucket_labels} {cumulative}")
+                bucket_labels = _format_labels(labels, 'le="+Inf"')
+                lines.append(f"{PREFIX}{name}_bucket{bucket_labels} {histogram.count}")
+                lines.append(f"{PREFIX}{name}_sum{_format_labels(labels)} {histogram.sum}")
+                lines.append(f"{PREFIX}{name}_count{_format_labels(labels)} {histogram.count}")
+        for name, series in self._counters.items():
+            lines.append(f"# TYPE {PREFIX}{name} counter")
+            for labels, value in series.items():
+                lines.append(f"{PREFIX}{name}{_format_labels(labels)} {value}")
+
+        gauges = {}  # type: Dict[str, list]
+        for collector in self._collectors:
+            try:
+                for name, labels, value in collector():
+                    gauges.setdefault(name, []).append((tuple(sorted(labels.items())), value))
+            except Exception as e:
+                logger.warning(f"[指标] 采集失败: {e}")
+        for name, samples in gauges.items():
+            lines.append(f"# TYPE {PREFIX}{name} gauge")
+            for labels, value in samples:
+                lines.append(f"{PREFIX}{name}{_format_labels(labels)} {value}")
+        return "\n".join(lines) + "\n"
+
+
+def upstream_trace_config(registry: MetricsRegistry) -> aiohttp.TraceConfig:
+    """aiohttp 请求耗时与结果钩子，挂到 ClientSession(trace_configs=[...]) 上即可按上游统计"""
+
+    async def on_request_start(_session, context, _params):
+        context.started = time.monotonic()
+
+    async def on_request_end(_session, context, params):
+        registry.observe_upstream(upstream_name(params.url.host), time.monotonic() - context.started,
+                                  params.response.status)
+
+    async def on_request_exception(_session, context, params):
+        registry.observe_upstream(upstream_name(params.url.host), time.monotonic() - context.started, None)
+
+    trace_config = aiohttp.TraceConfig()
+    trace_config.on_request_start.append(on_request_start)
+    trace_config.on_request_end.append(on_request_end)
+    trace_config.on_request_exception.append(on_request_exception)
+    return trace_config
+
+
+class MetricsServer:
+    """仅监听本机地址的 /metrics 接口，供 Prometheus 抓取"""
+
+    def __init__(self, registry: MetricsRegistry, port: int, host: str = "127.0.0.1"):
+        self.registry = registry
+        self.host = host
+        self.port = port
+        self._runner = None  # type: Optional[web.AppRunner]
+
+    async def _handle(self, _request: web.Request) -> web.Response:
+        return web.Response(body=self.registry.render().encode("utf-8"),
+                            headers={"Content-Type": "text/plain; version=0.0.4; charset=utf-8"})
+
+    async def start(self):
+        app = web.Application()
+        app.router.add_get("/metrics", self._handle)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, self.host, self.port).start()
+        logger.info(f"[指标] 指标接口已启动: http://{self.host}:{self.port}/metrics")
+
+    async def stop(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
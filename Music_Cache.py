@@ -0,0 +1,128 @@
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional, Union
+
+
+class LRUCache:
+    """有界 LRU 缓存，支持条目过期时间与命中率统计"""
+
+    def __init__(self, max_size: int = 256, ttl: Optional[float] = None, name: str = "cache"):
+        """
+        参数:
+            max_size (int): 最大条目数，超出时淘汰最久未使用的条目
+            ttl (float): 默认过期秒数，None 表示不过期
+            name (str): 缓存名称，用于统计输出
+        """
+        self.max_size = max_size
+        self.ttl = ttl
+        self.name = name
+        self._data = OrderedDict()  # key -> (value, 过期时刻 monotonic)
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        entry = self._data.get(key)
+        if entry is None:
+            self.misses += 1
+            return default
+        value, expire_at = entry
+        if expire_at is not None and expire_at <= time.monotonic():
+            del self._data[key]
+            self.expirations += 1
+            self.misses += 1
+            return default
+        self._data.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None):
+        """写入条目，ttl 为 None 时使用缓存默认过期时间"""
+        ttl = self.ttl if ttl is None else ttl
+        expire_at = time.monotonic() + ttl if ttl is not None else None
+        self._data[key] = (value, expire_at)
+        self._data.move_to_end(key)
+        while len(self._data) > self.max_size:
+            self._data.popitem(last=False)
+            self.evictions += 1
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        entry = self._data.pop(key, None)
+        return entry[0] if entry is not None else default
+
+    def clear(self):
+        self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, key):
+        entry = self._data.get(key)
+        return entry is not None and (entry[1] is None or entry[1] > time.monotonic())
+
+    def stats(self) -> Dict[str, Union[str, int, float]]:
+        lookups = self.hits + self.misses
+        return {
+            'name': self.name,
+            'size': len(self._data),
+            'max_size': self.max_size,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_ratio': round(self.hits / lookups, 4) if lookups else 0.0,
+            'evictions': self.evictions,
+            'expirations': self.expirations,
+        }
+
+
+class MusicCache:
+    """
+    网易云音乐两级缓存
+
+    第一级：规范化的搜索词 -> 歌曲信息(id/title/artist)，长时间有效
+    第二级：歌曲ID -> 播放链接，按接口返回的链接有效期(expi)过期
+    """
+
+    DEFAULT_URL_EXPIRE = 1200  # 接口未返回 expi 时的默认链接有效期（秒）
+
+    def __init__(self, search_size=1024, search_ttl=7 * 24 * 3600, url_size=256, url_margin=60):
+        """
+        参数:
+            search_size (int): 搜索结果缓存条目上限
+            search_ttl (float): 搜索结果有效期（秒）
+            url_size (int): 播放链接缓存条目上限
+            url_margin (float): 播放链接提前失效的安全余量（秒），避免推流途中链接过期
+        """
+        self.search = LRUCache(max_size=search_size, ttl=search_ttl, name="music_search")
+        self.urls = LRUCache(max_size=url_size, name="music_url")
+        self.url_margin = url_margin
+
+    @staticmethod
+    def normalize_query(query: str) -> str:
+        """忽略大小写与多余空白，使 "晴天 周杰伦" 与 " 晴天  周杰伦" 命中同一条目"""
+        return " ".join(query.casefold().split())
+
+    def get_song(self, query: str) -> Optional[Dict[str, Union[str, int]]]:
+        return self.search.get(self.normalize_query(query))
+
+    def put_song(self, query: str, song: Dict[str, Union[str, int]]):
+        self.search.set(self.normalize_query(query), song)
+
+    def get_url(self, song_id: int) -> Optional[str]:
+        return self.urls.get(song_id)
+
+    def put_url(self, song_id: int, url: str, expires_in: Optional[float] = None):
+        """按链接剩余有效期写入，剩余时间不足安全余量时不缓存"""
+        ttl = (expires_in or self.DEFAULT_URL_EXPIRE) - self.url_margin
+        if ttl > 0:
+            self.urls.set(song_id, url, ttl=ttl)
+
+    def invalidate_url(self, song_id: int):
+        """播放失败时移除可能已失效的链接"""
+        self.urls.pop(song_id)
+
+    def stats(self) -> Dict[str, Dict[str, Union[str, int, float]]]:
+        return {
+            'search': self.search.stats(),
+            'url': self.urls.stats(),
+        }
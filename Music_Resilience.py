@@ -0,0 +1,185 @@
+import asyncio
+import json
+import logging
+import random
+import time
+from typing import Awaitable, Callable, Optional, TypeVar
+
+import aiohttp
+
+T = TypeVar('T')
+
+logger = logging.getLogger(__name__)
+
+
+# ---------------------- 音乐接口异常类型 ----------------------
+class MusicAPIError(ValueError):
+    """音乐接口异常基类（继承 ValueError 以兼容原有的 except ValueError 处理）"""
+    user_message = "❌ 播放失败"
+
+    def __init__(self, message: str = None):
+        super().__init__(message or self.user_message)
+
+
+class PermanentMusicError(MusicAPIError):
+    """确定性失败，重试也不会成功（付费、下架、无结果等）"""
+
+
+class TransientMusicError(MusicAPIError):
+    """临时性失败，可退避后重试（网络异常、超时、5xx 等）"""
+    user_message = "⚠️ 网络请求失败，请稍后重试"
+
+
+class SongNotFoundError(PermanentMusicError):
+    user_message = "❌ 未找到匹配的歌曲"
+
+
+class SongPaidError(PermanentMusicError):
+    user_message = "❌ 歌曲需要付费，暂无法播放"
+
+
+class SongUnavailableError(PermanentMusicError):
+    user_message = "❌ 歌曲不存在或已下架"
+
+
+class NoPlayableUrlError(PermanentMusicError):
+    user_message = "❌ 该歌曲暂无免费播放资源"
+
+
+class MalformedResponseError(PermanentMusicError):
+    """接口返回的数据结构与预期不符（缺字段、类型不对），重试得到的仍是同样的数据"""
+    user_message = "❌ 音乐接口返回数据异常"
+
+
+class MusicAPIStatusError(TransientMusicError):
+    """接口返回非 200 状态码"""
+
+    def __init__(self, message: str, status: int):
+        super().__init__(message)
+        self.status = status
+
+
+class CircuitOpenError(MusicAPIError):
+    """熔断器打开期间直接失败，不再请求上游"""
+    user_message = "⚠️ 音乐服务暂时不可用，请稍后再试"
+
+
+def classify_exception(exc: Exception) -> Optional[MusicAPIError]:
+    """
+    将异常归类为永久/临时错误
+
+    网络异常、超时、响应体不完整可重试；缺字段、类型不符等数据结构问题视为永久错误；
+    其余异常多为代码缺陷，返回 None，由调用方原样抛出，不重试也不计入熔断
+    """
+    if isinstance(exc, MusicAPIError):
+        return exc
+    if isinstance(exc, (aiohttp.ClientError, asyncio.TimeoutError, ConnectionError, json.JSONDecodeError)):
+        return TransientMusicError(f"接口请求异常: {exc!r}")
+    if isinstance(exc, (KeyError, IndexError, TypeError, ValueError)):
+        return MalformedResponseError(f"接口数据异常: {exc!r}")
+    return None
+
+
+def status_error(prefix: str, status: int) -> MusicAPIError:
+    """按状态码构造异常：429 与 5xx 可重试，其余 4xx 视为永久错误"""
+    message = f"{prefix}，状态码: {status}"
+    if status == 429 or status >= 500:
+        return MusicAPIStatusError(message, status)
+    return PermanentMusicError(message)
+
+
+# ---------------------- 熔断器 ----------------------
+class CircuitBreaker:
+    """
+    简单的三态熔断器
+
+    CLOSED: 正常放行，连续临时失败达到阈值后转为 OPEN
+    OPEN: 直接抛出 CircuitOpenError，冷却时间结束后转为 HALF_OPEN
+    HALF_OPEN: 仅放行一个探测请求，成功则恢复 CLOSED，失败则重新 OPEN
+    """
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0, name: str = "breaker"):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.name = name
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._probe_in_flight = False
+        self.rejected = 0  # 熔断期间被拒绝的请求数
+
+    def before_call(self):
+        if self.state == self.OPEN:
+            if time.monotonic() - self.opened_at < self.reset_timeout:
+                self.rejected += 1
+                raise CircuitOpenError()
+            self.state = self.HALF_OPEN
+            logger.info(f"[熔断器:{self.name}] 冷却结束，进入半开状态探测恢复")
+        if self.state == self.HALF_OPEN:
+            if self._probe_in_flight:
+                self.rejected += 1
+                raise CircuitOpenError()
+            self._probe_in_flight = True
+
+    def record_success(self):
+        if self.state != self.CLOSED:
+            logger.info(f"[熔断器:{self.name}] 探测成功，恢复正常")
+        self.state = self.CLOSED
+        self.failures = 0
+        self._probe_in_flight = False
+
+    def release_probe(self):
+        """探测请求被取消时释放名额，避免半开状态永久阻塞"""
+        self._probe_in_flight = False
+
+    def record_failure(self):
+        self._probe_in_flight = False
+        self.failures += 1
+        if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+            if self.state != self.OPEN:
+                logger.warning(f"[熔断器:{self.name}] 连续失败 {self.failures} 次，熔断 {self.reset_timeout} 秒")
+            self.state = self.OPEN
+            self.opened_at = time.monotonic()
+
+
+# ---------------------- 分类重试 ----------------------
+def _reraise(error: MusicAPIError, original: Exception):
+    if error is original:
+        raise error
+    raise error from original
+
+
+async def call_with_retry(func: Callable[[], Awaitable[T]], breaker: CircuitBreaker,
+                          attempts: int = 3, base_delay: float = 0.5, max_delay: float = 5.0) -> T:
+    """
+    经熔断器调用 func，仅对临时错误做指数退避重试（full jitter）
+
+    永久错误立即抛出且不计入熔断失败次数（说明上游服务本身是可用的）
+    """
+    for attempt in range(attempts):
+        breaker.before_call()
+        try:
+            result = await func()
+        except asyncio.CancelledError:
+            breaker.release_probe()
+            raise
+        except Exception as e:
+            error = classify_exception(e)
+            if error is None:
+                breaker.release_probe()
+                raise
+            if isinstance(error, PermanentMusicError):
+                breaker.record_success()
+                _reraise(error, e)
+            breaker.record_failure()
+            if attempt == attempts - 1:
+                _reraise(error, e)
+            delay = random.uniform(0, min(max_delay, base_delay * (2 ** attempt)))
+            logger.warning(f"[重试] 第 {attempt + 1} 次失败: {error}，{delay:.2f} 秒后重试")
+            await asyncio.sleep(delay)
+        else:
+            breaker.record_success()
+            return result
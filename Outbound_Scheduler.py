@@ -0,0 +1,234 @@
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import Awaitable, Callable, Deque, Dict, Mapping, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# request(route, payload) -> (HTTP 状态码, 响应头, 响应 JSON)
+RequestFunc = Callable[[str, dict], Awaitable[Tuple[int, Mapping[str, str], dict]]]
+
+
+class RouteLimit:
+    """
+    单个限速桶的状态，由 KOOK 响应头 X-Rate-Limit-Remaining / X-Rate-Limit-Reset 更新
+
+    两次响应之间按本地发出的请求数预扣 remaining，避免多个频道并发发送时超出配额
+    """
+
+    __slots__ = ('limit', 'remaining', 'reset_at')
+
+    def __init__(self):
+        self.limit = None  # type: Optional[int]
+        self.remaining = None  # type: Optional[int]
+        self.reset_at = 0.0
+
+    def delay(self, now: float) -> float:
+        if self.remaining is not None and self.remaining <= 0 and self.reset_at > now:
+            return self.reset_at - now
+        return 0.0
+
+    def consume(self):
+        if self.remaining is not None:
+            self.remaining -= 1
+
+    def update(self, headers: Mapping[str, str], now: float):
+        try:
+            if 'X-Rate-Limit-Limit' in headers:
+                self.limit = int(headers['X-Rate-Limit-Limit'])
+            if 'X-Rate-Limit-Remaining' in headers:
+                self.remaining = int(headers['X-Rate-Limit-Remaining'])
+            if 'X-Rate-Limit-Reset' in headers:
+                self.reset_at = now + float(headers['X-Rate-Limit-Reset'])
+        except ValueError:
+            pass
+        if self.reset_at <= now:
+            self.remaining = None  # 窗口已过，等待下一次响应头重新校准
+
+
+class TokenBucket:
+    """本地令牌桶：限制单个频道的发送速率"""
+
+    __slots__ = ('rate', 'capacity', 'tokens', 'updated_at')
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated_at = time.monotonic()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def delay(self, now: float) -> float:
+        self._refill(now)
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def take(self):
+        self.tokens -= 1
+
+
+class _Job:
+    __slots__ = ('route', 'payload', 'future', 'enqueued_at')
+
+    def __init__(self, route: str, payload: dict, future: asyncio.Future):
+        self.route = route
+        self.payload = payload
+        self.future = future
+        self.enqueued_at = time.monotonic()
+
+
+class OutboundScheduler:
+    """
+    KOOK 出站请求调度
+
+    每个频道一条 FIFO 队列、一个发送任务，保证同一频道内消息顺序；不同频道并发发送。
+    发送前同时检查频道令牌桶与接口限速桶（来自响应头），遇到 429 按 Reset 时间等待后重试。
+    频道队列清空后立即释放，内存只与当前有待发消息的频道数相关
+    """
+
+    def __init__(self, request: RequestFunc, channel_rate: float = 1.0, channel_burst: int = 5,
+                 max_attempts: int = 3, history: int = 500):
+        """
+        参数:
+            request: 发送请求并返回 (状态码, 响应头, 响应 JSON)
+            channel_rate (float): 单个频道每秒可发送的消息数
+            channel_burst (int): 单个频道可连续突发的消息数
+            max_attempts (int): 遇到 429 时的最大尝试次数
+        """
+        self._request = request
+        self.channel_rate = channel_rate
+        self.channel_burst = channel_burst
+        self.max_attempts = max_attempts
+        self._queues = {}  # type: Dict[str, Deque[_Job]]
+        self._workers = {}  # type: Dict[str, asyncio.Task]
+        self._channel_buckets = {}  # type: Dict[str, TokenBucket]
+        self._routes = {}  # type: Dict[str, RouteLimit]  # 限速桶名 -> 状态
+        self._route_buckets = {}  # type: Dict[str, str]  # 接口路径 -> 限速桶名（来自 X-Rate-Limit-Bucket）
+        self._global_until = 0.0
+        # 统计
+        self.sent = 0
+        self.failed = 0
+        self.rate_limited = 0
+        self.max_depth = 0
+        self._waits = deque(maxlen=history)  # 最近请求的排队等待时间（秒）
+
+    def enqueue(self, channel_id: str, route: str, payload: dict) -> asyncio.Future:
+        """加入频道队列后立即返回，Future 在发送完成时给出接口 data 字段"""
+        job = _Job(route, payload, asyncio.get_running_loop().create_future())
+        queue = self._queues.setdefault(channel_id, deque())
+        queue.append(job)
+        self.max_depth = max(self.max_depth, len(queue))
+        if channel_id not in self._workers:
+            self._workers[channel_id] = asyncio.create_task(self._drain(channel_id))
+        if len(self._channel_buckets) > 2 * len(self._queues) + 256:
+            self._prune_buckets()
+        return job.future
+
+    async def submit(self, channel_id: str, route: str, payload: dict) -> dict:
+        """加入频道队列并等待发送完成，返回接口 data 字段"""
+        return await self.enqueue(channel_id, route, payload)
+
+    async def _drain(self, channel_id: str):
+        queue = self._queues[channel_id]
+        try:
+            while queue:
+                job = queue.popleft()
+                if job.future.cancelled():
+                    continue
+                try:
+                    result = await self._send(channel_id, job)
+                except asyncio.CancelledError:
+                    job.future.cancel()
+                    raise
+                except Exception as e:
+                    self.failed += 1
+                    if not job.future.done():
+                        job.future.set_exception(e)
+                else:
+                    if not job.future.done():
+                        job.future.set_result(result)
+        finally:
+            self._workers.pop(channel_id, None)
+            if not queue:
+                self._queues.pop(channel_id, None)
+
+    def _prune_buckets(self):
+        """丢弃已空闲且令牌已补满的频道令牌桶（与新建的桶等价）"""
+        now = time.monotonic()
+        for channel_id, bucket in list(self._channel_buckets.items()):
+            if channel_id not in self._queues:
+                bucket.delay(now)
+                if bucket.tokens >= bucket.capacity:
+                    del self._channel_buckets[channel_id]
+
+    def _route_limit(self, route: str) -> RouteLimit:
+        key = self._route_buckets.get(route, route)
+        limit = self._routes.get(key)
+        if limit is None:
+            limit = self._routes[key] = RouteLimit()
+        return limit
+
+    async def _wait_turn(self, channel_id: str, route: str):
+        bucket = self._channel_buckets.get(channel_id)
+        if bucket is None:
+            bucket = self._channel_buckets[channel_id] = TokenBucket(self.channel_rate, self.channel_burst)
+        while True:
+            now = time.monotonic()
+            delay = max(bucket.delay(now), self._route_limit(route).delay(now), self._global_until - now)
+            if delay <= 0:
+                break
+            await asyncio.sleep(delay)
+        bucket.take()
+        self._route_limit(route).consume()
+
+    async def _send(self, channel_id: str, job: _Job) -> dict:
+        for attempt in range(self.max_attempts):
+            await self._wait_turn(channel_id, job.route)
+            if attempt == 0:
+                self._waits.append(time.monotonic() - job.enqueued_at)
+            status, headers, body = await self._request(job.route, job.payload)
+            now = time.monotonic()
+            bucket_name = headers.get('X-Rate-Limit-Bucket')
+            if bucket_name and self._route_buckets.get(job.route) != bucket_name:
+                self._route_buckets[job.route] = bucket_name
+            self._route_limit(job.route).update(headers, now)
+
+            if status == 429:
+                self.rate_limited += 1
+                try:
+                    reset = float(headers.get('X-Rate-Limit-Reset') or 1)
+                except ValueError:
+                    reset = 1.0
+                limit = self._route_limit(job.route)
+                limit.remaining, limit.reset_at = 0, now + reset
+                if 'X-Rate-Limit-Global' in headers:
+                    self._global_until = now + reset
+                logger.warning(f"[出站调度] {job.route} 触发限速，{reset:.1f} 秒后重试（第 {attempt + 1} 次）")
+                continue
+            if status != 200 or body.get('code', 0) != 0:
+                raise ValueError(f"{job.route} 请求失败: 状态码 {status}, {body.get('message')}")
+            self.sent += 1
+            return body.get('data') or {}
+        raise ValueError(f"{job.route} 多次触发限速，放弃发送")
+
+    def stats(self) -> dict:
+        waits = list(self._waits)
+        return {
+            'queued': sum(len(queue) for queue in self._queues.values()),
+            'active_channels': len(self._workers),
+            'max_depth': self.max_depth,
+            'sent': self.sent,
+            'failed': self.failed,
+            'rate_limited': self.rate_limited,
+            'avg_wait_ms': round(sum(waits) / len(waits) * 1000, 1) if waits else 0.0,
+            'max_wait_ms': round(max(waits) * 1000, 1) if waits else 0.0,
+        }
+
+    async def shutdown(self):
+        for task in list(self._workers.values()):
+            task.cancel()
+        self._workers.clear()
+        self._queues.clear()
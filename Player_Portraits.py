@@ -0,0 +1,185 @@
+import asyncio
+import json
+import logging
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from Asset_Registry import AssetRegistry
+
+logger = logging.getLogger(__name__)
+
+try:
+    from PIL import Image  # 可选依赖：未安装时直接上传原图
+except ImportError:
+    Image = None
+
+THUMB_SIZE = (200, 200)  # 卡片中 SM 尺寸图片的显示上限
+THUMB_QUALITY = 85
+
+
+def make_thumbnail(src: str, dst: str, size=THUMB_SIZE, quality: int = THUMB_QUALITY) -> str:
+    """
+    缩放并重新压缩为 JPEG 缩略图（在子进程中运行，需为模块级函数）
+
+    img/ 中部分选手图实际为 WebP 格式，统一转成 JPEG 也避免了客户端兼容问题
+    """
+    with Image.open(src) as image:
+        image.thumbnail(size, Image.LANCZOS)
+        if image.mode in ('RGBA', 'LA', 'P'):
+            image = image.convert('RGBA')
+            background = Image.new('RGB', image.size, (255, 255, 255))
+            background.paste(image, mask=image.split()[-1])
+            image = background
+        elif image.mode != 'RGB':
+            image = image.convert('RGB')
+        tmp_path = dst + '.tmp'
+        image.save(tmp_path, 'JPEG', quality=quality, optimize=True)
+    os.replace(tmp_path, dst)
+    return dst
+
+
+class PortraitPipeline:
+    """
+    选手头像预处理与预上传
+
+    构建步骤：用进程池把 img/ 中的选手图批量缩放为卡片尺寸的缩略图，
+    再经 AssetRegistry 上传一次，选手名 -> 资源链接 的映射持久化到 JSON；
+    游戏中展示头像只需一次字典查找，不产生缩放或上传延迟。
+    映射中同时记录源图的 (mtime, 大小)，源图被替换后下一次 prepare 会重新生成并上传
+    """
+
+    def __init__(self, img_dir: str, thumb_dir: str, map_path: str, registry: AssetRegistry,
+                 suffix: str = '.png', max_workers: Optional[int] = None):
+        self.img_dir = img_dir
+        self.thumb_dir = thumb_dir
+        self.map_path = map_path
+        self.registry = registry
+        self.suffix = suffix
+        self.max_workers = max_workers
+        self.urls = {}  # type: Dict[str, str]  # 选手名 -> 资源链接
+        self.sources = {}  # type: Dict[str, List[int]]  # 选手名 -> 生成该链接时源图的 [mtime_ns, 大小]
+        self._task = None  # type: Optional[asyncio.Task]
+        self._pending = None  # type: Optional[List[str]]  # 任务进行中收到的最新名单，结束后再处理一次
+        self._load()
+
+    def _load(self):
+        if not os.path.exists(self.map_path):
+            return
+        try:
+            with open(self.map_path, 'r', encoding='utf-8') as f:
+                table = json.load(f)
+            for name, entry in table.items():
+                if isinstance(entry, str):  # 旧格式只有链接，没有源图信息，下次 prepare 时重新生成
+                    self.urls[name] = entry
+                else:
+                    self.urls[name] = entry['url']
+                    self.sources[name] = entry['source']
+            logger.info(f"[选手头像] 已加载 {len(self.urls)} 个头像链接")
+        except (OSError, ValueError, KeyError, TypeError, AttributeError) as e:
+            logger.error(f"[选手头像] 头像表读取失败，将重新生成: {e}")
+
+    def _save(self):
+        table = {name: {'url': url, 'source': self.sources.get(name)} for name, url in self.urls.items()}
+        tmp_path = self.map_path + '.tmp'
+        try:
+            os.makedirs(os.path.dirname(self.map_path) or '.', exist_ok=True)
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(table, f, ensure_ascii=False)
+            os.replace(tmp_path, self.map_path)
+        except OSError as e:
+            logger.error(f"[选手头像] 头像表保存失败: {e}")
+
+    def url_for(self, name: str) -> Optional[str]:
+        return self.urls.get(name)
+
+    def _source_path(self, name: str) -> str:
+        return os.path.join(self.img_dir, name + self.suffix)
+
+    def _thumb_path(self, name: str) -> str:
+        return os.path.join(self.thumb_dir, name + '.jpg')
+
+    def _source_signature(self, name: str) -> Optional[List[int]]:
+        """源图的 [mtime_ns, 大小]，源图不存在时返回 None"""
+        try:
+            stat = os.stat(self._source_path(name))
+        except OSError:
+            return None
+        return [stat.st_mtime_ns, stat.st_size]
+
+    def build_thumbnails(self, names: Iterable[str]) -> Dict[str, Tuple[str, List[int]]]:
+        """
+        找出没有头像链接或源图已变化的选手并生成缩略图，返回 选手名 -> (待上传文件路径, 源图签名)
+
+        没有源图的选手跳过；未安装 Pillow 时直接返回原图路径
+        """
+        signatures = {name: self._source_signature(name) for name in names}
+        changed = {name: signature for name, signature in signatures.items()
+                   if signature is not None and (name not in self.urls or self.sources.get(name) != signature)}
+        if not changed:
+            return {}
+        sources = {name: self._source_path(name) for name in changed}
+        if Image is None:
+            logger.warning("[选手头像] 未安装 Pillow，直接使用原图")
+            return {name: (path, changed[name]) for name, path in sources.items()}
+
+        os.makedirs(self.thumb_dir, exist_ok=True)
+        # 已有链接的选手源图已被替换，缩略图一律重新生成；新选手沿用比源图新的缩略图
+        stale = [name for name, path in sources.items()
+                 if name in self.urls or not os.path.exists(self._thumb_path(name))
+                 or os.path.getmtime(self._thumb_path(name)) < os.path.getmtime(path)]
+        results = {name: self._thumb_path(name) for name in sources if name not in stale}
+        if stale:
+            with ProcessPoolExecutor(max_workers=self.max_workers) as pool:
+                futures = {name: pool.submit(make_thumbnail, sources[name], self._thumb_path(name))
+                           for name in stale}
+                for name, future in futures.items():
+                    try:
+                        results[name] = future.result()
+                    except Exception as e:
+                        logger.warning(f"[选手头像] {name} 缩略图生成失败，使用原图: {e}")
+                        results[name] = sources[name]
+            logger.info(f"[选手头像] 已生成 {len(stale)} 张缩略图")
+        return {name: (path, changed[name]) for name, path in results.items()}
+
+    async def prepare(self, names: List[str], concurrency: int = 4):
+        """生成缩略图并上传缺失或源图已变化的头像；已登记且内容未变的文件不会重复上传"""
+        loop = asyncio.get_running_loop()
+        files = await loop.run_in_executor(None, self.build_thumbnails, names)
+        if not files:
+            return
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def upload(name, path, signature):
+            async with semaphore:
+                try:
+                    url = await self.registry.get_url(path)
+                except Exception as e:
+                    logger.warning(f"[选手头像] {name} 上传失败: {e}")
+                    return
+            self.urls[name] = url
+            self.sources[name] = signature
+
+        await asyncio.gather(*(upload(name, path, signature) for name, (path, signature) in files.items()))
+        await loop.run_in_executor(None, self._save)
+        logger.info(f"[选手头像] 已更新 {len(files)} 个头像，头像就绪 {len(self.urls)}/{len(names)}")
+
+    def ensure_prepared(self, names: List[str]):
+        """
+        在后台为名单运行 prepare（启动时与名单热更新后调用）
+
+        同一时间只运行一个；进行中再次调用时记下最新名单，当前一轮结束后再处理一次
+        """
+        if self._task is not None and not self._task.done():
+            self._pending = list(names)
+            return
+        self._task = asyncio.create_task(self._prepare_loop(list(names)))
+
+    async def _prepare_loop(self, names: List[str]):
+        while names is not None:
+            self._pending = None
+            try:
+                await self.prepare(names)
+            except Exception as e:
+                logger.exception(f"[选手头像] 头像预处理失败: {e}")
+            names = self._pending
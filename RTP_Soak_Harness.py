@@ -0,0 +1,269 @@
+"""
+语音推流链路压测工具（无需真实 KOOK 语音服务器）
+
+用本地 HTTP 桩模拟 KOOK 的 voice/join 接口（返回回环地址的 ip/port/rtcp_port），
+由 UDP 接收端收取 RTP 流并检查 SSRC/PT、发包节奏、序号缺口和时间戳漂移，
+可同时运行 N 路推流持续指定时长，用于并发压测和负载下的抖动测量。
+
+用法：
+    python RTP_Soak_Harness.py --streams 8 --duration 60
+    python RTP_Soak_Harness.py --streams 20 --duration 300 --profile low_cpu
+"""
+import argparse
+import asyncio
+import json
+import os
+import struct
+import subprocess
+import tempfile
+import time
+from types import SimpleNamespace
+from typing import Dict, List, Optional
+
+from aiohttp import web
+
+from Encoder_Profiles import PROFILES
+
+RTP_CLOCK_RATE = 48000  # Opus RTP 时钟频率
+
+
+class RTPSink(asyncio.DatagramProtocol):
+    """接收一路 RTP 流并统计质量指标"""
+
+    def __init__(self, expected_ssrc: int, expected_pt: int, frame_ms: int = 20):
+        self.expected_ssrc = expected_ssrc
+        self.expected_pt = expected_pt
+        self.frame_interval = frame_ms / 1000
+        self.packets = 0
+        self.bytes = 0
+        self.bad_ssrc = 0
+        self.bad_pt = 0
+        self.seq_gaps = 0  # 丢失的包数
+        self.reordered = 0
+        self.jitter_ms = 0.0
+        self.max_gap_ms = 0.0
+        self.late_packets = 0  # 到达间隔超过 2.5 倍帧长
+        self.max_drift_ms = 0.0
+        self.final_drift_ms = 0.0
+        self._last_seq = None
+        self._last_arrival = None
+        self._first = None  # (到达时间, RTP 时间戳)
+
+    def datagram_received(self, data, addr):
+        now = time.perf_counter()
+        if len(data) < 12:
+            return
+        self.packets += 1
+        self.bytes += len(data)
+        pt = data[1] & 0x7F
+        seq, timestamp, ssrc = struct.unpack('!HII', data[2:12])
+        if ssrc != self.expected_ssrc:
+            self.bad_ssrc += 1
+        if pt != self.expected_pt:
+            self.bad_pt += 1
+
+        if self._last_seq is not None:
+            delta = (seq - self._last_seq) & 0xFFFF
+            if delta == 0 or delta > 0x8000:
+                self.reordered += 1
+                return
+            self.seq_gaps += delta - 1
+        self._last_seq = seq
+
+        if self._last_arrival is not None:
+            gap = now - self._last_arrival
+            self.jitter_ms += (abs(gap - self.frame_interval) * 1000 - self.jitter_ms) / 16
+            self.max_gap_ms = max(self.max_gap_ms, gap * 1000)
+            if gap > self.frame_interval * 2.5:
+                self.late_packets += 1
+        self._last_arrival = now
+
+        # 时间戳漂移：RTP 时间戳推进的媒体时间与实际经过时间之差
+        if self._first is None:
+            self._first = (now, timestamp)
+        else:
+            media_elapsed = ((timestamp - self._first[1]) & 0xFFFFFFFF) / RTP_CLOCK_RATE
+            drift = (media_elapsed - (now - self._first[0])) * 1000
+            self.final_drift_ms = drift
+            if abs(drift) > abs(self.max_drift_ms):
+                self.max_drift_ms = drift
+
+    def report(self) -> dict:
+        return {
+            'packets': self.packets,
+            'kbps': round(self.bytes * 8 / 1000 / max(self._elapsed(), 1e-6), 1),
+            'bad_ssrc': self.bad_ssrc,
+            'bad_pt': self.bad_pt,
+            'seq_gaps': self.seq_gaps,
+            'reordered': self.reordered,
+            'jitter_ms': round(self.jitter_ms, 2),
+            'max_gap_ms': round(self.max_gap_ms, 1),
+            'late_packets': self.late_packets,
+            'max_drift_ms': round(self.max_drift_ms, 1),
+            'final_drift_ms': round(self.final_drift_ms, 1),
+        }
+
+    def _elapsed(self) -> float:
+        if self._first is None or self._last_arrival is None:
+            return 0.0
+        return self._last_arrival - self._first[0]
+
+
+class StubKookVoiceAPI:
+    """模拟 KOOK voice/join、voice/keep-alive、voice/leave 接口，按频道返回本地接收端地址"""
+
+    def __init__(self):
+        self.endpoints = {}  # type: Dict[str, dict]  # channel_id -> join 返回的 data
+        self.calls = {'join': 0, 'keep-alive': 0, 'leave': 0}
+        self._runner = None
+        self.base_url = None
+
+    def register(self, channel_id: str, port: int, rtcp_port: int, ssrc: int, pt: int):
+        self.endpoints[channel_id] = {
+            'ip': '127.0.0.1', 'port': port, 'rtcp_port': rtcp_port,
+            'audio_ssrc': ssrc, 'audio_pt': pt, 'bitrate': 48000, 'rtcp_mux': False,
+        }
+
+    async def _handle(self, request: web.Request):
+        action = request.match_info['action']
+        self.calls[action] = self.calls.get(action, 0) + 1
+        body = await request.json()
+        endpoint = self.endpoints.get(str(body.get('channel_id')))
+        if endpoint is None:
+            return web.json_response({'code': 40000, 'message': '频道不存在', 'data': {}})
+        data = endpoint if action == 'join' else {}
+        return web.json_response({'code': 0, 'message': 'ok', 'data': data})
+
+    async def start(self):
+        app = web.Application()
+        app.router.add_post('/api/v3/voice/{action}', self._handle)
+        self._runner = web.AppRunner(app)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, '127.0.0.1', 0)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        self.base_url = f'http://127.0.0.1:{port}/api/v3'
+
+    async def stop(self):
+        if self._runner:
+            await self._runner.cleanup()
+
+
+class _FakeMessage:
+    """满足 _stream_track 所需字段的最小消息对象"""
+
+    def __init__(self, guild_id: str):
+        self.ctx = SimpleNamespace(guild=SimpleNamespace(id=guild_id))
+        self.author = SimpleNamespace(id='soak-test')
+        self.replies = []  # type: List[str]
+
+    async def reply(self, content, *args, **kwargs):
+        self.replies.append(str(content))
+
+
+def make_test_audio(duration: int, path: str):
+    """生成一段立体声 MP3 作为推流源（与网易云播放链接同为 MP3 解码路径）"""
+    cmd = [
+        'ffmpeg', '-y', '-hide_banner', '-loglevel', 'error',
+        '-f', 'lavfi', '-i', f'sine=frequency=440:sample_rate=44100:duration={duration}',
+        '-ac', '2', '-b:a', '192k', path
+    ]
+    subprocess.run(cmd, check=True)
+
+
+async def run_soak(streams: int, duration: int, profile: Optional[str] = None) -> dict:
+    """同时推流 streams 路、每路 duration 秒，返回各路接收端报告与机器人侧统计"""
+    from kook_bot import StableMusicBot
+
+    loop = asyncio.get_running_loop()
+    stub = StubKookVoiceAPI()
+    await stub.start()
+    bot = StableMusicBot(os.getenv("KOOK_TOKEN", "soak-test-token"))
+    bot._kook_api = stub.base_url
+    frame_ms = PROFILES[profile].frame_duration if profile else 20
+
+    sinks = {}  # type: Dict[str, RTPSink]
+    transports = []
+    audio_path = os.path.join(tempfile.gettempdir(), f'kook_soak_{duration}s.mp3')
+    try:
+        if not os.path.exists(audio_path):
+            await loop.run_in_executor(None, make_test_audio, duration, audio_path)
+
+        messages = []
+        for index in range(streams):
+            guild_id = f'soak-guild-{index}'
+            channel_id = f'soak-channel-{index}'
+            ssrc, pt = 10000 + index, 111
+            sink = RTPSink(ssrc, pt, frame_ms)
+            rtp, _ = await loop.create_datagram_endpoint(lambda s=sink: s, local_addr=('127.0.0.1', 0))
+            rtcp, _ = await loop.create_datagram_endpoint(asyncio.DatagramProtocol, local_addr=('127.0.0.1', 0))
+            transports += [rtp, rtcp]
+            stub.register(channel_id, rtp.get_extra_info('sockname')[1], rtcp.get_extra_info('sockname')[1], ssrc, pt)
+            sinks[guild_id] = sink
+
+            if profile:
+                bot.encoder_profiles.guild_profiles[guild_id] = profile
+            params = await bot._voice_join(channel_id)
+            await bot.voice_sessions.open(guild_id, channel_id, channel_id, params)
+            messages.append(_FakeMessage(guild_id))
+
+        started = time.perf_counter()
+        await asyncio.gather(*(
+            bot._stream_track(msg, {'id': f'soak-{i}', 'title': f'soak-{i}', 'url': audio_path})
+            for i, msg in enumerate(messages)
+        ))
+        elapsed = time.perf_counter() - started
+
+        results = {}
+        for msg in messages:
+            guild_id = msg.ctx.guild.id
+            results[guild_id] = {
+                'sink': sinks[guild_id].report(),
+                'bot': bot.telemetry.guild_snapshot(guild_id),
+                'replies': msg.replies,
+            }
+        return {
+            'streams': streams,
+            'duration': duration,
+            'profile': profile or bot.encoder_profiles.default,
+            'elapsed': round(elapsed, 1),
+            'stub_calls': stub.calls,
+            'aggregate': bot.telemetry.aggregate(),
+            'results': results,
+        }
+    finally:
+        for transport in transports:
+            transport.close()
+        await bot.cleanup()
+        await stub.stop()
+
+
+def summarize(report: dict) -> str:
+    lines = [
+        f"推流 {report['streams']} 路 × {report['duration']} 秒，档位 {report['profile']}，实际耗时 {report['elapsed']} 秒",
+        f"{'guild':<16}{'packets':>8}{'gaps':>6}{'late':>6}{'jitter':>9}{'maxgap':>9}{'drift':>9}{'ssrc/pt':>9}",
+    ]
+    for guild_id, item in report['results'].items():
+        sink = item['sink']
+        lines.append(
+            f"{guild_id:<16}{sink['packets']:>8}{sink['seq_gaps']:>6}{sink['late_packets']:>6}"
+            f"{sink['jitter_ms']:>8.2f}ms{sink['max_gap_ms']:>7.1f}ms{sink['final_drift_ms']:>7.1f}ms"
+            f"{'OK' if not sink['bad_ssrc'] and not sink['bad_pt'] else 'BAD':>9}"
+        )
+    lines.append(f"机器人侧汇总: {report['aggregate']}")
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="KOOK 语音推流链路本地压测")
+    parser.add_argument('--streams', type=int, default=4, help="并发推流路数")
+    parser.add_argument('--duration', type=int, default=30, help="每路推流时长（秒）")
+    parser.add_argument('--profile', choices=list(PROFILES), default=None, help="编码档位，默认按主机负载自动选择")
+    parser.add_argument('--json', default=None, help="将完整报告写入指定 JSON 文件")
+    options = parser.parse_args()
+
+    result = asyncio.run(run_soak(options.streams, options.duration, options.profile))
+    print(summarize(result))
+    if options.json:
+        with open(options.json, 'w', encoding='utf-8') as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
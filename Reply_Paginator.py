@@ -0,0 +1,98 @@
+import itertools
+import os
+from typing import List, NamedTuple, Optional
+
+from khl.card import Card, CardMessage, Module, Element, Types
+
+from Music_Cache import LRUCache
+
+PAGE_CHARS = 1900  # 单页字符上限（KOOK 卡片文本上限为 2000）
+BUTTON_PREFIX = "page"
+
+
+def paginate(text: str, limit: int = PAGE_CHARS) -> List[str]:
+    """按行切分长文本，每页不超过 limit 个字符；超长的单行按字符硬切"""
+    pages = []
+    current = ""
+    for line in text.split('\n'):
+        while len(line) > limit:
+            if current:
+                pages.append(current)
+                current = ""
+            pages.append(line[:limit])
+            line = line[limit:]
+        if current and len(current) + len(line) + 1 > limit:
+            pages.append(current)
+            current = line
+        else:
+            current = current + '\n' + line if current else line
+    if current or not pages:
+        pages.append(current)
+    return pages
+
+
+class PagedResult(NamedTuple):
+    pages: List[str]
+    image_url: Optional[str]
+
+
+class ReplyPaginator:
+    """
+    长文本查询结果的分页卡片
+
+    每次查询只发送一条卡片消息（第 1 页 + 翻页按钮），分页结果保存在有界 LRU 缓存中；
+    有人点击按钮时才渲染对应页，并原地更新该条消息
+    """
+
+    def __init__(self, max_entries: int = 200, ttl: float = 3600.0):
+        self.results = LRUCache(max_size=max_entries, ttl=ttl, name="paged_replies")
+        self._ids = itertools.count(1)
+        self._prefix = os.urandom(3).hex()  # 区分重启前发出的按钮，避免翻到别的查询结果
+
+    def store(self, text: str, image_url: Optional[str] = None) -> str:
+        key = f"{self._prefix}{next(self._ids)}"
+        self.results.set(key, PagedResult(paginate(text), image_url))
+        return key
+
+    @staticmethod
+    def render(key: str, result: PagedResult, page: int) -> CardMessage:
+        """渲染指定页：图标、该页文本、页码与翻页按钮"""
+        total = len(result.pages)
+        page = max(0, min(page, total - 1))
+        card = Card()
+        if result.image_url:
+            card.append(Module.Container(Element.Image(src=result.image_url, size=Types.Size.LG)))
+        card.append(Module.Section(Element.Text(content=result.pages[page], type=Types.Text.PLAIN)))
+        if total > 1:
+            card.append(Module.Context(Element.Text(content=f"第 {page + 1}/{total} 页", type=Types.Text.PLAIN)))
+            buttons = []
+            if page > 0:
+                buttons.append(Element.Button("上一页", value=f"{BUTTON_PREFIX}:{key}:{page - 1}",
+                                              click=Types.Click.RETURN_VAL, theme=Types.Theme.INFO))
+            if page < total - 1:
+                buttons.append(Element.Button("下一页", value=f"{BUTTON_PREFIX}:{key}:{page + 1}",
+                                              click=Types.Click.RETURN_VAL, theme=Types.Theme.PRIMARY))
+            card.append(Module.ActionGroup(*buttons))
+        return CardMessage(card)
+
+    def first_page(self, text: str, image_url: Optional[str] = None) -> CardMessage:
+        key = self.store(text, image_url)
+        return self.render(key, self.results.get(key), 0)
+
+    def on_click(self, value: str) -> Optional[CardMessage]:
+        """
+        处理按钮回传值，返回要替换成的卡片
+
+        非分页按钮或结果已过期时返回 None
+        """
+        parts = value.split(':')
+        if len(parts) != 3 or parts[0] != BUTTON_PREFIX or not parts[2].isdigit():
+            return None
+        key, page = parts[1], int(parts[2])
+        result = self.results.get(key)
+        if result is None:
+            return None
+        return self.render(key, result, page)
+
+    def stats(self) -> dict:
+        return self.results.stats()
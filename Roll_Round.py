@@ -0,0 +1,95 @@
+import logging
+import random
+import time
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+from Expiry_Scheduler import ExpiryScheduler
+
+logger = logging.getLogger(__name__)
+
+ROLL_MIN = 1
+ROLL_MAX = 999
+
+
+class RollRound:
+    """单个频道的一轮掷骰"""
+
+    __slots__ = ('channel_id', 'results', 'started_at', 'ends_at')
+
+    def __init__(self, channel_id: str, duration: float):
+        self.channel_id = channel_id
+        self.results = {}  # type: Dict[str, int]  # 用户ID -> 点数（每人每轮只算第一次）
+        self.started_at = time.time()
+        self.ends_at = self.started_at + duration
+
+    @property
+    def participants(self) -> int:
+        return len(self.results)
+
+    def remaining(self) -> float:
+        return max(0.0, self.ends_at - time.time())
+
+    def winners(self) -> Tuple[int, List[str]]:
+        """返回 (最高点数, 掷出该点数的用户ID列表)"""
+        if not self.results:
+            return 0, []
+        best = max(self.results.values())
+        return best, [user_id for user_id, value in self.results.items() if value == best]
+
+
+class RollRoundStore:
+    """
+    按频道保存掷骰轮次
+
+    频道内第一次 /roll 开启一轮，duration 秒后由共享调度器结束该轮、公布最高点数并释放状态；
+    内存只与当前有进行中轮次的频道数相关
+    """
+
+    def __init__(self, scheduler: ExpiryScheduler, announce: Callable[[RollRound], Awaitable[None]],
+                 duration: float = 300.0):
+        """
+        参数:
+            scheduler (ExpiryScheduler): 共享的到期调度器
+            announce: 轮次结束时调用，用于在频道内公布结果
+            duration (float): 每轮持续时间（秒）
+        """
+        self.scheduler = scheduler
+        self.announce = announce
+        self.duration = duration
+        self.rounds = {}  # type: Dict[str, RollRound]
+        self.closed = 0
+
+    def __len__(self):
+        return len(self.rounds)
+
+    def get(self, channel_id: str) -> Optional[RollRound]:
+        return self.rounds.get(channel_id)
+
+    def roll(self, channel_id: str, user_id: str) -> Tuple[RollRound, int, bool]:
+        """
+        加入频道当前轮次（没有则开启新一轮）
+
+        返回 (轮次, 点数, 是否为本轮新掷出)；同一用户重复掷骰时返回其本轮已有的点数
+        """
+        current = self.rounds.get(channel_id)
+        if current is None:
+            current = self.rounds[channel_id] = RollRound(channel_id, self.duration)
+            self.scheduler.schedule(('roll', channel_id), self.duration, self._close)
+        if user_id in current.results:
+            return current, current.results[user_id], False
+        value = random.randint(ROLL_MIN, ROLL_MAX)
+        current.results[user_id] = value
+        return current, value, True
+
+    async def _close(self, key):
+        current = self.rounds.pop(key[1], None)
+        if current is None:
+            return
+        self.closed += 1
+        try:
+            await self.announce(current)
+        except Exception as e:
+            logger.warning(f"[掷骰] 频道 {current.channel_id} 结果公布失败: {e}")
+
+    def stats(self) -> dict:
+        return {'active_rounds': len(self.rounds), 'closed': self.closed}
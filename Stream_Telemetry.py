@@ -0,0 +1,143 @@
+import logging
+import threading
+import time
+from collections import deque
+from typing import Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class StreamStats:
+    """
+    单路推流的实时质量数据
+
+    编码侧：解析 FFmpeg -progress 输出（speed、out_time、bitrate）
+    发送侧：由 RTP 中继在每个包转发时记录发送间隔抖动与断流(underrun)
+    """
+
+    SLOW_SPEED = 0.97  # 编码速度低于实时的该比例即视为主机过载
+    UNDERRUN_FACTOR = 2.5  # 发包间隔超过帧长的该倍数记为一次断流
+
+    def __init__(self, guild_id: str, title: str = '', frame_ms: int = 20):
+        self.guild_id = guild_id
+        self.title = title
+        self.frame_interval = frame_ms / 1000
+        self.started_at = time.time()
+        self.ended_at = None  # type: Optional[float]
+        self.returncode = None  # type: Optional[int]
+        # FFmpeg 进度
+        self.speed = None  # type: Optional[float]
+        self.out_time = 0.0
+        self.bitrate_kbps = None  # type: Optional[float]
+        self.slow_reports = 0
+        self._progress = {}
+        # RTP 发送
+        self.packets = 0
+        self.jitter_ms = 0.0
+        self.max_gap_ms = 0.0
+        self.underruns = 0
+        self._last_packet = None  # type: Optional[float]
+
+    @property
+    def active(self) -> bool:
+        return self.ended_at is None
+
+    def on_progress_line(self, line: str):
+        """FFmpeg 每个进度块以 progress=continue/end 结尾，收到结尾时统一更新"""
+        key, _, value = line.strip().partition('=')
+        if not key:
+            return
+        if key != 'progress':
+            self._progress[key] = value.strip()
+            return
+        block, self._progress = self._progress, {}
+        try:
+            if block.get('speed', 'N/A').rstrip('x') not in ('N/A', ''):
+                self.speed = float(block['speed'].rstrip('x'))
+            if block.get('out_time_us', 'N/A') not in ('N/A', ''):
+                self.out_time = int(block['out_time_us']) / 1_000_000
+            if block.get('bitrate', 'N/A').strip() not in ('N/A', ''):
+                self.bitrate_kbps = float(block['bitrate'].replace('kbits/s', ''))
+        except ValueError:
+            return
+        # 跳过开头几秒的缓冲阶段，之后速度持续低于实时说明编码跟不上
+        if self.speed is not None and self.out_time > 5 and self.speed < self.SLOW_SPEED:
+            self.slow_reports += 1
+            if self.slow_reports in (1, 10, 100):
+                logger.warning(f"[推流质量] 服务器 {self.guild_id} 编码速度 {self.speed:.2f}x，主机可能过载")
+
+    def on_packet(self, now: float):
+        """RTP 中继线程每转发一个包调用一次；抖动按 RFC 3550 的方式做平滑"""
+        self.packets += 1
+        if self._last_packet is not None:
+            gap = now - self._last_packet
+            deviation = abs(gap - self.frame_interval) * 1000
+            self.jitter_ms += (deviation - self.jitter_ms) / 16
+            if gap * 1000 > self.max_gap_ms:
+                self.max_gap_ms = gap * 1000
+            if gap > self.frame_interval * self.UNDERRUN_FACTOR:
+                self.underruns += 1
+        self._last_packet = now
+
+    def finish(self, returncode: int):
+        self.ended_at = time.time()
+        self.returncode = returncode
+
+    def snapshot(self) -> dict:
+        return {
+            'guild_id': self.guild_id,
+            'title': self.title,
+            'active': self.active,
+            'duration': round((self.ended_at or time.time()) - self.started_at, 1),
+            'speed': self.speed,
+            'out_time': round(self.out_time, 1),
+            'bitrate_kbps': self.bitrate_kbps,
+            'packets': self.packets,
+            'jitter_ms': round(self.jitter_ms, 2),
+            'max_gap_ms': round(self.max_gap_ms, 1),
+            'underruns': self.underruns,
+            'returncode': self.returncode,
+        }
+
+
+class TelemetryRegistry:
+    """按服务器保存推流质量数据，并提供全局汇总"""
+
+    def __init__(self, history: int = 20):
+        self.streams = {}  # type: Dict[str, StreamStats]  # guild_id -> 当前/最近一路推流
+        self.abnormal_exits = {}  # type: Dict[str, int]  # guild_id -> FFmpeg 以非 0 返回码退出的次数
+        self.recent = deque(maxlen=history)  # 最近结束的推流
+        self._lock = threading.Lock()
+
+    def start(self, guild_id: str, title: str = '', frame_ms: int = 20) -> StreamStats:
+        with self._lock:
+            stats = StreamStats(guild_id, title, frame_ms)
+            self.streams[guild_id] = stats
+            return stats
+
+    def finish(self, stats: StreamStats, returncode: int):
+        stats.finish(returncode)
+        with self._lock:
+            if returncode != 0:
+                self.abnormal_exits[stats.guild_id] = self.abnormal_exits.get(stats.guild_id, 0) + 1
+            self.recent.append(stats.snapshot())
+
+    def guild_snapshot(self, guild_id: str) -> Optional[dict]:
+        stats = self.streams.get(guild_id)
+        if stats is None:
+            return None
+        return {**stats.snapshot(), 'abnormal_exits': self.abnormal_exits.get(guild_id, 0)}
+
+    def aggregate(self) -> dict:
+        with self._lock:
+            active = [stats for stats in self.streams.values() if stats.active]
+        speeds = [stats.speed for stats in active if stats.speed is not None]
+        return {
+            'active_streams': len(active),
+            'min_speed': min(speeds) if speeds else None,
+            'avg_speed': round(sum(speeds) / len(speeds), 3) if speeds else None,
+            'max_jitter_ms': round(max((stats.jitter_ms for stats in active), default=0.0), 2),
+            'underruns': sum(stats.underruns for stats in active),
+            'abnormal_exits': sum(self.abnormal_exits.values()),
+            'overloaded': any(speed < StreamStats.SLOW_SPEED for speed in speeds),
+        }
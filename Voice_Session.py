@@ -0,0 +1,242 @@
+import asyncio
+import logging
+import selectors
+import socket
+import struct
+import threading
+import time
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class RTPRelay:
+    """
+    本地 RTP/RTCP 中继
+
+    FFmpeg 始终推流到本机的中继端口，中继再把数据包转发到当前语音服务器地址。
+    重新加入语音频道后只需调用 set_target 切换目标，正在播放的歌曲无需重启编码进程；
+    若新会话的 SSRC/PT 发生变化，转发时就地改写包头。
+    转发在独立线程中用阻塞套接字完成，不经过事件循环，事件循环卡顿不会造成播放断续
+    """
+
+    POLL_INTERVAL = 0.2  # 线程检查停止标志的间隔（秒）
+    MAX_DATAGRAM = 65535
+
+    def __init__(self):
+        self.local_port = None
+        self.local_rtcp_port = None
+        self.target = None  # (ip, port, rtcp_port)
+        self.audio_ssrc = None
+        self.audio_pt = None
+        self._source_ssrc = None
+        self._source_pt = None
+        # 转发线程读取的目标：((ip, port, rtcp_port), ssrc, pt, 是否改写包头)，整体替换，无需加锁
+        self._route = None  # type: Optional[Tuple[Tuple[str, int, int], int, int, bool]]
+        self._sockets = []  # type: List[socket.socket]
+        self._rtp_out = None  # type: Optional[socket.socket]
+        self._rtcp_out = None  # type: Optional[socket.socket]
+        self._thread = None  # type: Optional[threading.Thread]
+        self._stop = threading.Event()
+        self.packets = 0
+        self.on_packet = None  # 可选回调 on_packet(perf_counter 时间)，用于统计发包抖动；在中继线程中调用
+
+    async def start(self, audio_ssrc: int, audio_pt: int):
+        """绑定本地端口并启动转发线程；audio_ssrc/audio_pt 为 FFmpeg 推流时使用的初始值"""
+        self._source_ssrc = int(audio_ssrc)
+        self._source_pt = int(audio_pt)
+        rtp_in = self._bind('127.0.0.1')
+        rtcp_in = self._bind('127.0.0.1')
+        self._rtp_out = self._bind('0.0.0.0')
+        self._rtcp_out = self._bind('0.0.0.0')
+        self.local_port = rtp_in.getsockname()[1]
+        self.local_rtcp_port = rtcp_in.getsockname()[1]
+        self._thread = threading.Thread(target=self._run, args=(rtp_in, rtcp_in),
+                                        name=f"rtp-relay-{self.local_port}", daemon=True)
+        self._thread.start()
+
+    def _bind(self, host: str) -> socket.socket:
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self._sockets.append(sock)
+        sock.bind((host, 0))
+        return sock
+
+    def set_target(self, ip: str, port: int, rtcp_port: int, audio_ssrc: int, audio_pt: int):
+        self.target = (ip, int(port), int(rtcp_port))
+        self.audio_ssrc = int(audio_ssrc)
+        self.audio_pt = int(audio_pt)
+        rewrite = (self.audio_ssrc, self.audio_pt) != (self._source_ssrc, self._source_pt)
+        self._route = (self.target, self.audio_ssrc, self.audio_pt, rewrite)
+
+    def _run(self, rtp_in: socket.socket, rtcp_in: socket.socket):
+        selector = selectors.DefaultSelector()
+        selector.register(rtp_in, selectors.EVENT_READ, self._forward_rtp)
+        selector.register(rtcp_in, selectors.EVENT_READ, self._forward_rtcp)
+        try:
+            while not self._stop.is_set():
+                for key, _ in selector.select(timeout=self.POLL_INTERVAL):
+                    try:
+                        key.data(key.fileobj.recv(self.MAX_DATAGRAM))
+                    except OSError as e:
+                        # 目标暂时不可达等错误只丢弃当前包，不中断转发
+                        logger.debug(f"[语音中继] 转发失败: {e}")
+        except Exception as e:
+            logger.exception(f"[语音中继] 转发线程异常退出: {e}")
+        finally:
+            selector.close()
+            self._close_sockets()
+
+    def _forward_rtp(self, data: bytes):
+        route = self._route
+        if route is None or len(data) < 12:
+            return
+        target, ssrc, pt, rewrite = route
+        if rewrite:
+            header = bytearray(data[:12])
+            header[1] = (header[1] & 0x80) | (pt & 0x7F)  # 保留 marker 位
+            struct.pack_into('!I', header, 8, ssrc)
+            data = bytes(header) + data[12:]
+        self.packets += 1
+        self._rtp_out.sendto(data, (target[0], target[1]))
+        on_packet = self.on_packet
+        if on_packet is not None:
+            on_packet(time.perf_counter())
+
+    def _forward_rtcp(self, data: bytes):
+        route = self._route
+        if route is None or len(data) < 8:
+            return
+        target, ssrc, _, rewrite = route
+        if rewrite:
+            data = data[:4] + struct.pack('!I', ssrc) + data[8:]
+        self._rtcp_out.sendto(data, (target[0], target[2]))
+
+    def _close_sockets(self):
+        sockets, self._sockets = self._sockets, []
+        for sock in sockets:
+            sock.close()
+
+    def close(self):
+        """通知转发线程退出，套接字由线程在退出时关闭（最多延迟 POLL_INTERVAL），调用方无需等待"""
+        self._stop.set()
+        if self._thread is None:
+            self._close_sockets()
+
+
+class VoiceSession:
+    """单个服务器的语音会话"""
+
+    def __init__(self, guild_id: str, channel_id: str, channel_name: str, params: dict):
+        self.guild_id = guild_id
+        self.channel_id = channel_id
+        self.channel_name = channel_name
+        self.params = params  # audio_ssrc, audio_pt, ip, port, rtcp_port
+        self.relay = RTPRelay()
+        self.last_alive = time.monotonic()
+        self.keepalive_failures = 0
+        self.reconnects = 0
+
+    def ffmpeg_target(self) -> str:
+        """FFmpeg tee 输出参数：推流到本地中继端口"""
+        return (
+            f'[select=a:f=rtp:ssrc={self.params["audio_ssrc"]}:payload_type={self.params["audio_pt"]}]'
+            f'rtp://127.0.0.1:{self.relay.local_port}?rtcpport={self.relay.local_rtcp_port}'
+        )
+
+
+class VoiceSessionManager:
+    """
+    语音会话管理：定时发送 keep-alive，发现会话失效时用已知频道 ID 重新 voice/join，
+    并把新地址交给中继，正在运行的编码进程不受影响
+    """
+
+    def __init__(self,
+                 join: Callable[[str], Awaitable[dict]],
+                 keepalive: Callable[[str], Awaitable[bool]],
+                 leave: Callable[[str], Awaitable[bool]],
+                 interval: float = 30.0,
+                 max_failures: int = 2):
+        """
+        参数:
+            join: 加入语音频道，返回推流参数，失败时抛出异常
+            keepalive: 发送保活请求，会话仍有效时返回 True
+            leave: 离开语音频道
+            interval (float): 保活间隔（秒）
+            max_failures (int): 连续保活失败多少次后重新加入
+        """
+        self._join = join
+        self._keepalive = keepalive
+        self._leave = leave
+        self.interval = interval
+        self.max_failures = max_failures
+        self.sessions = {}  # type: Dict[str, VoiceSession]
+        self._task = None  # type: Optional[asyncio.Task]
+
+    def get(self, guild_id: str) -> Optional[VoiceSession]:
+        return self.sessions.get(guild_id)
+
+    async def open(self, guild_id: str, channel_id: str, channel_name: str, params: dict) -> VoiceSession:
+        """登记已加入的语音频道并启动中继"""
+        old = self.sessions.pop(guild_id, None)
+        if old:
+            old.relay.close()
+        session = VoiceSession(guild_id, channel_id, channel_name, params)
+        await session.relay.start(params['audio_ssrc'], params['audio_pt'])
+        session.relay.set_target(params['ip'], params['port'], params['rtcp_port'],
+                                 params['audio_ssrc'], params['audio_pt'])
+        self.sessions[guild_id] = session
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._keepalive_loop())
+        return session
+
+    async def close(self, guild_id: str):
+        session = self.sessions.pop(guild_id, None)
+        if session:
+            session.relay.close()
+
+    async def reconnect(self, session: VoiceSession) -> bool:
+        """用已知频道 ID 重新加入，并切换中继目标"""
+        try:
+            try:
+                params = await self._join(session.channel_id)
+            except Exception:
+                # 服务端可能仍认为机器人在频道中，先离开再加入
+                await self._leave(session.channel_id)
+                params = await self._join(session.channel_id)
+        except Exception as e:
+            logger.error(f"[语音会话] {session.channel_name} 重新加入失败: {str(e)}")
+            return False
+        session.params = params
+        session.relay.set_target(params['ip'], params['port'], params['rtcp_port'],
+                                 params['audio_ssrc'], params['audio_pt'])
+        session.keepalive_failures = 0
+        session.last_alive = time.monotonic()
+        session.reconnects += 1
+        logger.info(f"[语音会话] 已重新加入 {session.channel_name}，推流目标切换为 {params['ip']}:{params['port']}")
+        return True
+
+    async def _keepalive_loop(self):
+        while self.sessions:
+            await asyncio.sleep(self.interval)
+            for session in list(self.sessions.values()):
+                if self.sessions.get(session.guild_id) is not session:
+                    continue  # 等待期间会话已关闭或被替换
+                try:
+                    alive = await self._keepalive(session.channel_id)
+                except Exception as e:
+                    logger.warning(f"[语音会话] {session.channel_name} 保活请求异常: {str(e)}")
+                    alive = False
+                if alive:
+                    session.keepalive_failures = 0
+                    session.last_alive = time.monotonic()
+                    continue
+                session.keepalive_failures += 1
+                logger.warning(f"[语音会话] {session.channel_name} 保活失败 {session.keepalive_failures} 次")
+                if session.keepalive_failures >= self.max_failures:
+                    await self.reconnect(session)
+
+    async def shutdown(self):
+        if self._task:
+            self._task.cancel()
+        for guild_id in list(self.sessions):
+            await self.close(guild_id)
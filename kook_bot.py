@@ -1,19 +1,45 @@
 import os
 import asyncio
 import sys
-import time
 from dotenv import load_dotenv
 import aiohttp
 import logging
 import subprocess
 import random
-import datetime
-from khl import Bot, Message
+import threading
+import multiprocessing
+import json
+import re
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from khl import Bot, Event, EventTypes, Message, PublicMessage
 from khl.card import Card, CardMessage, Module, Element, Types, Struct
 from khl.card.color import Color
-from typing import Dict, Optional, Union
-from HLTV_PLAYER import HLTVPlayerManager
+from typing import Dict, Iterable, List, Optional, Tuple, Union
+from HLTV_PLAYER import PLAYER_FIELDS, HLTVPlayerManager, PlayerNameIndex, PlayerRecord, normalize_name
 from FF14_Price_Query import FF14PriceQuery
+from Music_Cache import MusicCache
+from Loudness_Analyzer import LoudnessAnalyzer
+from Encoder_Profiles import PROFILES, EncoderProfileManager, plan_capacity
+from Voice_Session import VoiceSessionManager
+from Stream_Telemetry import StreamStats, TelemetryRegistry
+from Expiry_Scheduler import ExpiryScheduler
+from Asset_Registry import AssetRegistry
+from Player_Portraits import PortraitPipeline
+from Item_Icon_Cache import ItemIconCache
+from Reply_Paginator import BUTTON_PREFIX, ReplyPaginator
+from Guess_Session import GuessSessionStore
+from Roll_Round import RollRound, RollRoundStore
+from Command_Router import CommandRouter, Param
+from Message_Intake import COMMAND, MessageIntake
+from Loop_Watchdog import LoopWatchdog
+from Metrics_Server import MetricsRegistry, MetricsServer, upstream_trace_config
+from Log_Setup import guild_var, setup_logging
+from Outbound_Scheduler import OutboundScheduler
+from Music_Resilience import (
+    CircuitBreaker, CircuitOpenError, MusicAPIError, NoPlayableUrlError, PermanentMusicError, SongNotFoundError,
+    SongPaidError, SongUnavailableError, call_with_retry, status_error
+)
 
 """Update Time: 2025/06/03"""
 
@@ -29,6 +55,12 @@ def get_resource_path(relative_path):
 
 
 class StableMusicBot:
+    URL_BATCH_SIZE = 100  # 单次 player/url 请求的歌曲数
+    DETAIL_BATCH_SIZE = 500  # 单次 song/detail 请求的歌曲数
+    QUEUE_PREFETCH = 10  # 播放队列中一次批量解析播放链接的歌曲数
+    MAX_QUEUE_SIZE = 500  # 单个服务器播放队列上限
+    FF14_WORKERS = 4  # FF14 查询线程数，也是所有 FF14 指令合计同时进行的查询数
+
     def __init__(self, token: str):
         self._setup_logging()
         self._init_event_loop()  # 初始化事件循环
@@ -37,42 +69,124 @@ class StableMusicBot:
         self._http = None  # type: Optional[aiohttp.ClientSession]
         self._api_endpoints = [
             "https://music.163.com/api/search/get",
-            "https://music.163.com/api/song/enhance/player/url"
+            "https://music.163.com/api/song/enhance/player/url",
+            "https://music.163.com/api/v6/playlist/detail",  # 歌单详情（含全部 trackIds）
+            "https://music.163.com/api/v1/album/{album_id}",  # 专辑详情
+            "https://music.163.com/api/v3/song/detail"  # 批量歌曲详情
         ]
         self._cookie = "cookie"
+        self._kook_api = "https://www.kaiheila.cn/api/v3"
+        self.music_cache = MusicCache()  # 搜索结果与播放链接两级缓存
+        self.music_breaker = CircuitBreaker(failure_threshold=5, reset_timeout=30, name="netease")
+        self.encoder_profiles = EncoderProfileManager(get_resource_path("data/encoder_profiles.json"))
+        self.loudness = LoudnessAnalyzer(get_resource_path("data/loudness.json"))  # 按歌曲缓存响度，播放时直接套用增益
+        # 消息入口预过滤：只有指令和被关注频道中的聊天才进入后续处理
+        self.intake = MessageIntake(prefix='/')
         self._register_handlers()
-        self.current_stream_params = {}  # 存储推流参数 (audio_ssrc, audio_pt, ip, port, rtcp_port)
-        self.is_playing = False  # 新增：用于跟踪歌曲播放状态，防止重复播放
+        # 事件循环卡顿时记录阻塞位置的调用栈和进行中的指令（开销很低，常驻开启）
+        self.watchdog = LoopWatchdog(threshold=0.5, describe=self.commands.describe_running)
+        # 语音会话（按服务器保存推流参数并定时保活，失效时自动重新加入）
+        self.voice_sessions = VoiceSessionManager(
+            join=self._voice_join, keepalive=self._voice_keepalive, leave=self._voice_leave
+        )
+        self.telemetry = TelemetryRegistry()  # 推流质量实时数据（FFmpeg 进度 + RTP 发包间隔）
+        self.playing_guilds = set()  # 正在播放歌曲的服务器，防止同一服务器重复启动播放
         self.bot_name = "Chad Bot"
         self.bot_version = "V1.3.1.0"
         self.author = "Chad Qin"
-        self.roll_info = {}  # 初始化 roll_info 属性
         # 修改：Excel 文件路径
         self.player_manager = HLTVPlayerManager(get_resource_path("data/HLTV_Player.xlsx"))
-        # 新增猜测功能状态
-        self.correct_player = None  # 正确选手名
-        self.guess_attempts = 0  # 剩余猜测次数
-        self.current_process = None  # 新增：保存FFmpeg进程对象
+        self.player_manager.start_watching(img_dir=get_resource_path("img"))  # 选手表或图片变化时后台热更新
+        # 本地图片按内容只上传一次，资源链接持久化复用
+        self.assets = AssetRegistry(lambda path: self.bot.client.create_asset(path),
+                                    get_resource_path("data/asset_cache.json"))
+        # 选手头像缩略图预先生成并上传，游戏卡片中直接引用链接
+        self.portraits = PortraitPipeline(
+            img_dir=get_resource_path("img"),
+            thumb_dir=get_resource_path("data/portraits"),
+            map_path=get_resource_path("data/portraits.json"),
+            registry=self.assets,
+        )
+        # 定时到期的状态（猜选手会话等）共用一个调度器
+        self.scheduler = ExpiryScheduler(name="到期调度")
+        # 猜选手游戏按频道保存，正确选手在开局时取出，名单热更新不影响进行中的游戏
+        self.guess_sessions = GuessSessionStore(self.scheduler, ttl=600, interest=self.intake.interest)
+        # 掷骰按频道分轮，每轮 5 分钟后公布最高点数并释放
+        self.roll_rounds = RollRoundStore(self.scheduler, self._announce_roll, duration=300)
+        self.ffmpeg_processes = {}  # type: Dict[str, subprocess.Popen]  # guild_id -> FFmpeg进程
+        self.play_queues = {}  # type: Dict[str, deque]  # guild_id -> 待播放歌曲队列
 
         # 新增：初始化FF14价格查询实例
         self.ff14_price_query = FF14PriceQuery()
+        # FF14 查询使用同步 requests，放到专用线程池执行，避免阻塞事件循环；
+        # 各 FF14 指令共用一组名额，名额在线程真正结束时才归还，超时放弃的查询仍占用名额直到请求超时返回
+        self._ff14_pool = ThreadPoolExecutor(max_workers=self.FF14_WORKERS, thread_name_prefix="ff14")
+        self._ff14_slots = asyncio.Semaphore(self.FF14_WORKERS)
+        # 物品图标镜像到 KOOK，卡片渲染时不再访问第三方图床
+        self.paginator = ReplyPaginator()  # 长文本查询结果以单条分页卡片发送
+        self.item_icons = ItemIconCache(lambda path: self.bot.client.create_asset(path),
+                                        get_resource_path("data/item_icons.json"))
+        # 频道消息经出站调度发送：同频道按序、跨频道并发，并遵守 KOOK 限速响应头
+        self.outbound = OutboundScheduler(self._kook_request)
+
+        self._setup_metrics()
 
         print("当前机器人版本: " + self.bot_version)
 
     def _setup_logging(self):
-        logging.basicConfig(
-            level=logging.DEBUG,
-            format='%(asctime)s.%(msecs)03d [%(levelname)s] %(name)s: %(message)s',
-            datefmt='%Y-%m-%d %H:%M:%S',
-            handlers=[
-                logging.StreamHandler(),
-                logging.FileHandler('debug.log', mode='w', encoding='utf-8')
-            ]
-        )
+        # 日志经内存队列由后台线程写入控制台与滚动的 JSON 行文件，事件循环线程不做磁盘 IO
+        self._log_listener = setup_logging(log_dir=get_resource_path("logs"))
         self.logger = logging.getLogger(__name__)
 
-        logging.getLogger('aiohttp').setLevel(logging.WARNING)
-        logging.getLogger('khl').setLevel(logging.WARNING)
+    def _setup_metrics(self):
+        """
+        设置环境变量 METRICS_PORT 时启用本机 Prometheus 指标接口
+
+        未启用时不挂任何钩子，指令分发与上游请求没有额外开销
+        """
+        self.metrics = None  # type: Optional[MetricsRegistry]
+        self.metrics_server = None  # type: Optional[MetricsServer]
+        self._trace_configs = []  # type: List[aiohttp.TraceConfig]
+        port = os.getenv("METRICS_PORT")
+        if not port:
+            return
+        self.metrics = MetricsRegistry()
+        self.metrics_server = MetricsServer(self.metrics, int(port))
+        self._trace_configs = [upstream_trace_config(self.metrics)]
+        self.item_icons.trace_configs = self._trace_configs
+        self.commands.observer = self.metrics.observe_command
+        loop = asyncio.get_event_loop()
+        # FF14 请求在线程池中完成，指标回到事件循环线程中记录
+        self.ff14_price_query.on_request = lambda *args: loop.call_soon_threadsafe(self.metrics.observe_url, *args)
+        self.metrics.add_collector(self._collect_metrics)
+
+    def _collect_metrics(self):
+        """抓取时现算的状态类指标：缓存命中率、会话数、队列与事件循环延迟"""
+        lru_caches = [self.music_cache.search, self.music_cache.urls, self.paginator.results]
+        for cache in lru_caches:
+            stats = cache.stats()
+            yield 'cache_hit_ratio', {'cache': cache.name}, stats['hit_ratio']
+            yield 'cache_entries', {'cache': cache.name}, stats['size']
+        for name, hits, misses in (('assets', self.assets.hits, self.assets.uploads),
+                                   ('item_icons', self.item_icons.hits, self.item_icons.misses)):
+            yield 'cache_hit_ratio', {'cache': name}, round(hits / (hits + misses), 4) if hits + misses else 0.0
+        yield 'voice_sessions', {}, len(self.voice_sessions.sessions)
+        yield 'ffmpeg_processes', {}, sum(1 for process in self.ffmpeg_processes.values() if process.poll() is None)
+        yield 'guess_sessions', {}, len(self.guess_sessions)
+        yield 'roll_rounds', {}, len(self.roll_rounds)
+        outbound = self.outbound.stats()
+        yield 'outbound_queued', {}, outbound['queued']
+        yield 'outbound_rate_limited', {}, outbound['rate_limited']
+        for name, stats in self.commands.stats().items():
+            yield 'command_rejected', {'command': name, 'reason': 'busy'}, stats['busy']
+            yield 'command_rejected', {'command': name, 'reason': 'cooldown'}, stats['throttled']
+        intake = self.intake.stats()
+        yield 'messages_received', {}, intake['received']
+        for reason, count in intake['dropped'].items():
+            yield 'messages_dropped', {'reason': reason}, count
+        yield 'event_loop_lag_seconds', {}, self.watchdog.last_lag
+        yield 'event_loop_max_lag_seconds', {}, self.watchdog.max_lag
+        yield 'event_loop_stalls', {}, self.watchdog.stalls
 
     def _init_event_loop(self):
         if sys.platform == 'win32':
@@ -98,90 +212,213 @@ class StableMusicBot:
             self._http = aiohttp.ClientSession(
                 timeout=aiohttp.ClientTimeout(total=15),
                 connector=aiohttp.TCPConnector(ssl=False, limit=10),
-                headers=headers
+                headers=headers,
+                trace_configs=self._trace_configs
             )
 
-    async def _fetch_music_data(self, query: str) -> Dict[str, Union[str, int]]:
+    async def _search_song(self, query: str) -> Dict[str, Union[str, int]]:
+        """调用搜索接口，返回首个匹配歌曲的 id/title/artist"""
+        search_params = {
+            "s": query,
+            "type": 1,
+            "limit": 1
+        }
+        async with self._http.get(self._api_endpoints[0], params=search_params) as resp:
+            if resp.status != 200:
+                raise status_error("搜索接口失败", resp.status)
+            data = await resp.json(content_type=None)
+            if data['code'] != 200 or data['result']['songCount'] == 0:
+                raise SongNotFoundError("未找到匹配的歌曲")
+
+            song = data['result']['songs'][0]
+            return {
+                'id': song['id'],
+                'title': song['name'],
+                'artist': song['artists'][0]['name']
+            }
+
+    async def _fetch_song_url(self, song_id: int) -> Tuple[str, Optional[int]]:
+        """获取歌曲播放链接，返回 (url, 链接有效期秒数)"""
+        url_params = {
+            "ids": f"[{song_id}]",
+            "br": 320000,
+            "csrf_token": ""
+        }
+        async with self._http.post(self._api_endpoints[1], data=url_params) as url_resp:
+            if url_resp.status != 200:
+                raise status_error("获取播放链接接口失败", url_resp.status)
+            url_data = await url_resp.json(content_type=None)
+
+            # ---------------------- 新增：内层 code 校验 ----------------------
+            if not url_data['data'] or len(url_data['data']) == 0:
+                raise NoPlayableUrlError("无可用播放数据")  # 兜底处理
+
+            inner_code = url_data['data'][0].get('code', None)
+            if inner_code == -110:
+                raise SongPaidError("歌曲需要付费，暂无法播放")  # 付费/版权限制
+            elif inner_code in [-202, -204]:
+                raise SongUnavailableError("歌曲不存在或已下架")  # 歌曲无效
+            elif inner_code != 200:
+                raise PermanentMusicError(f"播放链接错误码: {inner_code}")  # 其他业务错误
+
+            if url_data['data'][0]['url'] is None:
+                raise NoPlayableUrlError("无可用播放链接")  # url 为空（如免费歌曲无资源）
+            # -------------------------------------------------------------
+
+            return url_data['data'][0]['url'], url_data['data'][0].get('expi')
+
+    async def _fetch_song_urls(self, song_ids: Iterable[int]) -> Dict[int, str]:
+        """
+        批量获取播放链接（player/url 接口的 ids 参数支持数组）
+
+        付费、下架或无资源的歌曲在同一轮请求中被过滤，只返回可播放的 {song_id: url}，
+        结果同时写入播放链接缓存
+        """
         await self._ensure_http()
-        for retry in range(3):
-            search_url = self._api_endpoints[0]
-            search_params = {
-                "s": query,
-                "type": 1,
-                "limit": 1
+        song_ids = list(dict.fromkeys(song_ids))
+        playable = {}
+        for start in range(0, len(song_ids), self.URL_BATCH_SIZE):
+            batch = song_ids[start:start + self.URL_BATCH_SIZE]
+            url_params = {
+                "ids": json.dumps(batch),
+                "br": 320000,
+                "csrf_token": ""
             }
-            try:
-                async with self._http.get(search_url, params=search_params) as resp:
+
+            async def request():
+                async with self._http.post(self._api_endpoints[1], data=url_params) as resp:
                     if resp.status != 200:
-                        raise ValueError(f"搜索接口失败，状态码: {resp.status}")  # 新增：接口层错误
-                    data = await resp.json(content_type=None)
-                    if data['code'] != 200 or data['result']['songCount'] == 0:
-                        raise ValueError("未找到匹配的歌曲")  # 原有逻辑
-
-                    song = data['result']['songs'][0]
-                    song_id = song['id']
-                    url_url = self._api_endpoints[1]
-                    url_params = {
-                        "ids": f"[{song_id}]",
-                        "br": 320000,
-                        "csrf_token": ""
-                    }
-                    async with self._http.post(url_url, data=url_params) as url_resp:
-                        if url_resp.status != 200:
-                            raise ValueError(f"获取播放链接接口失败，状态码: {url_resp.status}")  # 新增：接口层错误
-                        url_data = await url_resp.json(content_type=None)
-
-                        # ---------------------- 新增：内层 code 校验 ----------------------
-                        if not url_data['data'] or len(url_data['data']) == 0:
-                            raise ValueError("无可用播放数据")  # 兜底处理
-
-                        inner_code = url_data['data'][0].get('code', None)
-                        if inner_code == -110:
-                            raise ValueError("歌曲需要付费，暂无法播放")  # 付费/版权限制
-                        elif inner_code in [-202, -204]:
-                            raise ValueError("歌曲不存在或已下架")  # 歌曲无效
-                        elif inner_code != 200:
-                            raise ValueError(f"播放链接错误码: {inner_code}")  # 其他业务错误
-
-                        if url_data['data'][0]['url'] is None:
-                            raise ValueError("无可用播放链接")  # url 为空（如免费歌曲无资源）
-                        # -------------------------------------------------------------
-
-                        return {
-                            'url': url_data['data'][0]['url'],
-                            'title': song['name'],
-                            'artist': song['artists'][0]['name']
-                        }
-            except Exception as e:
-                self.logger.error(f"[搜索/获取链接] 异常: {str(e)}")
-                if retry == 2:  # 重试三次失败后抛出
-                    raise ValueError(str(e))
-        raise ValueError("未找到匹配的歌曲")
+                        raise status_error("获取播放链接接口失败", resp.status)
+                    return (await resp.json(content_type=None)).get('data') or []
+
+            for item in await call_with_retry(request, self.music_breaker):
+                if item.get('code') == 200 and item.get('url'):
+                    playable[item['id']] = item['url']
+                    self.music_cache.put_url(item['id'], item['url'], item.get('expi'))
+        self.logger.info(f"[批量获取链接] 共 {len(song_ids)} 首，可播放 {len(playable)} 首")
+        return playable
+
+    @staticmethod
+    def _parse_track(song: dict) -> Dict[str, Union[str, int]]:
+        """兼容新旧接口字段（ar/artists）的歌曲信息解析"""
+        artists = song.get('ar') or song.get('artists') or [{}]
+        return {
+            'id': song['id'],
+            'title': song.get('name', ''),
+            'artist': artists[0].get('name') or '未知歌手'
+        }
+
+    async def _fetch_song_details(self, song_ids: List[int]) -> List[Dict[str, Union[str, int]]]:
+        """批量获取歌曲名与歌手，按传入顺序返回"""
+        details = {}
+        for start in range(0, len(song_ids), self.DETAIL_BATCH_SIZE):
+            batch = song_ids[start:start + self.DETAIL_BATCH_SIZE]
+            params = {"c": json.dumps([{"id": song_id} for song_id in batch])}
+
+            async def request():
+                async with self._http.post(self._api_endpoints[4], data=params) as resp:
+                    if resp.status != 200:
+                        raise status_error("获取歌曲详情接口失败", resp.status)
+                    return (await resp.json(content_type=None)).get('songs') or []
+
+            for song in await call_with_retry(request, self.music_breaker):
+                details[song['id']] = self._parse_track(song)
+        return [details[song_id] for song_id in song_ids if song_id in details]
+
+    async def _fetch_playlist_tracks(self, playlist_id: str) -> List[Dict[str, Union[str, int]]]:
+        """获取歌单全部歌曲；接口只内联部分 tracks 时，其余歌曲通过 song/detail 批量补全"""
+        await self._ensure_http()
+
+        async def request():
+            params = {"id": playlist_id, "n": 100000}
+            async with self._http.get(self._api_endpoints[2], params=params) as resp:
+                if resp.status != 200:
+                    raise status_error("获取歌单接口失败", resp.status)
+                data = await resp.json(content_type=None)
+                if data.get('code') != 200 or not data.get('playlist'):
+                    raise SongNotFoundError("歌单不存在或无法访问")
+                return data['playlist']
+
+        playlist = await call_with_retry(request, self.music_breaker)
+        known = {song['id']: self._parse_track(song) for song in playlist.get('tracks') or []}
+        track_ids = [item['id'] for item in playlist.get('trackIds') or []] or list(known)
+        missing = [song_id for song_id in track_ids if song_id not in known]
+        if missing:
+            for track in await self._fetch_song_details(missing):
+                known[track['id']] = track
+        return [known[song_id] for song_id in track_ids if song_id in known]
+
+    async def _fetch_album_tracks(self, album_id: str) -> List[Dict[str, Union[str, int]]]:
+        """获取专辑全部歌曲"""
+        await self._ensure_http()
+
+        async def request():
+            async with self._http.get(self._api_endpoints[3].format(album_id=album_id)) as resp:
+                if resp.status != 200:
+                    raise status_error("获取专辑接口失败", resp.status)
+                data = await resp.json(content_type=None)
+                if data.get('code') != 200:
+                    raise SongNotFoundError("专辑不存在或无法访问")
+                return data.get('songs') or (data.get('album') or {}).get('songs') or []
+
+        return [self._parse_track(song) for song in await call_with_retry(request, self.music_breaker)]
+
+    async def _fetch_music_data(self, query: str) -> Dict[str, Union[str, int]]:
+        """
+        搜索并获取播放链接
+
+        永久错误（无结果、付费、下架）立即抛出；临时错误按指数退避重试，
+        网易云持续不可用时由熔断器直接抛出 CircuitOpenError
+        """
+        await self._ensure_http()
+
+        # 第一级缓存：搜索词 -> 歌曲信息
+        song = self.music_cache.get_song(query)
+        if song is None:
+            song = await call_with_retry(lambda: self._search_song(query), self.music_breaker)
+            self.music_cache.put_song(query, song)
+
+        # 第二级缓存：歌曲ID -> 播放链接（按链接有效期过期）
+        stream_url = self.music_cache.get_url(song['id'])
+        if stream_url is None:
+            stream_url, expires_in = await call_with_retry(
+                lambda: self._fetch_song_url(song['id']), self.music_breaker
+            )
+            self.music_cache.put_url(song['id'], stream_url, expires_in)
+        else:
+            self.logger.debug(f"[搜索/获取链接] 命中缓存: {song['title']} ({song['id']})")
+
+        return {
+            'id': song['id'],
+            'url': stream_url,
+            'title': song['title'],
+            'artist': song['artist']
+        }
 
     async def _join_user_voice_channel(self, msg: Message):
         author = msg.author
         guild_id = msg.ctx.guild.id
         await self._ensure_http()
-        channel_list_url = f"https://www.kaiheila.cn/api/v3/channel/list?guild_id={guild_id}"
+        channel_list_url = f"{self._kook_api}/channel/list?guild_id={guild_id}"
         self.logger.info(f"[获取频道列表] 请求 URL: {channel_list_url}")
         try:
             async with self._http.get(channel_list_url) as resp:
                 if resp.status != 200:
                     self.logger.error(f"[获取频道列表] 失败，状态码: {resp.status}")
-                    await msg.reply("获取频道列表失败，请稍后重试。")
+                    await self._reply(msg, "获取频道列表失败，请稍后重试。")
                     return None
                 channel_list_data = await resp.json()
                 channels = channel_list_data.get('data', {}).get('items', [])
         except Exception as e:
             self.logger.error(f"[获取频道列表] 异常: {str(e)}")
-            await msg.reply("获取频道列表时发生异常，请稍后重试。")
+            await self._reply(msg, "获取频道列表时发生异常，请稍后重试。")
             return None
 
         voice_channel = None
         for channel in channels:
             if isinstance(channel, dict) and channel.get('type') == 2:
                 try:
-                    user_list_url = f"https://www.kaiheila.cn/api/v3/channel/user-list?channel_id={channel['id']}"
+                    user_list_url = f"{self._kook_api}/channel/user-list?channel_id={channel['id']}"
                     async with self._http.get(user_list_url) as resp:
                         if resp.status != 200:
                             continue
@@ -193,45 +430,105 @@ class StableMusicBot:
                     self.logger.error(f"[获取用户列表] 异常: {str(e)}")
 
         if not voice_channel:
-            await msg.reply("你没有在语音频道中，请先加入一个语音频道。")
+            await self._reply(msg, "你没有在语音频道中，请先加入一个语音频道。")
             return None
 
-        join_url = "https://www.kaiheila.cn/api/v3/voice/join"
-        data = {"channel_id": voice_channel['id']}
-        self.logger.info(f"[加入语音频道] 请求 URL: {join_url}, 参数: {data}")
         try:
-            async with self._http.post(join_url, json=data) as resp:
-                if resp.status != 200:
-                    self.logger.error(f"[加入语音频道] 失败，状态码: {resp.status}")
-                    await msg.reply(f"加入语音频道失败: 状态码{resp.status}")
-                    return None
-                join_result = await resp.json()
-                self.current_stream_params = {
-                    "audio_ssrc": join_result['data']['audio_ssrc'],
-                    "audio_pt": join_result['data']['audio_pt'],
-                    "ip": join_result['data']['ip'],
-                    "port": join_result['data']['port'],
-                    "rtcp_port": join_result['data']['rtcp_port']
-                }
-                self.logger.info(f"已加入 {voice_channel['name']} 语音频道")
-                return voice_channel
+            params = await self._voice_join(voice_channel['id'])
+            await self.voice_sessions.open(guild_id, voice_channel['id'], voice_channel['name'], params)
+            self.logger.info(f"已加入 {voice_channel['name']} 语音频道")
+            return voice_channel
         except Exception as e:
             self.logger.error(f"[加入语音频道] 异常: {str(e)}")
-            await msg.reply(f"加入语音频道失败: {str(e)}")
+            await self._reply(msg, f"加入语音频道失败: {str(e)}")
             return None
 
-    async def _safe_play(self, msg: Message, query: str):
-        self.logger.info(f"[播放歌曲] 进入函数，当前推流参数: {self.current_stream_params}")
-        if self.is_playing:
-            await msg.reply("当前正在播放其他歌曲，请稍候。")
-            return
+    async def _kook_request(self, route: str, payload: dict) -> Tuple[int, dict, dict]:
+        """出站调度使用的底层请求，返回 (状态码, 响应头, 响应 JSON)"""
+        await self._ensure_http()
+        async with self._http.post(f"{self._kook_api}/{route}", json=payload) as resp:
+            return resp.status, resp.headers, await resp.json(content_type=None)
+
+    async def _reply(self, msg: Message, content: Union[str, CardMessage], wait: bool = False):
+        """
+        回复频道消息（引用原消息）
+
+        频道消息交给出站调度排队发送，默认入队后立即返回，频道限速的等待不计入指令耗时；
+        需要拿到发送结果（msg_id）时传 wait=True。私聊等其他消息仍走 msg.reply
+        """
+        if not isinstance(msg, PublicMessage):
+            return await msg.reply(content)
+        if isinstance(content, CardMessage):
+            payload = {"type": 10, "content": json.dumps(content)}
+        else:
+            payload = {"type": 9, "content": str(content)}
+        payload.update(target_id=msg.channel.id, quote=msg.id)
+        future = self.outbound.enqueue(msg.channel.id, "message/create", payload)
+        if wait:
+            return await future
+        future.add_done_callback(self._log_send_failure)
+        return None
+
+    def _log_send_failure(self, future: asyncio.Future):
+        if not future.cancelled() and future.exception() is not None:
+            self.logger.warning(f"[出站调度] 消息发送失败: {future.exception()}")
+
+    async def _update_message(self, channel_id: str, msg_id: str, card_msg: CardMessage):
+        """调用 message/update 原地替换卡片消息内容"""
+        data = {"msg_id": msg_id, "content": json.dumps(card_msg)}
+        try:
+            await self.outbound.submit(channel_id, "message/update", data)
+        except Exception as e:
+            self.logger.warning(f"[分页] 消息更新失败: {e}")
+
+    async def _voice_join(self, channel_id: str) -> dict:
+        """调用 voice/join，返回推流参数 (audio_ssrc, audio_pt, ip, port, rtcp_port)"""
+        await self._ensure_http()
+        join_url = f"{self._kook_api}/voice/join"
+        data = {"channel_id": channel_id}
+        self.logger.info(f"[加入语音频道] 请求 URL: {join_url}, 参数: {data}")
+        async with self._http.post(join_url, json=data) as resp:
+            if resp.status != 200:
+                raise ValueError(f"状态码{resp.status}")
+            join_result = await resp.json()
+            if join_result.get('code', 0) != 0:
+                raise ValueError(join_result.get('message', f"错误码{join_result.get('code')}"))
+            return {
+                "audio_ssrc": join_result['data']['audio_ssrc'],
+                "audio_pt": join_result['data']['audio_pt'],
+                "ip": join_result['data']['ip'],
+                "port": join_result['data']['port'],
+                "rtcp_port": join_result['data']['rtcp_port']
+            }
+
+    async def _voice_keepalive(self, channel_id: str) -> bool:
+        """调用 voice/keep-alive，会话仍有效时返回 True"""
+        await self._ensure_http()
+        async with self._http.post(f"{self._kook_api}/voice/keep-alive", json={"channel_id": channel_id}) as resp:
+            if resp.status != 200:
+                return False
+            return (await resp.json()).get('code', 0) == 0
 
+    async def _voice_leave(self, channel_id: str) -> bool:
+        await self._ensure_http()
+        async with self._http.post(f"{self._kook_api}/voice/leave", json={"channel_id": channel_id}) as resp:
+            if resp.status != 200:
+                self.logger.error(f"[离开语音频道] 失败，状态码: {resp.status}")
+            return resp.status == 200
+
+    def _get_play_queue(self, guild_id: str) -> deque:
+        if guild_id not in self.play_queues:
+            self.play_queues[guild_id] = deque()
+        return self.play_queues[guild_id]
+
+    async def _safe_play(self, msg: Message, query: str):
+        guild_id = msg.ctx.guild.id
+        session = self.voice_sessions.get(guild_id)
+        self.logger.info(f"[播放歌曲] 进入函数，当前推流参数: {session.params if session else {}}")
         try:
-            self.is_playing = True
-            if not self.current_stream_params:
+            if guild_id not in self.playing_guilds and not session:
                 await self._join_user_voice_channel(msg)
-                if not self.current_stream_params:
-                    self.is_playing = False
+                if not self.voice_sessions.get(guild_id):
                     return
 
             # 获取音乐数据（包含精准异常抛出）
@@ -239,305 +536,353 @@ class StableMusicBot:
 
             # 确保播放链接有效（防御性检查）
             if not music_data.get('url'):
-                raise ValueError("无可用播放链接")
-
-            await msg.reply(f"🎵 正在播放: {music_data['title']} - {music_data['artist']}")
-
-            # 构建 ffmpeg 命令（音质优化核心参数）
-            stream_url = music_data['url']
-            ffmpeg_cmd = [
-                'ffmpeg', '-re', '-i', stream_url,
-                '-bufsize', '8192k', '-map', '0:a:0',
-                '-acodec', 'libopus',  # 使用高效的 Opus 编码
-                '-vbr', 'on',  # 可变码率优化音质
-                '-ab', '50k',  # 提升码率至 50k（原 48k 过低）
-                '-ac', '2',  # 保持立体声
-                '-ar', '48000',  # 专业级采样率
-                '-filter:a', 'volume=0.5',  # 音量控制（可选）
-                '-f', 'tee',
-                f'[select=a:f=rtp:ssrc={self.current_stream_params["audio_ssrc"]}:payload_type={self.current_stream_params["audio_pt"]}]'
-                f'rtp://{self.current_stream_params["ip"]}:{self.current_stream_params["port"]}?rtcpport={self.current_stream_params["rtcp_port"]}'
-            ]
-            self.logger.info(f"[播放歌曲] ffmpeg 命令: {' '.join(ffmpeg_cmd)}")
-
-            # 执行 FFmpeg 进程
-            loop = asyncio.get_running_loop()
-            process = await loop.run_in_executor(
-                None,
-                lambda: subprocess.Popen(
-                    ffmpeg_cmd,
-                    stdout=subprocess.PIPE,
-                    stderr=subprocess.PIPE,
-                    text=True
-                )
-            )
+                raise NoPlayableUrlError("无可用播放链接")
 
-            stdout, stderr = await loop.run_in_executor(
-                None,
-                process.communicate
-            )
-            self.logger.info(f"[播放歌曲] ffmpeg 标准输出: {stdout if stdout else '无'}")
-            self.logger.info(f"[播放歌曲] ffmpeg 标准错误: {stderr if stderr else '无'}")
+        except MusicAPIError as e:
+            # 按异常类型回复（由 _fetch_music_data 抛出的分类异常）
+            await self._reply(msg, e.user_message)
+            self.logger.error(f"[播放歌曲] 业务错误({type(e).__name__}): {str(e)}")
+            return
 
-            if process.returncode != 0:
-                self.logger.error(f"[播放歌曲] ffmpeg 执行失败，返回码: {process.returncode}")
-                await msg.reply("歌曲播放失败，请检查日志")
-            else:
-                self.logger.info("[播放歌曲] ffmpeg 执行成功")
-
-            self.is_playing = False
-
-        except ValueError as e:
-            # 精准错误处理（与 _fetch_music_data 抛出的异常匹配）
-            error_msg = str(e)
-            if "歌曲需要付费，暂无法播放" in error_msg:
-                await msg.reply("❌ 歌曲需要付费，暂无法播放")
-            elif "歌曲不存在或已下架" in error_msg:
-                await msg.reply("❌ 歌曲不存在或已下架")
-            elif "无可用播放链接" in error_msg:
-                await msg.reply("❌ 该歌曲暂无免费播放资源")
-            elif "搜索接口失败" in error_msg or "获取播放链接接口失败" in error_msg:
-                await msg.reply("⚠️ 网络请求失败，请稍后重试")
-            else:
-                await msg.reply(f"❌ 播放失败: {error_msg}")
-            self.logger.error(f"[播放歌曲] 业务错误: {error_msg}")
+        except Exception as e:
+            # 通用系统异常处理
+            await self._reply(msg, "⚠️ 系统异常，请稍后重试")
+            self.logger.critical(f"[播放歌曲] 系统异常: {str(e)}", exc_info=True)
+            return
+
+        # 队列中只保存歌曲信息，播放链接在轮到时从缓存获取（链接会过期）
+        track = {key: music_data[key] for key in ('id', 'title', 'artist')}
+        queue = self._get_play_queue(guild_id)
+        if guild_id in self.playing_guilds:
+            if len(queue) >= self.MAX_QUEUE_SIZE:
+                return await self._reply(msg, f"❌ 播放队列已满（{self.MAX_QUEUE_SIZE} 首），请稍后再点歌")
+            queue.append(track)
+            await self._reply(msg, f"➕ 已加入播放队列（第 {len(queue)} 首）: {track['title']} - {track['artist']}")
+            return
+        queue.appendleft(track)
+        await self._run_play_queue(msg)
+
+    async def _run_play_queue(self, msg: Message):
+        """依次播放当前服务器队列中的歌曲，离开语音频道时停止"""
+        guild_id = msg.ctx.guild.id
+        if guild_id in self.playing_guilds:
+            return
+        queue = self._get_play_queue(guild_id)
+        try:
+            self.playing_guilds.add(guild_id)
+            while queue and self.voice_sessions.get(guild_id):
+                track = queue.popleft()
+                try:
+                    stream_url = self.music_cache.get_url(track['id'])
+                    if stream_url is None:
+                        # 连同队列前几首一起批量解析，减少请求次数
+                        lookahead = [track['id']] + [
+                            item['id'] for item in list(queue)[:self.QUEUE_PREFETCH - 1]
+                            if item['id'] not in self.music_cache.urls
+                        ]
+                        stream_url = (await self._fetch_song_urls(lookahead)).get(track['id'])
+                    if not stream_url:
+                        await self._reply(msg, f"⏭️ 跳过无法播放的歌曲: {track['title']} - {track['artist']}")
+                        continue
+
+                    # 后台测量当前及队列中已有链接的歌曲响度，不阻塞本次播放
+                    self.loudness.schedule(track['id'], stream_url)
+                    for item in list(queue)[:self.QUEUE_PREFETCH]:
+                        prefetched_url = self.music_cache.get_url(item['id'])
+                        if prefetched_url:
+                            self.loudness.schedule(item['id'], prefetched_url)
+
+                    await self._reply(msg, f"🎵 正在播放: {track['title']} - {track['artist']}")
+                    await self._stream_track(msg, {**track, 'url': stream_url})
+
+                except CircuitOpenError as e:
+                    queue.appendleft(track)
+                    await self._reply(msg, e.user_message)
+                    break
+
+                except MusicAPIError as e:
+                    await self._reply(msg, e.user_message)
+                    self.logger.error(f"[播放歌曲] 业务错误({type(e).__name__}): {str(e)}")
 
         except Exception as e:
             # 通用系统异常处理
-            await msg.reply("⚠️ 系统异常，请稍后重试")
+            await self._reply(msg, "⚠️ 系统异常，请稍后重试")
             self.logger.critical(f"[播放歌曲] 系统异常: {str(e)}", exc_info=True)
 
         finally:
             # 确保播放状态重置（防止重复播放）
-            self.is_playing = False
-            if self.current_process and self.current_process.poll() is None:
+            self.playing_guilds.discard(guild_id)
+            process = self.ffmpeg_processes.pop(guild_id, None)
+            if process and process.poll() is None:
                 try:
-                    self.current_process.terminate()  # 终止可能残留的进程
+                    process.terminate()  # 终止可能残留的进程
                 except Exception:
                     pass
 
+    async def _stream_track(self, msg: Message, music_data: Dict[str, Union[str, int]]):
+        """使用 FFmpeg 将歌曲推流到当前语音频道，播放结束后返回"""
+        guild_id = msg.ctx.guild.id
+        session = self.voice_sessions.get(guild_id)
+        if not session:
+            return
+
+        # 构建 ffmpeg 命令（编码参数由服务器档位或主机负载决定）
+        stream_url = music_data['url']
+        profile = self.encoder_profiles.select(guild_id)
+        ffmpeg_cmd = [
+            'ffmpeg', '-nostats', '-progress', 'pipe:1',  # 进度信息输出到 stdout，用于实时质量统计
+            '-re', '-i', stream_url,
+            '-bufsize', '8192k', '-map', '0:a:0',
+            *profile.ffmpeg_args(),  # libopus 码率、压缩等级、帧长、线程数
+            '-filter:a', self.loudness.get_filter(music_data['id']),  # 按已测响度归一化音量（未测量时为 0.5）
+            '-f', 'tee',
+            session.ffmpeg_target()  # 推流到本地中继，重新加入频道时由中继切换目标，无需重启编码
+        ]
+        self.logger.info(f"[播放歌曲] ffmpeg 命令: {' '.join(ffmpeg_cmd)}")
+
+        # 执行 FFmpeg 进程
+        loop = asyncio.get_running_loop()
+        process = await loop.run_in_executor(
+            None,
+            lambda: subprocess.Popen(
+                ffmpeg_cmd,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE,
+                text=True
+            )
+        )
+        self.ffmpeg_processes[guild_id] = process  # 保存进程对象，便于 /leave 时终止
+        stats = self.telemetry.start(guild_id, music_data['title'], profile.frame_duration)
+        session.relay.on_packet = stats.on_packet
+
+        try:
+            stderr = await loop.run_in_executor(None, self._pump_ffmpeg_output, process, stats)
+        finally:
+            session.relay.on_packet = None
+            self.ffmpeg_processes.pop(guild_id, None)
+            self.telemetry.finish(stats, process.returncode if process.returncode is not None else -1)
+        self.logger.info(f"[播放歌曲] 推流统计: {stats.snapshot()}")
+        if process.returncode != 0:
+            # 只在失败时输出 stderr 末尾几行，成功时仅在 DEBUG 级别记录
+            tail = '\n'.join(stderr.strip().splitlines()[-10:]) if stderr else '无'
+            self.logger.error(f"[播放歌曲] ffmpeg 执行失败，返回码: {process.returncode}，标准错误末尾:\n{tail}")
+            self.music_cache.invalidate_url(music_data['id'])  # 链接可能已失效，下次重新获取
+            await self._reply(msg, "歌曲播放失败，请检查日志")
+        else:
+            self.logger.info("[播放歌曲] ffmpeg 执行成功")
+            self.logger.debug(f"[播放歌曲] ffmpeg 标准错误: {stderr if stderr else '无'}")
+
+    @staticmethod
+    def _pump_ffmpeg_output(process: subprocess.Popen, stats: StreamStats) -> str:
+        """在线程中逐行读取 -progress 输出并更新统计，同时收集 stderr 末尾内容，等待进程结束"""
+        stderr_tail = deque(maxlen=50)
+        stderr_reader = threading.Thread(target=lambda: stderr_tail.extend(process.stderr), daemon=True)
+        stderr_reader.start()
+        for line in process.stdout:
+            stats.on_progress_line(line)
+        process.wait()
+        stderr_reader.join(timeout=1)
+        return ''.join(stderr_tail)
+
     async def _leave_voice_channel(self, msg: Message):
         await self._ensure_http()
-        leave_url = "https://www.kaiheila.cn/api/v3/voice/leave"
         try:
             bot_id = self.bot.me.id
             guild_id = msg.ctx.guild.id
-            channel_list_url = f"https://www.kaiheila.cn/api/v3/channel/list?guild_id={guild_id}"
-            async with self._http.get(channel_list_url) as resp:
-                channels = (await resp.json()).get('data', {}).get('items', [])
+            session = self.voice_sessions.get(guild_id)
 
             voice_channel = None
-            for channel in channels:
-                if isinstance(channel, dict) and channel.get('type') == 2:
-                    try:
-                        user_list_url = f"https://www.kaiheila.cn/api/v3/channel/user-list?channel_id={channel['id']}"
-                        async with self._http.get(user_list_url) as resp:
-                            users = (await resp.json()).get('data', [])
-                            if any(user['id'] == bot_id for user in users):
-                                voice_channel = channel
-                                break
-                    except Exception as e:
-                        self.logger.error(f"[检查用户列表] 异常: {str(e)}")
+            if session:
+                # 已知会话直接使用记录的频道 ID，无需逐个扫描频道
+                voice_channel = {'id': session.channel_id, 'name': session.channel_name}
+            else:
+                channel_list_url = f"{self._kook_api}/channel/list?guild_id={guild_id}"
+                async with self._http.get(channel_list_url) as resp:
+                    channels = (await resp.json()).get('data', {}).get('items', [])
+
+                for channel in channels:
+                    if isinstance(channel, dict) and channel.get('type') == 2:
+                        try:
+                            user_list_url = f"{self._kook_api}/channel/user-list?channel_id={channel['id']}"
+                            async with self._http.get(user_list_url) as resp:
+                                users = (await resp.json()).get('data', [])
+                                if any(user['id'] == bot_id for user in users):
+                                    voice_channel = channel
+                                    break
+                        except Exception as e:
+                            self.logger.error(f"[检查用户列表] 异常: {str(e)}")
 
             if voice_channel:
-                data = {"channel_id": voice_channel['id']}
-                async with self._http.post(leave_url, json=data) as resp:
-                    if resp.status == 200:
-                        # ---------------------- 新增核心逻辑 ----------------------
-                        # 1. 终止FFmpeg播放进程
-                        if self.current_process and self.current_process.poll() is None:
-                            try:
-                                self.logger.info("[离开频道] 尝试终止FFmpeg播放进程")
-                                self.current_process.terminate()  # 优雅终止进程
-                                await asyncio.sleep(0.5)  # 等待进程响应
-                                if self.current_process.poll() is None:
-                                    self.current_process.kill()  # 强制终止（超时未响应时）
-                                self.logger.info("[离开频道] FFmpeg进程已终止")
-                            except Exception as e:
-                                self.logger.error(f"[离开频道] 终止进程失败: {str(e)}")
-                        # 2. 重置播放状态
-                        self.is_playing = False
-                        self.current_stream_params = {}  # 清空推流参数
-                        # ---------------------------------------------------------
-                        await msg.reply("已离开语音频道")
-                    else:
-                        await msg.reply(f"离开失败，状态码: {resp.status}")
+                if await self._voice_leave(voice_channel['id']):
+                    # ---------------------- 新增核心逻辑 ----------------------
+                    # 1. 终止FFmpeg播放进程
+                    process = self.ffmpeg_processes.pop(guild_id, None)
+                    if process and process.poll() is None:
+                        try:
+                            self.logger.info("[离开频道] 尝试终止FFmpeg播放进程")
+                            process.terminate()  # 优雅终止进程
+                            await asyncio.sleep(0.5)  # 等待进程响应
+                            if process.poll() is None:
+                                process.kill()  # 强制终止（超时未响应时）
+                            self.logger.info("[离开频道] FFmpeg进程已终止")
+                        except Exception as e:
+                            self.logger.error(f"[离开频道] 终止进程失败: {str(e)}")
+                    # 2. 重置播放状态
+                    self.playing_guilds.discard(guild_id)
+                    await self.voice_sessions.close(guild_id)  # 停止保活并关闭中继
+                    self.play_queues.pop(guild_id, None)  # 清空播放队列
+                    # ---------------------------------------------------------
+                    await self._reply(msg, "已离开语音频道")
+                else:
+                    await self._reply(msg, "离开语音频道失败，请稍后重试")
             else:
-                await msg.reply("机器人不在语音频道中，无需离开。")
+                await self._reply(msg, "机器人不在语音频道中，无需离开。")
         except Exception as e:
             self.logger.error(f"[离开语音频道] 异常: {str(e)}")
-            await msg.reply(f"离开语音频道失败: {str(e)}")
+            await self._reply(msg, f"离开语音频道失败: {str(e)}")
+
+    def _register_commands(self):
+        """指令表：名称、别名、参数、并发上限、冷却与超时"""
+        self.commands = CommandRouter(self._reply)
+        add = self.commands.add
+        # 播放类指令会一直等待到队列播完，不设超时；也不设并发上限（同一服务器的重复播放由 playing_guilds 拒绝），
+        # 运行期间只计入进行中的指令统计，不占用其他指令的名额
+        add('play', self.play_cmd, params=(Param('query', required=False),), timeout=None)
+        add('playlist', self.playlist_cmd, params=(Param('source', required=False),), timeout=None)
+        add('album', self.album_cmd, params=(Param('source', required=False),), timeout=None)
+        add('profile', self.profile_cmd, params=(Param('profile', required=False),))
+        add('capacity', self.capacity_cmd, max_concurrency=1, cooldown=30)
+        add('stats', self.stats_cmd)
+        add('come', self.come_cmd)
+        add('leave', self.leave_cmd)
+        add('help', self.help_cmd)
+        add('wiki', self.wiki_cmd)
+        add('price', self.price_cmd)
+        add('sim', self.sim_cmd)
+        add('hq_helper', self.precrafts_cmd, aliases=('hq',))
+        add('act_cafe', self.act_cafe_cmd)
+        add('act_diemoe', self.act_diemoe_cmd)
+        add('idn', self.idn_cmd)
+        add('roll', self.roll_cmd)
+        add('id', self.id_cmd)
+        add('guess', self.guess_cmd)
+        add('result', self.result_cmd)
+        add('hint', self.hint_cmd)
+        # FF14 查询访问第三方接口，限制并发并按用户冷却，避免刷屏时请求堆积
+        ff14 = dict(max_concurrency=4, cooldown=3, timeout=30)
+        add('tax', self.tax_cmd, params=(Param('server', required=False),), **ff14)
+        add('query', self.query_cmd, params=(Param('server'), Param('item')),
+            usage="用法：/query {服务器名} {物品名}\n示例：/query 海猫茶屋 黑星石", **ff14)
+        add('sold', self.sold_history_cmd,
+            params=(Param('server'), Param('item'), Param('count', int, error="条目数量必须是数字！")),
+            usage="用法：/sold {大区名} {物品名} {条目数量}\n示例：/sold 猫小胖 黑星石 5", **ff14)
+        add('market', self.market_cmd, params=(Param('server'), Param('item')),
+            usage="用法：/market {大区名} {物品名}\n示例：/market 猫小胖 黑星石", **ff14)
 
     def _register_handlers(self):
+        self._register_commands()
+
+        @self.bot.on_event(EventTypes.MESSAGE_BTN_CLICK)
+        async def handle_button_click(_: Bot, event: Event):
+            value = event.body.get('value', '')
+            card_msg = self.paginator.on_click(value)
+            if card_msg is None:
+                if value.startswith(f"{BUTTON_PREFIX}:"):
+                    self.logger.info(f"[分页] 查询结果已过期: {value}")
+                return
+            await self._update_message(event.body.get('target_id', ''), event.body['msg_id'], card_msg)
+
+        @self.bot.on_startup
+        async def on_startup(bot: Bot):
+            self.watchdog.start()
+            if self.metrics_server is not None:
+                try:
+                    await self.metrics_server.start()
+                except OSError as e:
+                    self.logger.error(f"[指标] 指标接口启动失败: {e}")
+            try:
+                self.intake.self_id = (await bot.client.fetch_me()).id
+            except Exception as e:
+                self.logger.warning(f"[消息入口] 获取机器人自身ID失败: {e}")
+            await self._prepare_portraits()
+
         @self.bot.on_message()
         async def handle_all_messages(msg: Message):
             content = msg.content.strip()
-            if not content.startswith('/'):
-                # 处理猜测逻辑（非指令消息）
-                await self.handle_guess(msg)
+            kind = self.intake.classify(msg, content)
+            if kind is None:
                 return
+            guild = getattr(msg.ctx, 'guild', None)
+            guild_var.set(guild.id if guild else None)  # 本次消息处理期间的日志带上服务器ID
+            if kind is COMMAND:
+                await self.commands.dispatch(msg, content)
+            else:
+                # 有猜选手游戏的频道中的聊天消息
+                await self.handle_guess(msg)
 
-            # 处理指令消息
-            parts = content[1:].split(' ', 1)
-            command = parts[0].lower()
-            args = parts[1] if len(parts) > 1 else ''
-
-            if command == 'play':
-                await self.play_cmd(msg, args)
-            elif command == 'come':
-                await self.come_cmd(msg)
-            elif command == 'leave':
-                await self.leave_cmd(msg)
-            elif command == 'help':
-                await self.help_cmd(msg)
-            elif command == 'wiki':
-                await self.wiki_cmd(msg)
-            elif command == 'price':
-                await self.price_cmd(msg)
-            elif command == 'sim':
-                await self.sim_cmd(msg)
-            elif command == 'hq_helper':
-                await self.precrafts_cmd(msg)
-            elif command == 'act_cafe':
-                await self.act_cafe_cmd(msg)
-            elif command == 'act_diemoe':
-                await self.act_diemoe_cmd(msg)
-            elif command == 'idn':
-                await self.idn_cmd(msg)
-            elif command == 'roll':
-                await self.roll_cmd(msg)
-            elif command == 'id':
-                await self.id_cmd(msg)
-            elif command == 'guess':
-                await self.guess_cmd(msg)
-            elif command == 'result':
-                await self.result_cmd(msg)
-            elif command == 'tax':
-                await self.tax_cmd(msg,args)
-            elif command == 'query':
-                # 确保参数存在且包含空格（服务器名和物品名）
-                if not args or ' ' not in args:
-                    await msg.reply("用法：/query {服务器名} {物品名}\n示例：/query 海猫茶屋 黑星石")
-                    return
-                # 以第一个空格为界，分割服务器名和物品名
-                server_name, item_name = args.split(' ', 1)
-                # 调用查询方法
-                await self.query_cmd(msg, server_name, item_name)
-            elif command == 'sold':
-                if command == 'sold':
-                    params = args.split(' ', 2)
-                    if len(params) < 3:
-                        await msg.reply("用法：/sold {大区名} {物品名} {条目数量}\n示例：/sold 猫小胖 黑星石 5")
-                        return
-                    server, item, count = params[0], params[1], params[2]
-                    if not count.isdigit():
-                        await msg.reply("条目数量必须是数字！")
-                        return
-                    await self.sold_history_cmd(msg, server, item, int(count))
-            elif command == 'market':
-                params = args.split(' ', 1)
-                if len(params) < 2:
-                    await msg.reply("用法：/market {大区名} {物品名}\n示例：/market 猫小胖 黑星石")
-                    return
-                server, item = params[0], params[1]
-                await self.market_cmd(msg, server, item)
+    async def _prepare_portraits(self):
+        """启动时在后台补齐选手头像，名单热更新后（监视线程回调）再按新名单补齐"""
+        loop = asyncio.get_running_loop()
+        self.player_manager.on_reload = lambda names: loop.call_soon_threadsafe(self.portraits.ensure_prepared, names)
+        sorted_names, _ = await loop.run_in_executor(None, self.player_manager.get_sorted_player_names)
+        self.portraits.ensure_prepared(sorted_names)
+
+    async def _ff14(self, func, *args):
+        """在 FF14 线程池中执行 FF14PriceQuery 的同步查询"""
+        await self._ff14_slots.acquire()
+        future = asyncio.get_running_loop().run_in_executor(self._ff14_pool, func, *args)
+        future.add_done_callback(lambda _: self._ff14_slots.release())
+        # 指令超时只取消等待，不取消已提交的查询，名额随查询结束归还
+        return await asyncio.shield(future)
+
+    async def _item_image_url(self, item_name: str) -> Optional[str]:
+        """物品图标链接：优先使用已镜像到 KOOK 的图标，首次查询时镜像"""
+        icon = await self._ff14(self.ff14_price_query.get_item_icon, item_name)
+        if not icon:
+            return None
+        item_id, source_url = icon
+        return await self.item_icons.get_url(item_id, source_url)
 
     async def market_cmd(self, msg: Message, server_name: str, item_name: str):
         """查询市场板信息并添加图片"""
         self.logger.info(f"查询 {server_name} 大区 {item_name} 的市场板信息")
 
         # 获取物品图片 URL
-        item_image_url = self.ff14_price_query.get_item_image_url(item_name)
+        item_image_url = await self._item_image_url(item_name)
 
         # 获取市场板信息文本（保持原有逻辑）
-        market_info = self.ff14_price_query.get_formatted_market_listings(server_name, item_name)
+        market_info = await self._ff14(self.ff14_price_query.get_formatted_market_listings, server_name, item_name)
 
         if not market_info:
-            return await msg.reply("❌ 未找到市场板信息")
-
-        # 构建包含图片的卡片消息（与 sold_history_cmd 一致）
-        card = Card()
-        if item_image_url:  # 若存在图片 URL
-            card.append(Module.Container(
-                Element.Image(src=item_image_url, size=Types.Size.LG)  # 大尺寸图片
-            ))
-
-        # 处理长消息（超过2000字符时分段发送）
-        if len(market_info) > 1900:
-            parts = []
-            current_part = ""
-            for line in market_info.split('\n'):
-                if len(current_part) + len(line) + 1 > 1900:
-                    parts.append(current_part)
-                    current_part = line
-                else:
-                    current_part += '\n' + line if current_part else line
-            if current_part:
-                parts.append(current_part)
-
-            # 先发送图片卡片，再分段发送文本
-            if item_image_url:
-                await msg.reply(CardMessage(card))
-            for part in parts:
-                await msg.reply(part)
-        else:
-            # 直接发送图片卡片和文本
-            if item_image_url:
-                await msg.reply(CardMessage(card))
-            await msg.reply(market_info)
+            return await self._reply(msg, "❌ 未找到市场板信息")
+
+        # 图标与文本放在同一张分页卡片中，只发送一条消息
+        await self._reply(msg, self.paginator.first_page(market_info, item_image_url))
 
     async def sold_history_cmd(self, msg: Message, server_name: str, item_name: str, count: int):
         """查询物品销售历史并添加图片"""
         self.logger.info(f"查询 {server_name} 大区 {item_name} 的最近 {count} 条销售记录")
 
         # 获取物品图片 URL
-        item_image_url = self.ff14_price_query.get_item_image_url(item_name)
+        item_image_url = await self._item_image_url(item_name)
 
         # 获取销售历史文本
-        history = self.ff14_price_query.get_sale_history(server_name, item_name, count)
+        history = await self._ff14(self.ff14_price_query.get_sale_history, server_name, item_name, count)
 
         if not history:
-            return await msg.reply("❌ 未找到销售历史数据")
-
-        # 构建包含图片的卡片消息
-        card = Card()
-        if item_image_url:  # 若存在图片 URL
-            card.append(Module.Container(
-                Element.Image(src=item_image_url, size=Types.Size.LG)  # 大尺寸图片
-            ))
-
-        # 处理长消息（超过2000字符时分段发送）
-        if len(history) > 1900:
-            parts = []
-            current_part = ""
-            for line in history.split('\n'):
-                if len(current_part) + len(line) + 1 > 1900:
-                    parts.append(current_part)
-                    current_part = line
-                else:
-                    current_part += '\n' + line if current_part else line
-            if current_part:
-                parts.append(current_part)
-
-            # 先发送图片卡片，再分段发送文本
-            if item_image_url:
-                await msg.reply(CardMessage(card))
-            for part in parts:
-                await msg.reply(part)
-        else:
-            # 直接发送图片卡片和文本
-            if item_image_url:
-                await msg.reply(CardMessage(card))
-            await msg.reply(history)
+            return await self._reply(msg, "❌ 未找到销售历史数据")
+
+        # 图标与文本放在同一张分页卡片中，只发送一条消息
+        await self._reply(msg, self.paginator.first_page(history, item_image_url))
 
     async def query_cmd(self, msg: Message, server_name: str, item_name: str):
         self.logger.info(f"接收到 /query 指令：服务器={server_name}, 物品={item_name}")
 
-        item_image_url = self.ff14_price_query.get_item_image_url(item_name)
-        price_info = self.ff14_price_query.item_query(server_name, item_name)
+        item_image_url = await self._item_image_url(item_name)
+        price_info = await self._ff14(self.ff14_price_query.item_query, server_name, item_name)
 
         if not price_info:
-            return await msg.reply("❌ 未获取到物品信息")
+            return await self._reply(msg, "❌ 未获取到物品信息")
 
         # 解析更新时间（假设第一行为"数据更新时间：2025-06-05 12:34:56"）
         lines = price_info.split('\n')
@@ -551,38 +896,17 @@ class StableMusicBot:
         content_lines = [line for line in lines if not line.startswith("数据更新时间：")]
         new_price_info = f"{title}\n\n" + "\n".join(content_lines)
 
-        # 发送图片和文本（逻辑不变）
-        card = Card()
-        if item_image_url:
-            card.append(Module.Container(Element.Image(src=item_image_url, size=Types.Size.LG)))
-
-        if len(new_price_info) > 1900:
-            # 分段发送逻辑不变
-            parts = []
-            current_part = ""
-            for line in new_price_info.split('\n'):
-                if len(current_part) + len(line) + 1 > 1900:
-                    parts.append(current_part)
-                    current_part = line
-                else:
-                    current_part += '\n' + line if current_part else line
-            if item_image_url:
-                await msg.reply(CardMessage(card))
-            for part in parts:
-                await msg.reply(part)
-        else:
-            if item_image_url:
-                await msg.reply(CardMessage(card))
-            await msg.reply(new_price_info)
+        # 图标与文本放在同一张分页卡片中，只发送一条消息
+        await self._reply(msg, self.paginator.first_page(new_price_info, item_image_url))
 
     async def tax_cmd(self, msg: Message, server_name: str):
         """查询大区税率"""
         if not server_name:
-            return await msg.reply("用法：/tax {大区名}，例如：/tax 海猫茶屋")
+            return await self._reply(msg, "用法：/tax {大区名}，例如：/tax 海猫茶屋")
 
-        tax_rates = self.ff14_price_query.get_market_tax_rates(server_name)
+        tax_rates = await self._ff14(self.ff14_price_query.get_market_tax_rates, server_name)
         if not tax_rates:
-            return await msg.reply("❌ 未找到该大区的税率信息")
+            return await self._reply(msg, "❌ 未找到该大区的税率信息")
 
         # 格式化输出（中文城市名 + 税率）
         formatted_rates = []
@@ -590,14 +914,123 @@ class StableMusicBot:
             city_cn = self.ff14_price_query.cities_translate.get(city_en, city_en)
             formatted_rates.append(f"{city_cn}: {rate:.2f}%")
 
-        await msg.reply(f"📊 {server_name} 大区税率（数据来源：Universalis）：\n" + "\n".join(formatted_rates))
+        await self._reply(msg, f"📊 {server_name} 大区税率（数据来源：Universalis）：\n" + "\n".join(formatted_rates))
 
 
     async def play_cmd(self, msg: Message, query: str):
         self.logger.info(f"接收到 /play 指令，参数: {query}")
-        time.sleep(0.5)
         await self._safe_play(msg, query)
 
+    async def playlist_cmd(self, msg: Message, args: str):
+        self.logger.info(f"接收到 /playlist 指令，参数: {args}")
+        await self._import_tracks(msg, args, "歌单")
+
+    async def album_cmd(self, msg: Message, args: str):
+        self.logger.info(f"接收到 /album 指令，参数: {args}")
+        await self._import_tracks(msg, args, "专辑")
+
+    async def _import_tracks(self, msg: Message, args: str, kind: str):
+        """导入歌单/专辑：拉取曲目列表，批量解析播放链接并过滤不可播放的歌曲后加入队列"""
+        # 支持直接粘贴分享链接，如 https://music.163.com/#/playlist?id=123
+        match = re.search(r'[?&]id=(\d+)', args) or re.fullmatch(r'\s*(\d+)\s*', args)
+        if not match:
+            command = "playlist" if kind == "歌单" else "album"
+            return await self._reply(msg, f"用法：/{command} {{{kind}ID或链接}}\n示例：/{command} 3778678")
+        source_id = match.group(1)
+
+        guild_id = msg.ctx.guild.id
+        try:
+            if guild_id not in self.playing_guilds and not self.voice_sessions.get(guild_id):
+                await self._join_user_voice_channel(msg)
+                if not self.voice_sessions.get(guild_id):
+                    return
+
+            if kind == "歌单":
+                tracks = await self._fetch_playlist_tracks(source_id)
+            else:
+                tracks = await self._fetch_album_tracks(source_id)
+            if not tracks:
+                return await self._reply(msg, f"❌ {kind}中没有歌曲")
+
+            playable = await self._fetch_song_urls(track['id'] for track in tracks)
+        except MusicAPIError as e:
+            self.logger.error(f"[导入{kind}] 业务错误({type(e).__name__}): {str(e)}")
+            return await self._reply(msg, e.user_message)
+
+        queue = self._get_play_queue(guild_id)
+        available = [track for track in tracks if track['id'] in playable]
+        accepted = available[:self.MAX_QUEUE_SIZE - len(queue)]
+        queue.extend(accepted)
+
+        skipped = len(tracks) - len(available)
+        reply_text = f"📃 已从{kind}导入 {len(accepted)} 首歌曲"
+        if skipped:
+            reply_text += f"，跳过 {skipped} 首付费/下架歌曲"
+        if len(accepted) < len(available):
+            reply_text += f"，队列已满，{len(available) - len(accepted)} 首未加入"
+        await self._reply(msg, reply_text)
+
+        if guild_id not in self.playing_guilds:
+            await self._run_play_queue(msg)
+
+    async def profile_cmd(self, msg: Message, args: str):
+        """查看或设置本服务器的编码档位"""
+        guild_id = msg.ctx.guild.id
+        name = args.strip().lower()
+        options = "、".join(f"{key}({profile.label})" for key, profile in PROFILES.items())
+        if not name:
+            current = self.encoder_profiles.guild_profiles.get(guild_id, "auto")
+            return await self._reply(msg, f"当前编码档位: {current}\n可选档位: {options}、auto(按主机负载自动选择)")
+        if name == "auto":
+            self.encoder_profiles.set_guild_profile(guild_id, None)
+            return await self._reply(msg, "✅ 已恢复自动选择编码档位")
+        if name not in PROFILES:
+            return await self._reply(msg, f"用法：/profile {{档位}}\n可选档位: {options}、auto")
+        self.encoder_profiles.set_guild_profile(guild_id, name)
+        await self._reply(msg, f"✅ 编码档位已设置为 {name}({PROFILES[name].label})，下一首歌生效")
+
+    async def capacity_cmd(self, msg: Message):
+        """测量本机各编码档位的单路 CPU 开销并估算可承载的并发推流数"""
+        await self._reply(msg, "⏳ 正在测量编码性能，约需一分钟...")
+        loop = asyncio.get_running_loop()
+        try:
+            report = await loop.run_in_executor(None, plan_capacity)
+        except Exception as e:
+            self.logger.error(f"[容量评估] 失败: {str(e)}")
+            return await self._reply(msg, f"❌ 容量评估失败: {str(e)}")
+        lines = [f"🖥️ 本机 {next(iter(report.values()))['cores']} 核，按 70% CPU 预算估算："]
+        for name, item in report.items():
+            lines.append(f"{name}({item['label']}): 单路 {item['cpu_per_stream']:.2%} 核，最多约 {item['max_streams']} 路并发")
+        await self._reply(msg, "\n".join(lines))
+
+    async def stats_cmd(self, msg: Message):
+        """显示本服务器推流质量与全局汇总"""
+        guild_id = msg.ctx.guild.id
+        lines = []
+        stream = self.telemetry.guild_snapshot(guild_id)
+        if stream:
+            session = self.voice_sessions.get(guild_id)
+            speed = f"{stream['speed']:.2f}x" if stream['speed'] is not None else "N/A"
+            bitrate = f"{stream['bitrate_kbps']:.1f}kbps" if stream['bitrate_kbps'] is not None else "N/A"
+            lines.append(f"📈 本服务器推流（{'播放中' if stream['active'] else '已结束'}）: {stream['title']}")
+            lines.append(f"编码速度: {speed}  码率: {bitrate}  已播放: {stream['out_time']}s")
+            lines.append(f"发包: {stream['packets']}  抖动: {stream['jitter_ms']}ms  最大间隔: {stream['max_gap_ms']}ms  断流: {stream['underruns']} 次")
+            lines.append(f"异常退出: {stream['abnormal_exits']} 次  语音重连: {session.reconnects if session else 0} 次")
+        else:
+            lines.append("本服务器暂无推流记录")
+        total = self.telemetry.aggregate()
+        lines.append(
+            f"\n🖥️ 全局: {total['active_streams']} 路推流，最低编码速度 "
+            f"{total['min_speed'] if total['min_speed'] is not None else 'N/A'}，最大抖动 {total['max_jitter_ms']}ms，"
+            f"断流 {total['underruns']} 次{'，⚠️ 主机过载' if total['overloaded'] else ''}"
+        )
+        outbound = self.outbound.stats()
+        lines.append(
+            f"📤 消息队列: 待发 {outbound['queued']} 条，最大积压 {outbound['max_depth']}，"
+            f"平均等待 {outbound['avg_wait_ms']}ms，限速 {outbound['rate_limited']} 次，失败 {outbound['failed']} 次"
+        )
+        await self._reply(msg, "\n".join(lines))
+
     async def come_cmd(self, msg: Message):
         self.logger.info(f"接收到 /come 指令")
         await self._join_user_voice_channel(msg)
@@ -606,8 +1039,8 @@ class StableMusicBot:
         await self._leave_voice_channel(msg)
 
     async def help_cmd(self, msg: Message):
-        await msg.reply(
-            "/help:\t指令帮助\n/idn:\t版本信息\n/play {歌曲名}:\t点歌\n/leave:\t把机器人踢出语音频道\n/wiki:\t查询wiki\n/price:\t查询价格\n/sim:\t生产模拟\n/hq_helper:\t配方查询\n/act_cafe:\t咖啡ACT下载链接\n/act_diemoe:\t呆萌ACT下载链接\n/roll:\t掷骰子（1 - 999）\n/ID:\t查看选手名单\n/GUESS:\t开始猜测选手\n/RESULT:\t显示结果(猜测正确时自动触发)\n/TAX {服务器名称}:\t显示该大区市场税率\n/QUERY {服务器名称} {物品名称}:\t查询物品销售情况\n/SOLD {大区名称} {物品名称} {条目数量}:\t查询物品已售出历史\n/MARKET {大区名称} {物品名称}:\t查询市场板上该物品上架信息"
+        await self._reply(msg,
+            "/help:\t指令帮助\n/idn:\t版本信息\n/play {歌曲名}:\t点歌\n/playlist {歌单ID}:\t导入网易云歌单\n/album {专辑ID}:\t导入网易云专辑\n/leave:\t把机器人踢出语音频道\n/profile {档位}:\t设置推流编码档位\n/capacity:\t评估本机推流并发容量\n/stats:\t查看推流质量\n/wiki:\t查询wiki\n/price:\t查询价格\n/sim:\t生产模拟\n/hq_helper:\t配方查询\n/act_cafe:\t咖啡ACT下载链接\n/act_diemoe:\t呆萌ACT下载链接\n/roll:\t掷骰子（1 - 999，5 分钟内点数最高者获胜）\n/ID:\t查看选手名单\n/GUESS:\t开始猜测选手\n/HINT:\t消耗一次机会获取提示\n/RESULT:\t显示结果(猜测正确时自动触发)\n/TAX {服务器名称}:\t显示该大区市场税率\n/QUERY {服务器名称} {物品名称}:\t查询物品销售情况\n/SOLD {大区名称} {物品名称} {条目数量}:\t查询物品已售出历史\n/MARKET {大区名称} {物品名称}:\t查询市场板上该物品上架信息"
         )
 
     wiki_image_src = 'https://av.huijiwiki.com/site_avatar_ff14_l.png?1745349668'
@@ -640,7 +1073,7 @@ class StableMusicBot:
             )
         )
         card_msg = CardMessage(card)
-        await msg.reply(card_msg)
+        await self._reply(msg, card_msg)
 
     async def price_cmd(self, msg: Message):
         url = 'https://www.ff14pvp.top/#/'
@@ -665,7 +1098,7 @@ class StableMusicBot:
             )
         )
         card_msg = CardMessage(card)
-        await msg.reply(card_msg)
+        await self._reply(msg, card_msg)
 
     async def sim_cmd(self, msg: Message):
         url = 'https://tnze.yyyy.games/#/welcome'
@@ -690,7 +1123,7 @@ class StableMusicBot:
             )
         )
         card_msg = CardMessage(card)
-        await msg.reply(card_msg)
+        await self._reply(msg, card_msg)
 
     async def precrafts_cmd(self, msg: Message):
         url = 'https://hqhelper.nbb.fan/#/'
@@ -715,7 +1148,7 @@ class StableMusicBot:
             )
         )
         card_msg = CardMessage(card)
-        await msg.reply(card_msg)
+        await self._reply(msg, card_msg)
 
     async def act_cafe_cmd(self, msg: Message):
         url = 'https://www.ffcafe.cn/act/'
@@ -740,7 +1173,7 @@ class StableMusicBot:
             )
         )
         card_msg = CardMessage(card)
-        await msg.reply(card_msg)
+        await self._reply(msg, card_msg)
 
     async def act_diemoe_cmd(self, msg: Message):
         url = 'https://act.diemoe.net/'
@@ -765,7 +1198,7 @@ class StableMusicBot:
             )
         )
         card_msg = CardMessage(card)
-        await msg.reply(card_msg)
+        await self._reply(msg, card_msg)
 
     async def idn_cmd(self, msg: Message):
         card = Card(theme=Types.Theme.PRIMARY, size=Types.Size.LG, color=Color(hex_color='#007BFF'))
@@ -788,27 +1221,40 @@ class StableMusicBot:
             )
         ))
         card_msg = CardMessage(card)
-        await msg.reply(card_msg)
+        await self._reply(msg, card_msg)
 
     async def roll_cmd(self, msg: Message):
-        random_num = random.randint(1, 999)
-        channel_id = msg.channel.id
-        user_id = msg.author.id
-        if channel_id not in self.roll_info:
-            self.roll_info[channel_id] = {
-                'end_time': datetime.datetime.now() + datetime.timedelta(minutes=5),
-                'results': {},
-                'total_people': 0
-            }
-        self.roll_info[channel_id]['results'][user_id] = random_num
-        self.roll_info[channel_id]['total_people'] += 1
+        current, value, is_new = self.roll_rounds.roll(msg.channel.id, msg.author.id)
+        minutes, seconds = divmod(int(current.remaining()), 60)
+        if is_new:
+            text = f"你掷出了: **(font){value}(font)[pink]**"
+        else:
+            text = f"你本轮已掷出: **(font){value}(font)[pink]**，每人每轮只算第一次"
+        best, _ = current.winners()
         card = Card(
             Module.Section(
-                text=Element.Text(content=f"你掷出了: **(font){random_num}(font)[pink]**", type=Types.Text.KMD)
+                text=Element.Text(content=text, type=Types.Text.KMD)
+            ),
+            Module.Context(
+                Element.Text(content=f"本轮 {current.participants} 人参与，当前最高 {best}，{minutes} 分 {seconds} 秒后公布结果",
+                             type=Types.Text.PLAIN)
             )
         )
         card_msg = CardMessage(card)
-        await msg.reply(card_msg)
+        await self._reply(msg, card_msg)
+
+    async def _announce_roll(self, current: RollRound):
+        """掷骰轮次结束：在频道内公布最高点数"""
+        best, winners = current.winners()
+        mentions = " ".join(f"(met){user_id}(met)" for user_id in winners)
+        card = Card(
+            Module.Header(f"🎲 本轮掷骰结束（{current.participants} 人参与）"),
+            Module.Section(
+                text=Element.Text(content=f"最高点数 **(font){best}(font)[pink]**：{mentions}", type=Types.Text.KMD)
+            )
+        )
+        payload = {"type": 10, "content": json.dumps(CardMessage(card)), "target_id": current.channel_id}
+        await self.outbound.submit(current.channel_id, "message/create", payload)
 
     async def id_cmd(self, msg: Message):
         sorted_names, player_count = self.player_manager.get_sorted_player_names()
@@ -817,106 +1263,140 @@ class StableMusicBot:
             reply_msg = f"选手名单（共 {player_count} 人）：\n{player_list}"
         else:
             reply_msg = "未找到选手数据。"
-        await msg.reply(reply_msg)
+        await self._reply(msg, reply_msg)
 
     async def guess_cmd(self, msg: Message):
         sorted_names, player_count = self.player_manager.get_sorted_player_names()
         if player_count == 0:
-            await msg.reply("未找到选手数据，无法开始猜测。")
+            await self._reply(msg, "未找到选手数据，无法开始猜测。")
             return
 
-        self.correct_player = random.choice(sorted_names)
-        # print(self.correct_player)
-        self.guess_attempts = 7
-        await msg.reply(f"已抽取一名选手，请猜测他的名字！你有 {self.guess_attempts} 次机会。\n直接发送选手名进行猜测！")
+        correct = self.player_manager.get_player(random.choice(sorted_names))
+        session = self.guess_sessions.start(msg.channel.id, correct, attempts=7)
+        await self._reply(msg, f"已抽取一名选手，请猜测他的名字！你有 {session.attempts} 次机会。\n直接发送选手名进行猜测！")
 
     async def handle_guess(self, msg: Message):
-        if not self.correct_player or self.guess_attempts <= 0:
+        session = self.guess_sessions.get(msg.channel.id)
+        if session is None:
             return
 
         guess = msg.content.strip()
-        player_info = self.player_manager.get_player_info(guess)
+        guessed, suggestions = self.player_manager.resolve_player(guess)
 
-        if "未找到" in player_info:
-            await msg.reply("该选手不存在，请重新输入！")
+        if guessed is None:
+            # 只有与某个选手名足够接近时才提示；其余一律视为普通聊天，不回复也不消耗次数
+            if suggestions and self._looks_like_player_name(guess):
+                await self._reply(msg, f"该选手不存在，你是不是想猜：{'、'.join(suggestions)}？")
             return
 
-        # 获取正确选手信息
-        correct_info = self.player_manager.get_player_info(self.correct_player)
-        if "未找到" in correct_info:
-            await msg.reply("内部错误：无法获取正确选手信息")
-            self.correct_player = None
-            self.guess_attempts = 0
-            return
-
-        # 解析正确选手数据
-        correct_data = correct_info.split('\n')[1].split('\t')
-        correct_dict = {
-            "AGE": correct_data[3] if len(correct_data) > 3 else "",
-            "MAJ_NUM": correct_data[5] if len(correct_data) > 5 else ""
-        }
-
-        if guess == self.correct_player:
-            await self.send_correct_result(msg, correct_data)
-            self.correct_player = None
-            self.guess_attempts = 0
+        correct = session.correct
+        # 先更新会话再发送回复，避免同一频道并发的猜测重复结算
+        if guessed.name == correct.name:
+            self.guess_sessions.end(session.channel_id)
+            await self.send_correct_result(msg, correct)
         else:
-            self.guess_attempts -= 1
-            fixed_headers = ["NAME", "TEAM", "NATION", "AGE", "ROLE", "MAJ_NUM"]
-            data = player_info.split('\n')[1]
-            data_items = data.split('\t')
-            reply_text = ""
-
-            for i, header in enumerate(fixed_headers):
-                if i < len(data_items):
-                    value = data_items[i]
-                    # 处理完全匹配（最高优先级）
-                    if i < len(correct_data) and value.strip() == correct_data[i].strip():
-                        value += "✅"
-                    # 处理国籍区域提示（仅当不完全匹配时）
-                    elif header == "NATION" and i < len(correct_data):
-                        correct_nation = correct_data[i].strip()
-                        guess_nation = value.strip()
-                        # 获取两个国家的区域（使用反向映射）
-                        correct_region = self.player_manager.get_country_region(correct_nation)
-                        guess_region = self.player_manager.get_country_region(guess_nation)
-                        # 判断是否属于同一区域（且非完全匹配）
-                        if correct_region and guess_region and correct_region == guess_region and guess_nation != correct_nation:
-                            value += f" (同属{correct_region})"  # 替换为具体区域名称
-                    # 处理数字比较提示 (AGE和MAJ_NUM)
-                    elif header in ["AGE", "MAJ_NUM"]:
-                        try:
-                            user_value = int(value)
-                            correct_value = int(correct_dict.get(header, 0))
-                            diff = abs(user_value - correct_value)
-                            if diff <= 2:
-                                value += " 🔺" if user_value > correct_value else " 🔻"
-                        except ValueError:
-                            pass  # 非数字值不处理
-                    # 修正：将这一行移到外层if语句下，确保所有字段都被添加到回复中
-                    reply_text += f"- {header} :\t{value}\n"
-                else:
-                    reply_text += f"- {header} :\t\n"
-
-            if self.guess_attempts > 0:
-                await msg.reply(f"猜测错误！你还有 {self.guess_attempts} 次机会。\n你猜测的选手信息：\n{reply_text}")
+            session.attempts -= 1
+            session.guesses.append(guessed)
+            reply_text = self._format_guess_feedback(guessed, correct)
+
+            if session.attempts > 0:
+                self.guess_sessions.touch(session.channel_id)
+                reply_text += self._format_remaining(session)
+                await self._reply_with_portrait(
+                    msg, guessed, f"猜测错误！你还有 {session.attempts} 次机会。\n你猜测的选手信息：\n{reply_text}")
             else:
-                await self.send_fail_result(msg, correct_data)
-                self.correct_player = None
-                self.guess_attempts = 0
-
-    async def send_correct_result(self, msg: Message, correct_data):
-        fixed_headers = ["NAME", "TEAM", "NATION", "AGE", "ROLE", "MAJ_NUM"]
-        correct_text = "\n".join([f"- {h} :\t{v}✅" for h, v in zip(fixed_headers, correct_data)])
+                self.guess_sessions.end(session.channel_id)
+                await self.send_fail_result(msg, correct)
+
+    def _format_remaining(self, session) -> str:
+        hint_index = self.player_manager.get_hint_index()
+        if hint_index is None:
+            return ""
+        return f"根据已有线索，还剩 {hint_index.count(session.guesses, session.correct, session.revealed)} 名可能的选手"
+
+    async def hint_cmd(self, msg: Message):
+        """消耗一次机会，公开最能缩小候选范围的一项属性"""
+        session = self.guess_sessions.get(msg.channel.id)
+        if session is None:
+            await self._reply(msg, "请先通过 /GUESS 开始猜测！")
+            return
+        if session.attempts <= 1:
+            await self._reply(msg, "只剩最后一次机会了，不能再使用提示！")
+            return
+        hint_index = self.player_manager.get_hint_index()
+        hint = hint_index.smart_hint(session.guesses, session.correct, session.revealed) if hint_index else None
+        if hint is None:
+            await self._reply(msg, f"现有线索已经足够，请直接猜测！\n{self._format_remaining(session)}")
+            return
+        field, label, value, remaining = hint
+        session.attempts -= 1
+        session.revealed.append(field)
+        self.guess_sessions.touch(session.channel_id)
+        await self._reply(msg, f"💡 提示：他的{label}是 {value}，还剩 {remaining} 名可能的选手。\n你还有 {session.attempts} 次机会。")
+
+    async def _reply_with_portrait(self, msg: Message, record: PlayerRecord, text: str):
+        """头像已预上传时以卡片形式附带选手头像，否则发送纯文本"""
+        portrait_url = self.portraits.url_for(record.name)
+        if not portrait_url:
+            await self._reply(msg, text)
+            return
+        card = Card(
+            Module.Section(
+                text=Element.Text(content=text, type=Types.Text.PLAIN),
+                accessory=Element.Image(src=portrait_url, size=Types.Size.SM)
+            )
+        )
+        await self._reply(msg, CardMessage(card))
+
+    @staticmethod
+    def _looks_like_player_name(text: str) -> bool:
+        """
+        选手名较短、基本不含空格且不带标点；长句、纯中文聊天、带标点的句子以及 nice、ok 这类
+        短词即使与某个选手名相近也不提示
+        """
+        key = normalize_name(text)
+        return (0 < len(text) <= 24 and text.count(' ') <= 1 and bool(key) and not PlayerNameIndex.is_short(key)
+                and any(ch.isascii() and ch.isalnum() for ch in text))
+
+    @staticmethod
+    def _format_guess_feedback(guessed: PlayerRecord, correct: PlayerRecord) -> str:
+        """逐项对比猜测选手与正确选手，生成提示文本"""
+        reply_text = ""
+        guessed_values = guessed.display_values()
+        correct_values = correct.display_values()
+        numeric_fields = {"AGE": (guessed.age, correct.age), "MAJ_NUM": (guessed.majors, correct.majors)}
+
+        for header, value, correct_value in zip(PLAYER_FIELDS, guessed_values, correct_values):
+            # 处理完全匹配（最高优先级）
+            if value == correct_value:
+                value += "✅"
+            # 处理国籍区域提示（仅当不完全匹配时）
+            elif header == "NATION":
+                if correct.region and correct.region == guessed.region:
+                    value += f" (同属{correct.region})"  # 替换为具体区域名称
+            # 处理数字比较提示 (AGE和MAJ_NUM)
+            elif header in numeric_fields:
+                user_value, target_value = numeric_fields[header]
+                if user_value is not None and target_value is not None and abs(user_value - target_value) <= 2:
+                    value += " 🔺" if user_value > target_value else " 🔻"
+            reply_text += f"- {header} :\t{value}\n"
+        return reply_text
+
+    @staticmethod
+    def _format_answer(record: PlayerRecord) -> str:
+        return "\n".join([f"- {h} :\t{v}✅" for h, v in zip(PLAYER_FIELDS, record.display_values())])
+
+    async def send_correct_result(self, msg: Message, correct: PlayerRecord):
+        correct_text = self._format_answer(correct)
         # 修改：庆祝图片路径
         self.celebrate_image_path = get_resource_path("img/celebrate.png")
-        # 上传庆祝图片
+        # 获取庆祝图片链接（同一内容只上传一次）
         try:
-            img_url = await self.bot.client.create_asset(self.celebrate_image_path)
+            img_url = await self.assets.get_url(self.celebrate_image_path)
         except Exception as e:
             self.logger.error(f"庆祝图片上传失败: {e}")
-            await msg.reply("🎉 猜中啦！不过庆祝图片发送失败，请联系管理员检查路径~")
-            await msg.reply(correct_text)
+            await self._reply(msg, "🎉 猜中啦！不过庆祝图片发送失败，请联系管理员检查路径~")
+            await self._reply(msg, correct_text)
             return
 
         # 创建卡片
@@ -927,24 +1407,20 @@ class StableMusicBot:
         )
 
         # 发送消息
-        await msg.reply(CardMessage(card))
-        await msg.reply(correct_text)
-
-        self.correct_player = None
-        self.guess_attempts = 0
+        await self._reply(msg, CardMessage(card))
+        await self._reply_with_portrait(msg, correct, correct_text)
 
-    async def send_fail_result(self, msg: Message, correct_data):
+    async def send_fail_result(self, msg: Message, correct: PlayerRecord):
         """猜测次数用尽时发送失败图片和正确答案"""
-        fixed_headers = ["NAME", "TEAM", "NATION", "AGE", "ROLE", "MAJ_NUM"]
-        correct_text = "\n".join([f"- {h} :\t{v}✅" for h, v in zip(fixed_headers, correct_data)])
+        correct_text = self._format_answer(correct)
         # 修改：失败图片路径
         self.fail_image_path = get_resource_path("img/sad.png")
-        # 上传失败图片（与其他场景逻辑一致）
+        # 获取失败图片链接（与其他场景逻辑一致）
         try:
-            img_url = await self.bot.client.create_asset(self.fail_image_path)
+            img_url = await self.assets.get_url(self.fail_image_path)
         except Exception as e:
             self.logger.error(f"失败图片上传失败: {e}")
-            await msg.reply(f"很遗憾，你的7次机会已用完！\n正确答案是：\n{correct_text}")
+            await self._reply(msg, f"很遗憾，你的7次机会已用完！\n正确答案是：\n{correct_text}")
             return
 
         # 创建失败卡片（结构与猜对卡片一致，仅标题和图片不同）
@@ -955,35 +1431,28 @@ class StableMusicBot:
         )
 
         # 发送卡片和文本（与其他场景一致）
-        await msg.reply(CardMessage(card))
-        await msg.reply(f"正确答案是：\n{correct_text}")
+        await self._reply(msg, CardMessage(card))
+        await self._reply_with_portrait(msg, correct, f"正确答案是：\n{correct_text}")
 
     async def result_cmd(self, msg: Message):
-        if not self.correct_player:
-            await msg.reply("请先通过 /GUESS 开始猜测！")
+        session = self.guess_sessions.end(msg.channel.id)  # 公布答案即结束本局
+        if session is None:
+            await self._reply(msg, "请先通过 /GUESS 开始猜测！")
             return
 
-        player_info = self.player_manager.get_player_info(self.correct_player)
-        if player_info.startswith("未找到") or player_info.startswith("数据加载失败"):
-            await msg.reply(player_info)
-            self.correct_player = None
-            self.guess_attempts = 0
-            return
-
-        correct_data = player_info.split('\n')[1].split('\t')
-        fixed_headers = ["NAME", "TEAM", "NATION", "AGE", "ROLE", "MAJ_NUM"]
-        correct_text = "\n".join([f"- {h} :\t{v}✅" for h, v in zip(fixed_headers, correct_data)])
+        correct = session.correct
+        correct_text = self._format_answer(correct)
         # 修改：嘲讽图片路径
         self.taunt_image_path = get_resource_path("img/taunt.png")
-        # 上传图片并获取URL
+        # 获取图片URL（首次使用时上传）
         try:
-            img_url = await self.bot.client.create_asset(self.taunt_image_path)
+            img_url = await self.assets.get_url(self.taunt_image_path)
             if not img_url:
-                await msg.reply("❌ 图片上传失败，请检查文件路径")
+                await self._reply(msg, "❌ 图片上传失败，请检查文件路径")
                 return
         except Exception as e:
             self.logger.error(f"图片上传异常: {str(e)}")
-            await msg.reply(f"❌ 图片上传异常: {str(e)}")
+            await self._reply(msg, f"❌ 图片上传异常: {str(e)}")
             return
 
         # 创建卡片消息：文本和图片在同一卡片中
@@ -994,26 +1463,43 @@ class StableMusicBot:
         )
 
         # 发送卡片消息
-        await msg.reply(CardMessage(card))
-
-        # 单独发送选手信息（保持纯文本）
-        await msg.reply(correct_text)
+        await self._reply(msg, CardMessage(card))
 
-        self.correct_player = None
-        self.guess_attempts = 0
+        # 单独发送选手信息（附带选手头像）
+        await self._reply_with_portrait(msg, correct, correct_text)
 
     async def cleanup(self):
+        self.logger.info(f"[缓存统计] 音乐缓存: {self.music_cache.stats()}")
+        self.logger.info(f"[缓存统计] 图片资源: {self.assets.stats()}")
+        self.logger.info(f"[缓存统计] 物品图标: {self.item_icons.stats()}")
+        self.logger.info(f"[出站调度] {self.outbound.stats()}")
+        self.logger.info(f"[指令统计] {self.commands.stats()}")
+        self.logger.info(f"[消息入口] {self.intake.stats()}")
+        self.logger.info(f"[循环监测] {self.watchdog.stats()}")
+        self.watchdog.stop()
+        if self.metrics_server is not None:
+            await self.metrics_server.stop()
+        await self.outbound.shutdown()
+        self.player_manager.stop_watching()
+        self.scheduler.shutdown()
+        self.loudness.shutdown()
+        await self.voice_sessions.shutdown()
         if self._http and not self._http.closed:
             await self._http.close()
+        await self.item_icons.close()
+        self._ff14_pool.shutdown(wait=False)
         if hasattr(self.bot, 'client') and hasattr(self.bot.client, 'close'):
             await self.bot.client.close()
-            # 终止可能存在的FFmpeg进程
-        if self.current_process and self.current_process.poll() is None:
-            try:
-                self.current_process.terminate()
-                await asyncio.wait_for(self.current_process.wait(), timeout=5)
-            except Exception:
-                pass
+        # 终止可能存在的FFmpeg进程
+        loop = asyncio.get_running_loop()
+        for process in list(self.ffmpeg_processes.values()):
+            if process.poll() is None:
+                try:
+                    process.terminate()
+                    await asyncio.wait_for(loop.run_in_executor(None, process.wait), timeout=5)
+                except Exception:
+                    pass
+        self.ffmpeg_processes.clear()
 
 
 async def main():
@@ -1033,6 +1519,7 @@ async def main():
 
 
 if __name__ == "__main__":
+    multiprocessing.freeze_support()  # 打包为 EXE 后头像缩略图进程池需要
     if sys.platform == 'win32':
         asyncio.set_event_loop_policy(asyncio.WindowsSelectorEventLoopPolicy())
     try: